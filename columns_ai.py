@@ -0,0 +1,260 @@
+import columns_game as game
+import concurrent.futures
+import time
+
+# Actions, the same commands the console UI reads
+ROTATE = 'R'
+MOVE_LEFT = '<'
+MOVE_RIGHT = '>'
+
+# Weights of the parts of the score of a settled board
+_CLEAR_WEIGHT = 10.0
+_CASCADE_WEIGHT = 25.0
+_HEIGHT_WEIGHT = 4.0
+_BUMPINESS_WEIGHT = 1.0
+
+# The score of a placement that ends the game
+_GAME_OVER_SCORE = float('-inf')
+
+# The number of settled results that an agent remembers
+_CACHE_SIZE = 4096
+
+# The worker processes settle a placement this many ticks at a time, checking the deadline of the move in between, so
+#   the placements of a move that has run out of time stop soon instead of holding up the workers for the next move
+_SETTLE_STEP = 16
+
+# Translates cell codes into 1 for the cells that hold a frozen jewel (occupied or matched) and 0 for every other cell
+_JEWEL_FLAGS = bytes(1 if code & game._MATCHABLE_BIT else 0 for code in range(256))
+
+
+def apply_actions(state: game.GameState, actions: [str]) -> None:
+    """
+    Performs the given actions on the faller of the given GameState
+    :param state: The GameState whose faller will be moved
+    :param actions: A list of ROTATE, MOVE_LEFT and MOVE_RIGHT actions
+    """
+    for action in actions:
+        if action == ROTATE:
+            state.rotate_faller()
+        elif action == MOVE_LEFT:
+            state.move_faller_side(game.LEFT)
+        elif action == MOVE_RIGHT:
+            state.move_faller_side(game.RIGHT)
+
+
+def find_placements(state: game.GameState) -> [[str]]:
+    """
+    Lists the action sequences of every placement the faller of the given GameState can reach from where it is now:
+    every rotation combined with every column it can slide to. Placements that leave the faller in the same position are
+    only listed once.
+    :param state: The GameState with an active faller
+    :return: A list of action sequences, the shortest sequence for each placement
+    """
+    return [actions for actions, position in _find_placements(state)]
+
+
+def _find_placements(state: game.GameState, deadline: float = None) -> [([str], int)]:
+    """
+    Lists the placements of the faller of the given GameState, like find_placements(), together with the hash of the
+    position each one leads to
+    :param state: The GameState with an active faller
+    :param deadline: The time.time() after which no more placements are listed, or None for no limit
+    :return: A list of tuples of the action sequence of a placement and the hash of its position
+    """
+    if not state.has_faller():
+        return []
+
+    # Rotating does not change which cells the faller is in, so the reachable columns are the same for every rotation
+    steps = {0: []}
+    for direction, action in ((game.LEFT, MOVE_LEFT), (game.RIGHT, MOVE_RIGHT)):
+        probe = state.clone()
+        moves = []
+        while True:
+            before = probe.get_hash()
+            probe.move_faller_side(direction)
+            if probe.get_hash() == before:
+                break
+            moves.append(action)
+            steps[direction * len(moves)] = list(moves)
+
+    placements = []
+    seen = set()
+    for rotations in range(3):
+        for offset in sorted(steps, key=abs):
+            if deadline is not None and time.time() >= deadline:
+                return placements
+            actions = [ROTATE] * rotations + steps[offset]
+            probe = state.clone()
+            apply_actions(probe, actions)
+            position = probe.get_hash()
+            if position not in seen:
+                seen.add(position)
+                placements.append((actions, position))
+    return placements
+
+
+def score_board(state: game.GameState) -> (float, int):
+    """
+    Scores the frozen jewels of a settled board on how safe they are: lower and flatter stacks are better.
+    There are never holes to count, gravity closes every gap under a jewel.
+    :param state: The settled GameState to score
+    :return: A tuple of the score of the board and the number of frozen jewels on it
+    """
+    rows = state.get_rows()
+    columns = state.get_columns()
+    # One pass over the codes of the whole board marks the frozen jewels. The height of a column is found by searching
+    #   its slice for the highest of them
+    flags = state.get_cell_codes().translate(_JEWEL_FLAGS)
+    jewels = flags.count(1)
+    heights = []
+    for col in range(columns):
+        top = flags[col::columns].find(1)
+        heights.append(0 if top < 0 else rows - top)
+
+    bumpiness = 0
+    for col in range(1, len(heights)):
+        bumpiness += abs(heights[col] - heights[col - 1])
+
+    return -(max(heights) * _HEIGHT_WEIGHT) - bumpiness * _BUMPINESS_WEIGHT, jewels
+
+
+def _evaluate(state: game.GameState, actions: [str], jewelsBefore: int, deadline: float = None) -> float:
+    """
+    Plays the given placement on the given GameState until everything settles and scores the result
+    :param state: The GameState to play the placement on. It is changed by this
+    :param actions: The action sequence of the placement
+    :param jewelsBefore: The number of frozen jewels on the board before the placement plus the 3 of the faller
+    :param deadline: The time.time() by which the move needs the score, or None for no limit
+    :return: The score of the placement, or None if the deadline passed before it was scored
+    """
+    apply_actions(state, actions)
+    if deadline is None:
+        gameOver, ticks, cascades = state.settle()
+    else:
+        cascades = 0
+        while True:
+            if time.time() >= deadline:
+                return None
+            gameOver, ticks, matchedTicks = state.advance(_SETTLE_STEP)
+            cascades += matchedTicks
+            if gameOver or (not state.has_faller() and state._is_settled()):
+                break
+    if gameOver:
+        return _GAME_OVER_SCORE
+
+    boardScore, jewels = score_board(state)
+    cleared = jewelsBefore - jewels
+    return cleared * _CLEAR_WEIGHT + cascades * _CASCADE_WEIGHT + boardScore
+
+
+def _evaluate_snapshot(rows: int, columns: int, snapshot: tuple, actions: [str], jewelsBefore: int,
+                       deadline: float) -> float:
+    """
+    Evaluates a placement on a game rebuilt from a snapshot. This is what runs in the worker processes.
+    A placement whose move has run out of time by the time a worker gets to it, or while it is being settled, is given
+    up, so the workers are free again for the next move.
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param snapshot: The snapshot of the game from GameState.snapshot()
+    :param actions: The action sequence of the placement
+    :param jewelsBefore: The number of frozen jewels on the board before the placement plus the 3 of the faller
+    :param deadline: The time.time() by which the move needs the score, or None for no limit
+    :return: The score of the placement, or None if it was given up
+    """
+    if deadline is not None and time.time() >= deadline:
+        return None
+    state = game.GameState(rows, columns)
+    state.restore(snapshot)
+    return _evaluate(state, actions, jewelsBefore, deadline)
+
+
+class PlacementAgent:
+    def __init__(self, workers: int = 0, timeBudget: float = None):
+        """
+        Constructs a new PlacementAgent that picks where to put each faller
+        :param workers: The number of processes that score placements. 0 scores them in this process, which is faster
+        for small boards
+        :param timeBudget: The default number of seconds a move may take, or None for no limit
+        """
+        self._timeBudget = timeBudget
+        self._pool = None
+        if workers > 0:
+            self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        # Scores of placements by the hash of the position they start from
+        self._cache = game.TranspositionTable(_CACHE_SIZE)
+
+    def choose_actions(self, state: game.GameState, timeBudget: float = None) -> [str]:
+        """
+        Finds the best placement for the faller of the given GameState.
+        If the time budget runs out, the best placement scored so far is used.
+        :param state: The GameState with an active faller. It is not changed
+        :param timeBudget: The number of seconds this move may take, or None to use the agent's default
+        :return: The action sequence of the best placement, empty if there is no faller or nothing was scored in time
+        """
+        if timeBudget is None:
+            timeBudget = self._timeBudget
+        # The deadline is on the clock that every process shares, since the workers are other processes
+        deadline = None if timeBudget is None else time.time() + timeBudget
+
+        placements = _find_placements(state, deadline)
+        # The 3 jewels of the faller are on the board once it freezes
+        jewelsBefore = score_board(state)[1] + 3
+        scores = {}
+
+        # Placements that were scored before do not need to be played again
+        pending = []
+        for index, (actions, position) in enumerate(placements):
+            score = self._cache.get(position)
+            if score is None:
+                pending.append(index)
+            else:
+                scores[index] = score
+
+        if self._pool is None:
+            for index in pending:
+                actions, position = placements[index]
+                score = _evaluate(state.clone(), actions, jewelsBefore, deadline)
+                if score is None:
+                    break
+                scores[index] = score
+                self._cache.put(position, score)
+        else:
+            snapshot = state.snapshot()
+            futures = {}
+            for index in pending:
+                future = self._pool.submit(_evaluate_snapshot, state.get_rows(), state.get_columns(), snapshot,
+                                           placements[index][0], jewelsBefore, deadline)
+                futures[future] = index
+
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            done, notDone = concurrent.futures.wait(futures, timeout=timeout)
+            # The ones that already started stop on their own at the deadline
+            for future in notDone:
+                future.cancel()
+            for future in done:
+                score = future.result()
+                if score is None:
+                    continue
+                index = futures[future]
+                scores[index] = score
+                self._cache.put(placements[index][1], score)
+
+        if not scores:
+            return []
+        # The highest score wins, and of equal scores the placement with the fewest actions
+        best = max(scores, key=lambda index: (scores[index], -len(placements[index][0]), -index))
+        return placements[best][0]
+
+    def close(self) -> None:
+        """
+        Shuts down the worker processes of this agent
+        """
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def __enter__(self) -> 'PlacementAgent':
+        return self
+
+    def __exit__(self, excType, excValue, traceback) -> None:
+        self.close()
@@ -0,0 +1,441 @@
+import argparse
+import columns_game as game
+import numpy
+import random
+import sys
+
+# The codes used in the batched boards are the same packed cell codes that columns_game stores, so a board can be
+#   compared with a GameState cell for cell
+_STATE_BITS = game._STATE_BITS
+_STATE_MASK = game._STATE_MASK
+_EMPTY_CELL_CODE = game._EMPTY_CELL_CODE
+_FALLER_MOVING_CODE = game._FALLER_MOVING_CODE
+_FALLER_STOPPED_CODE = game._FALLER_STOPPED_CODE
+_OCCUPIED_CODE = game._OCCUPIED_CODE
+_MATCHED_CODE = game._MATCHED_CODE
+_MATCHABLE_BIT = game._MATCHABLE_BIT
+_JEWEL_MASK = 0xFF ^ _STATE_MASK
+
+
+def _encode_jewels(jewels) -> numpy.ndarray:
+    """
+    Converts jewel strings into an array of jewel codes with the same shape
+    :param jewels: A nested sequence (or array) of jewel strings
+    :return: A numpy array of jewel codes with the same shape as the given jewels
+    """
+    jewels = numpy.asarray(jewels, dtype=object)
+    codes = game._jewel_codes(jewels.ravel())
+    return numpy.array(codes, dtype=numpy.uint8).reshape(jewels.shape)
+
+
+class BatchGameState:
+    """
+    Steps many independent games of Columns at the same time.
+    All the boards are held in one (count, rows, columns) array of cell codes and every operation takes one action per
+    board, so a whole batch moves forward with a handful of array operations. The rules are exactly the rules of
+    columns_game.GameState.
+    """
+
+    def __init__(self, count: int, rows: int, columns: int):
+        """
+        Constructs a new BatchGameState of the given number of empty boards that are the given rows x the given columns
+        :param count: The number of boards in the batch
+        :param rows: The number of rows that each board will have
+        :param columns: The number of columns that each board will have
+        """
+        self._count = count
+        self._rows = rows
+        self._columns = columns
+        self._board = numpy.zeros((count, rows, columns), dtype=numpy.uint8)
+
+        # The fallers of all the boards. The row is the row of the bottom block of the faller. Like in GameState the
+        #   fallers are kept apart from the boards and only written into them when they freeze
+        self._fallerActive = numpy.zeros(count, dtype=bool)
+        self._fallerStopped = numpy.zeros(count, dtype=bool)
+        self._fallerRow = numpy.zeros(count, dtype=numpy.int64)
+        self._fallerCol = numpy.zeros(count, dtype=numpy.int64)
+        self._fallerContents = numpy.zeros((count, 3), dtype=numpy.uint8)
+
+        # Used to index a single row/column out of every board at once
+        self._rowIndex = numpy.arange(rows).reshape(1, rows, 1)
+
+    def get_count(self) -> int:
+        """
+        Gets the number of boards in this batch
+        :return: An int that represents the number of boards in this batch
+        """
+        return self._count
+
+    def get_rows(self) -> int:
+        """
+        Gets the number of rows in each board of this batch
+        :return: An int that represents the number of rows in each board
+        """
+        return self._rows
+
+    def get_columns(self) -> int:
+        """
+        Gets the number of columns in each board of this batch
+        :return: An int that represents the number of columns in each board
+        """
+        return self._columns
+
+    def get_cell_state(self, board: int, row: int, col: int) -> str:
+        """
+        Gets the state of the cell identified by the given board, row and column
+        :param board: The index of the board in the batch
+        :param row: The row of the cell to get the state for
+        :param col: The column of the cell to get the state for
+        :return: The state of the cell, one of the cell states of columns_game
+        """
+        return game._STATE_NAMES[self._visible_code(board, row, col) & _STATE_MASK]
+
+    def get_cell_contents(self, board: int, row: int, col: int) -> str:
+        """
+        Gets the content of the cell identified by the given board, row and column
+        :param board: The index of the board in the batch
+        :param row: The row of the cell to get the content for
+        :param col: The column of the cell to get the content for
+        :return: The content of the cell, one of the jewels of columns_game or EMPTY
+        """
+        return game._JEWEL_NAMES[self._visible_code(board, row, col) >> _STATE_BITS]
+
+    def get_cells(self) -> numpy.ndarray:
+        """
+        Gets a copy of the packed cell codes of every board, with the fallers written into them
+        :return: A (count, rows, columns) array of cell codes
+        """
+        cells = self._board.copy()
+        boards = numpy.flatnonzero(self._fallerActive)
+        rows = self._fallerRow[boards]
+        cols = self._fallerCol[boards]
+        states = numpy.where(self._fallerStopped[boards], _FALLER_STOPPED_CODE, _FALLER_MOVING_CODE).astype(numpy.uint8)
+        for i in range(3):
+            inPlay = rows - i >= 0
+            cells[boards[inPlay], rows[inPlay] - i, cols[inPlay]] = \
+                (self._fallerContents[boards[inPlay], i] << _STATE_BITS) | states[inPlay]
+        return cells
+
+    def _visible_code(self, board: int, row: int, col: int) -> int:
+        """
+        Gets the packed code of the given cell as it is seen from outside, with the faller of the board on top
+        :param board: The index of the board in the batch
+        :param row: The row of the cell
+        :param col: The column of the cell
+        :return: An int that is the packed code of the faller cell there, or of the board cell if the faller does not
+        cover it
+        """
+        i = int(self._fallerRow[board]) - row
+        if self._fallerActive[board] and col == self._fallerCol[board] and 0 <= i < 3:
+            state = _FALLER_STOPPED_CODE if self._fallerStopped[board] else _FALLER_MOVING_CODE
+            return (int(self._fallerContents[board, i]) << _STATE_BITS) | state
+        return int(self._board[board, row, col])
+
+    def has_faller(self) -> numpy.ndarray:
+        """
+        Returns which boards of this batch have a faller that is currently active (falling or stopped but not frozen)
+        :return: A boolean array with one value per board
+        """
+        return self._fallerActive.copy()
+
+    def set_game_state(self, board: int, state: game.GameState) -> None:
+        """
+        Copies the board and the faller of the given GameState into the given board of this batch
+        :param board: The index of the board in the batch that will be overwritten
+        :param state: The GameState to copy. It must have the same number of rows and columns as this batch
+        """
+        if state.get_rows() != self._rows or state.get_columns() != self._columns:
+            raise ValueError('The GameState does not have the same size as the boards of this batch')
+
+        self._board[board] = numpy.frombuffer(bytes(state._cells), dtype=numpy.uint8).reshape(self._rows,
+                                                                                                 self._columns)
+        faller = state._faller
+        self._fallerActive[board] = faller.active
+        self._fallerStopped[board] = faller.state == game._FALLER_STOPPED
+        self._fallerRow[board] = faller.get_row()
+        self._fallerCol[board] = faller.get_col()
+        self._fallerContents[board] = faller.contents
+
+    def set_board_contents(self, contents) -> None:
+        """
+        Sets the contents of every board to the given contents, then applies gravity and attempts matching
+        :param contents: One board per batch entry, each a list of rows from top to bottom where each row is a list that
+        represents each cell in that row
+        """
+        jewels = _encode_jewels(contents)
+        if jewels.shape != self._board.shape:
+            raise ValueError('The contents do not have one board of the right size per batch entry')
+
+        empty = game._jewel_code(game.EMPTY)
+        self._board[:] = numpy.where(jewels == empty, _EMPTY_CELL_CODE, (jewels << _STATE_BITS) | _OCCUPIED_CODE)
+
+        self._gem_gravity()
+        self._matching()
+
+    def tick(self) -> numpy.ndarray:
+        """
+        Ticks one time unit on every game. This causes fallers to move down and/or matching to occur
+        :return: A boolean array with one value per board that is True if that game is over from a faller freezing out
+        of bounds
+        """
+        gameOver = numpy.zeros(self._count, dtype=bool)
+        active = self._fallerActive.copy()
+
+        # Fallers that had stopped last tick are checked again, and the ones that are still on solid ground freeze
+        stopped = numpy.flatnonzero(active & self._fallerStopped)
+        self._update_faller_state(stopped)
+        frozen = stopped[self._fallerStopped[stopped]]
+
+        rows = self._fallerRow[frozen]
+        cols = self._fallerCol[frozen]
+        # The game ends if part of the faller was frozen above the top of the game board
+        gameOver[frozen] = rows - 2 < 0
+        for i in range(3):
+            inPlay = rows - i >= 0
+            self._board[frozen[inPlay], rows[inPlay] - i, cols[inPlay]] = \
+                (self._fallerContents[frozen[inPlay], i] << _STATE_BITS) | _OCCUPIED_CODE
+        self._fallerActive[frozen] = False
+
+        # Every other faller isnt on solid ground for sure so it moves down
+        active[frozen] = False
+        moving = numpy.flatnonzero(active)
+        self._move_faller_down(moving)
+        self._update_faller_state(moving)
+
+        # Handle matching and gem gravity
+        self._matching()
+        return gameOver
+
+    def spawn_faller(self, columns, fallers) -> None:
+        """
+        Spawns a faller on every board that is given a column and does not already have an active faller
+        :param columns: One column number (1,n) per board where its faller will spawn. A 0 means no faller is spawned
+        :param fallers: One faller per board, each 3 jewels where faller[0] is the first block of the faller to be visible
+        """
+        columns = numpy.asarray(columns, dtype=numpy.int64)
+        if numpy.any((columns < 0) | (columns > self._columns)):
+            raise ValueError('A column is not on the board')
+
+        boards = numpy.flatnonzero((columns > 0) & ~self._fallerActive)
+        contents = _encode_jewels(fallers)[boards]
+
+        self._fallerActive[boards] = True
+        self._fallerContents[boards] = contents
+        self._fallerRow[boards] = 0
+        self._fallerCol[boards] = columns[boards] - 1
+
+        # Check if the ground immediately under the faller is solid and if it is then update the fallers state
+        self._update_faller_state(boards)
+
+    def rotate_faller(self, rotate) -> None:
+        """
+        Rotates the fallers of the given boards so the first block becomes the last, the middle becomes the first, and
+        the top becomes the middle
+        :param rotate: One boolean per board that is True if the faller on that board should rotate
+        """
+        boards = numpy.flatnonzero(numpy.asarray(rotate, dtype=bool) & self._fallerActive)
+        self._fallerContents[boards] = self._fallerContents[boards][:, [1, 2, 0]]
+        self._update_faller_state(boards)
+
+    def move_faller_side(self, directions) -> None:
+        """
+        Moves the fallers of the boards in the given directions if those directions are not blocked
+        :param directions: One direction per board (LEFT, RIGHT or 0 to stay in place)
+        """
+        directions = numpy.asarray(directions, dtype=numpy.int64)
+        boards = numpy.flatnonzero(self._fallerActive & ((directions == game.LEFT) | (directions == game.RIGHT)))
+        targets = self._fallerCol[boards] + directions[boards]
+
+        # They can't move passed the leftmost or rightmost column
+        onBoard = (targets >= 0) & (targets < self._columns)
+        boards = boards[onBoard]
+        targets = targets[onBoard]
+
+        # They can't move into a column where a frozen or matched jewel is beside any part of the faller that is in play
+        rows = self._fallerRow[boards]
+        blocked = numpy.zeros(len(boards), dtype=bool)
+        for i in range(3):
+            inPlay = rows - i >= 0
+            codes = self._board[boards[inPlay], rows[inPlay] - i, targets[inPlay]]
+            blocked[inPlay] |= codes != _EMPTY_CELL_CODE
+        boards = boards[~blocked]
+        targets = targets[~blocked]
+
+        self._fallerCol[boards] = targets
+        self._update_faller_state(boards)
+
+    def _update_faller_state(self, boards: numpy.ndarray) -> None:
+        """
+        Updates the state of the fallers of the given boards according to their current conditions.
+        If a faller has ground below it then it is stopped, otherwise it is moving.
+        :param boards: The indices of the boards whose fallers will be updated
+        """
+        self._fallerStopped[boards] = self._is_solid(boards, self._fallerRow[boards] + 1, self._fallerCol[boards])
+
+    def _is_solid(self, boards: numpy.ndarray, rows: numpy.ndarray, cols: numpy.ndarray) -> numpy.ndarray:
+        """
+        Checks which of the given cells are solid (a solid block or below the bottom row)
+        :param boards: The board index of each cell to check
+        :param rows: The row of each cell to check
+        :param cols: The column of each cell to check
+        :return: A boolean array that is True for every given cell that is solid
+        """
+        solid = rows >= self._rows
+        inside = ~solid
+        codes = self._board[boards[inside], rows[inside], cols[inside]]
+        solid[inside] = (codes & _STATE_MASK) == _OCCUPIED_CODE
+        return solid
+
+    def _move_faller_down(self, boards: numpy.ndarray) -> None:
+        """
+        Moves the fallers of the given boards down one space if they are not on solid ground
+        :param boards: The indices of the boards whose fallers will move
+        """
+        boards = boards[~self._is_solid(boards, self._fallerRow[boards] + 1, self._fallerCol[boards])]
+        self._fallerRow[boards] += 1
+
+    def _matching(self) -> None:
+        """
+        Ticks the matching state on every board.
+        Cells that are already marked as matching are destroyed and gravity is applied to all cells.
+        After that all cells are compared for matching on the X, Y, and both diagonal axes.
+        """
+        board = self._board
+        board[(board & _STATE_MASK) == _MATCHED_CODE] = _EMPTY_CELL_CODE
+        self._gem_gravity()
+        self._mark_matches()
+
+    def _gem_gravity(self) -> None:
+        """
+        Applies gem gravity to all frozen cells of every board so each column is compacted onto the bottom of the board
+        """
+        board = self._board
+        frozen = (board & _STATE_MASK) == _OCCUPIED_CODE
+
+        # A stable sort of each column on whether the cell is frozen brings the frozen jewels to the bottom in order
+        order = numpy.argsort(frozen, axis=1, kind='stable')
+        fallen = numpy.take_along_axis(board, order, axis=1)
+        inStack = self._rowIndex >= self._rows - frozen.sum(axis=1, keepdims=True)
+
+        # Above the stack every jewel has left its cell
+        left = numpy.where(frozen, _EMPTY_CELL_CODE, board)
+
+        board[:] = numpy.where(inStack, fallen, left)
+
+    def _mark_matches(self) -> None:
+        """
+        Marks every cell of every board that is part of 3 or more matching jewels in a row on the X, Y or diagonal axes.
+        A cell is part of such a run exactly when it is part of some window of 3 matching cells along that axis.
+        """
+        board = self._board
+        # Cells that can not be matched get a key that no jewel has
+        keys = numpy.where((board & _MATCHABLE_BIT) != 0, (board >> _STATE_BITS).astype(numpy.int16), -1)
+        marked = numpy.zeros(board.shape, dtype=bool)
+
+        rows = self._rows
+        cols = self._columns
+        # Each window is given as the slices of its three cells: along a row, along a column, up and to the right, and
+        #   down and to the right
+        windows = (
+            ((slice(None), slice(0, cols - 2)), (slice(None), slice(1, cols - 1)), (slice(None), slice(2, cols))),
+            ((slice(0, rows - 2), slice(None)), (slice(1, rows - 1), slice(None)), (slice(2, rows), slice(None))),
+            ((slice(2, rows), slice(0, cols - 2)), (slice(1, rows - 1), slice(1, cols - 1)),
+             (slice(0, rows - 2), slice(2, cols))),
+            ((slice(0, rows - 2), slice(0, cols - 2)), (slice(1, rows - 1), slice(1, cols - 1)),
+             (slice(2, rows), slice(2, cols))),
+        )
+        for first, second, third in windows:
+            a = keys[:, first[0], first[1]]
+            b = keys[:, second[0], second[1]]
+            c = keys[:, third[0], third[1]]
+            match = (a >= 0) & (a == b) & (b == c)
+            marked[:, first[0], first[1]] |= match
+            marked[:, second[0], second[1]] |= match
+            marked[:, third[0], third[1]] |= match
+
+        board[marked] = (board[marked] & _JEWEL_MASK) | _MATCHED_CODE
+
+
+# The jewels the parity check plays with, few enough that matches happen often
+_PARITY_JEWELS = [game.S, game.T, game.V, game.W]
+
+
+def check_parity(seed: int, count: int = 8, steps: int = 300) -> str:
+    """
+    Plays the same random actions on a BatchGameState and on one GameState per board, and compares every cell of every
+    board after every action. The board size, the starting contents and the actions all come from the seed.
+    :param seed: The seed of the random game
+    :param count: The number of boards in the batch
+    :param steps: The number of actions to play
+    :return: A description of the first difference that was found, or None if the batch played exactly like GameState
+    """
+    rng = random.Random(seed)
+    rows, columns = rng.randint(1, 12), rng.randint(1, 7)
+    jewels = _PARITY_JEWELS[:rng.randint(2, len(_PARITY_JEWELS))]
+    states = [game.GameState(rows, columns) for board in range(count)]
+    batch = BatchGameState(count, rows, columns)
+    if rng.random() < 0.6:
+        contents = [[[rng.choice(jewels + [game.EMPTY] * 3) for col in range(columns)] for row in range(rows)]
+                    for board in range(count)]
+        for state, boardContents in zip(states, contents):
+            state.set_board_contents(boardContents)
+        batch.set_board_contents(contents)
+
+    for step in range(steps):
+        action = rng.random()
+        if action < 0.4:
+            gameOver = batch.tick()
+            for board, state in enumerate(states):
+                if state.tick() != gameOver[board]:
+                    return 'Board {} disagrees on the game being over at step {}'.format(board, step)
+        elif action < 0.55:
+            rotate = [rng.random() < 0.5 for board in range(count)]
+            batch.rotate_faller(rotate)
+            for state, boardRotates in zip(states, rotate):
+                if boardRotates:
+                    state.rotate_faller()
+        elif action < 0.8:
+            directions = [rng.choice([game.LEFT, 0, game.RIGHT]) for board in range(count)]
+            batch.move_faller_side(directions)
+            for state, direction in zip(states, directions):
+                if direction != 0:
+                    state.move_faller_side(direction)
+        else:
+            spawnColumns = [rng.randint(0, columns) for board in range(count)]
+            fallers = [[rng.choice(jewels) for i in range(3)] for board in range(count)]
+            batch.spawn_faller(spawnColumns, fallers)
+            for state, column, faller in zip(states, spawnColumns, fallers):
+                if column > 0:
+                    state.spawn_faller(column, faller)
+
+        cells = batch.get_cells()
+        hasFaller = batch.has_faller()
+        for board, state in enumerate(states):
+            if cells[board].tobytes() != state.get_cell_codes():
+                return 'Board {} has different cells at step {}'.format(board, step)
+            if hasFaller[board] != state.has_faller():
+                return 'Board {} disagrees on having a faller at step {}'.format(board, step)
+    return None
+
+
+def start_parity_check() -> None:
+    """
+    Runs the parity check with the options given on the command line and prints the first difference found
+    """
+    parser = argparse.ArgumentParser(description='Checks that BatchGameState plays exactly like GameState')
+    parser.add_argument('--seeds', type=int, default=300, help='the number of random games to play')
+    parser.add_argument('--boards', type=int, default=8, help='the number of boards in every batch')
+    parser.add_argument('--steps', type=int, default=300, help='the number of actions in every game')
+    arguments = parser.parse_args()
+
+    for seed in range(arguments.seeds):
+        difference = check_parity(seed, arguments.boards, arguments.steps)
+        if difference is not None:
+            print('Seed ' + str(seed) + ': ' + difference)
+            sys.exit(1)
+    print(str(arguments.seeds) + ' games of ' + str(arguments.boards) + ' boards played exactly like GameState')
+
+
+# This makes it so this module is executable
+if __name__ == '__main__':
+    start_parity_check()
@@ -0,0 +1,468 @@
+import argparse
+import columns_game as game
+import columns_util as util
+import json
+import platform
+import random
+import sys
+import time
+
+# The board sizes (rows, columns) that are benchmarked
+_SIZES = [(13, 6), (50, 25), (100, 50), (200, 100), (400, 300)]
+
+# Every workload takes samples until it has used this many seconds, but always takes at least the minimum number
+_TIME_BUDGET = 0.5
+_MIN_SAMPLES = 3
+_MAX_SAMPLES = 5000
+
+# The number of faller moves and rotations timed together as one sample of the spam workload
+_SPAM_BATCH = 64
+
+# Operations that are too quick to time one at a time are repeated back to back until a sample takes at least this long,
+#   so the resolution and overhead of the clock do not decide the result
+_MIN_SAMPLE_NS = 200000
+_MAX_REPEAT = 1 << 16
+
+# A workload that gets slower than its baseline by more than this fraction is a regression. A workload whose samples
+#   spread out more than that (the interquartile range as a fraction of the median, in either run) is only a regression
+#   if it gets slower by more than its spread times this factor, so a noisy workload does not fail the comparison
+_DEFAULT_THRESHOLD = 0.10
+_SPREAD_FACTOR = 1.0
+
+# A workload that looks like a regression is run again up to this many times and its fastest run is kept, since a busy
+#   machine can slow down a single workload for a moment
+_RECHECKS = 2
+
+# The version of the results file
+_RESULTS_VERSION = 2
+
+# The fraction of cells filled on a sparse board, and the fraction of rows emptied before the gravity workload
+_SPARSE_FILL = 0.15
+_CLEARED_ROWS = 0.5
+
+_JEWELS = ['S', 'T', 'V', 'W', 'X', 'Y', 'Z']
+
+
+def _random_contents(rows: int, columns: int, seed: int) -> [[str]]:
+    """
+    Creates the contents of a completely filled board with random jewels
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the random jewels, so the same board is created every run
+    :return: A list of rows from top of the board to bottom where each row is a list of jewels
+    """
+    rng = random.Random(seed)
+    return [[rng.choice(_JEWELS) for col in range(columns)] for row in range(rows)]
+
+
+def _matchless_contents(rows: int, columns: int, seed: int) -> [[str]]:
+    """
+    Creates the contents of a completely filled board with random jewels where no 3 jewels in a row match in any direction
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the random jewels, so the same board is created every run
+    :return: A list of rows from top of the board to bottom where each row is a list of jewels
+    """
+    rng = random.Random(seed)
+    contents = [[None] * columns for row in range(rows)]
+    for row in range(rows):
+        for col in range(columns):
+            banned = set()
+            # The two cells before this one along each direction that was already filled
+            for rowStep, colStep in ((0, -1), (-1, 0), (-1, -1), (-1, 1)):
+                firstRow, firstCol = row + rowStep, col + colStep
+                secondRow, secondCol = row + 2 * rowStep, col + 2 * colStep
+                if 0 <= secondRow and 0 <= secondCol < columns and 0 <= firstCol < columns:
+                    if contents[firstRow][firstCol] == contents[secondRow][secondCol]:
+                        banned.add(contents[firstRow][firstCol])
+            contents[row][col] = rng.choice([jewel for jewel in _JEWELS if jewel not in banned])
+    return contents
+
+
+def _sparse_contents(rows: int, columns: int, seed: int) -> [[str]]:
+    """
+    Creates the contents of a board where only a few random cells hold a jewel
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the random jewels, so the same board is created every run
+    :return: A list of rows from top of the board to bottom where each row is a list of jewels
+    """
+    rng = random.Random(seed)
+    return [[rng.choice(_JEWELS) if rng.random() < _SPARSE_FILL else game.EMPTY for col in range(columns)]
+            for row in range(rows)]
+
+
+def _settled_state(contents: [[str]]) -> game.GameState:
+    """
+    Creates a GameState with the given contents and ticks it until every match has been cleared
+    :param contents: The contents of the board
+    :return: The settled GameState
+    """
+    state = game.GameState(len(contents), len(contents[0]))
+    state.set_board_contents(contents)
+    state.settle()
+    return state
+
+
+def _spawn_column(state: game.GameState) -> int:
+    """
+    Finds the column (1,n) with the most empty rows, where a faller has the most room to fall
+    :param state: The GameState to look at
+    :return: The column number
+    """
+    def empty_rows(col: int) -> int:
+        row = 0
+        while row < state.get_rows() and state.get_cell_state(row, col) == game.EMPTY_CELL:
+            row += 1
+        return row
+
+    return max(range(state.get_columns()), key=empty_rows) + 1
+
+
+def _setup_tick_idle(rows: int, columns: int, seed: int) -> (callable, callable):
+    """
+    Builds the workload that ticks a settled sparse board without a faller
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the board and actions
+    :return: A tuple of the function that prepares a sample (or None) and the function that is timed
+    """
+    state = _settled_state(_sparse_contents(rows, columns, seed))
+    return None, state.tick
+
+
+def _setup_tick_faller(rows: int, columns: int, seed: int) -> (callable, callable):
+    """
+    Builds the workload that ticks a settled sparse board while a faller falls down it
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the board and actions
+    :return: A tuple of the function that prepares a sample (or None) and the function that is timed
+    """
+    state = _settled_state(_sparse_contents(rows, columns, seed))
+    state.spawn_faller(_spawn_column(state), ['S', 'T', 'V'])
+    snapshot = state.snapshot()
+
+    def tick_faller() -> None:
+        # Start over once the faller has frozen, so every tick has a live faller. This is part of the timed work so
+        #   that the ticks can be repeated back to back
+        if not state.has_faller():
+            state.restore(snapshot)
+        state.tick()
+
+    return None, tick_faller
+
+
+def _setup_matching(contents: [[str]]) -> (callable, callable):
+    """
+    Builds a workload that runs a full matching pass (every line scanned) on the given board after it settled
+    :param contents: The contents of the board
+    :return: A tuple of the function that prepares a sample (or None) and the function that is timed
+    """
+    state = _settled_state(contents)
+    snapshot = state.snapshot()
+
+    def prepare() -> None:
+        state.restore(snapshot)
+        state._mark_all_dirty()
+
+    return prepare, state._matching
+
+
+def _setup_matching_sparse(rows: int, columns: int, seed: int) -> (callable, callable):
+    """
+    Builds the workload that runs a full matching pass on a sparse board
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the board and actions
+    :return: A tuple of the function that prepares a sample (or None) and the function that is timed
+    """
+    return _setup_matching(_sparse_contents(rows, columns, seed))
+
+
+def _setup_matching_dense(rows: int, columns: int, seed: int) -> (callable, callable):
+    """
+    Builds the workload that runs a full matching pass on a full board without any matches
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the board and actions
+    :return: A tuple of the function that prepares a sample (or None) and the function that is timed
+    """
+    return _setup_matching(_matchless_contents(rows, columns, seed))
+
+
+def _setup_matching_cascade(rows: int, columns: int, seed: int) -> (callable, callable):
+    """
+    Builds the workload that resolves a full random board: every match and every chain of matches after it
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the board and actions
+    :return: A tuple of the function that prepares a sample (or None) and the function that is timed
+    """
+    # A random full board is full of matches, and clearing them sets off chains of more matches until it settles
+    state = game.GameState(rows, columns)
+    state.set_board_contents(_random_contents(rows, columns, seed))
+    snapshot = state.snapshot()
+
+    def prepare() -> None:
+        state.restore(snapshot)
+
+    return prepare, state.settle
+
+
+def _setup_gravity(rows: int, columns: int, seed: int) -> (callable, callable):
+    """
+    Builds the workload that applies gravity to a full board whose lower half was just cleared
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the board and actions
+    :return: A tuple of the function that prepares a sample (or None) and the function that is timed
+    """
+    # A full board whose lower half was just cleared, so every jewel above it falls
+    state = game.GameState(rows, columns)
+    state.set_board_contents(_matchless_contents(rows, columns, seed))
+    clearedRows = max(1, int(rows * _CLEARED_ROWS))
+    for row in range(rows - clearedRows, rows):
+        for col in range(columns):
+            state._set_cell(row, col, game._EMPTY_CELL_CODE)
+    snapshot = state.snapshot()
+
+    def prepare() -> None:
+        state.restore(snapshot)
+
+    return prepare, state._gem_gravity
+
+
+def _setup_set_contents(rows: int, columns: int, seed: int) -> (callable, callable):
+    """
+    Builds the workload that sets the contents of an empty board to a full board
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the board and actions
+    :return: A tuple of the function that prepares a sample (or None) and the function that is timed
+    """
+    contents = _matchless_contents(rows, columns, seed)
+    state = game.GameState(rows, columns)
+    snapshot = state.snapshot()
+
+    def prepare() -> None:
+        state.restore(snapshot)
+
+    return prepare, lambda: state.set_board_contents(contents)
+
+
+def _setup_faller_spam(rows: int, columns: int, seed: int) -> (callable, callable):
+    """
+    Builds the workload that moves and rotates a faller as fast as it can
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :param seed: The seed of the board and actions
+    :return: A tuple of the function that prepares a sample (or None) and the function that is timed
+    """
+    state = _settled_state(_sparse_contents(rows, columns, seed))
+    state.spawn_faller(_spawn_column(state), ['S', 'T', 'V'])
+    rng = random.Random(seed)
+    actions = [rng.choice((game.LEFT, game.RIGHT, None)) for i in range(_SPAM_BATCH)]
+
+    def spam() -> None:
+        for action in actions:
+            if action is None:
+                state.rotate_faller()
+            else:
+                state.move_faller_side(action)
+
+    return None, spam
+
+
+# Every workload: its name, the function that builds it, and how many operations one sample performs
+_WORKLOADS = [
+    ('tick_idle', _setup_tick_idle, 1),
+    ('tick_faller', _setup_tick_faller, 1),
+    ('matching_sparse', _setup_matching_sparse, 1),
+    ('matching_dense', _setup_matching_dense, 1),
+    ('matching_cascade', _setup_matching_cascade, 1),
+    ('gravity_after_clear', _setup_gravity, 1),
+    ('set_board_contents', _setup_set_contents, 1),
+    ('faller_spam', _setup_faller_spam, _SPAM_BATCH),
+]
+
+
+def run_workload(name: str, rows: int, columns: int) -> dict:
+    """
+    Runs one workload on a board of the given size. The boards and actions are seeded, so every sample of every run does
+    the same work. Every sample is timed on its own, without the work that prepares it. A workload that needs no
+    preparing repeats its operation within a sample until the sample is long enough to time well.
+    :param name: The name of the workload
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :return: A dict of the results: ops per second, the latency percentiles of one operation in microseconds and the
+    spread of the samples (their interquartile range as a fraction of the median)
+    """
+    for workloadName, setup, opsPerSample in _WORKLOADS:
+        if workloadName == name:
+            break
+    else:
+        raise ValueError('There is no workload named ' + name)
+
+    seed = rows * 100003 + columns
+    prepare, operation = setup(rows, columns, seed)
+
+    clock = time.perf_counter_ns
+    repeat = 1
+    if prepare is None:
+        # Double the repeats until one sample takes long enough, which also warms up the workload
+        while repeat < _MAX_REPEAT:
+            start = clock()
+            for i in range(repeat):
+                operation()
+            if clock() - start >= _MIN_SAMPLE_NS:
+                break
+            repeat *= 2
+    opsPerSample *= repeat
+
+    deadline = clock() + int(_TIME_BUDGET * 1e9)
+    latencies = []
+    while len(latencies) < _MAX_SAMPLES and (len(latencies) < _MIN_SAMPLES or clock() < deadline):
+        if prepare is not None:
+            prepare()
+        start = clock()
+        for i in range(repeat):
+            operation()
+        latencies.append((clock() - start) / opsPerSample)
+
+    samples = len(latencies)
+
+    total = sum(latencies) * opsPerSample
+    latencies.sort()
+    median = util.percentile(latencies, 0.50)
+    return {
+        'workload': name,
+        'rows': rows,
+        'columns': columns,
+        'samples': samples,
+        'ops': samples * opsPerSample,
+        'ops_per_sec': samples * opsPerSample / (total / 1e9) if total > 0 else float('inf'),
+        'p50_us': median / 1000,
+        'p90_us': util.percentile(latencies, 0.90) / 1000,
+        'p99_us': util.percentile(latencies, 0.99) / 1000,
+        'max_us': latencies[-1] / 1000,
+        'spread': (util.percentile(latencies, 0.75) - util.percentile(latencies, 0.25)) / median if median > 0 else 0.0,
+    }
+
+
+def run_suite(sizes: [(int, int)] = None, workloads: [str] = None) -> dict:
+    """
+    Runs the workloads on boards of the given sizes
+    :param sizes: The (rows, columns) of the boards, or None for every benchmarked size
+    :param workloads: The names of the workloads to run, or None for all of them
+    :return: A dict of the results that can be saved as JSON and compared with compare_results()
+    """
+    if sizes is None:
+        sizes = _SIZES
+    if workloads is None:
+        workloads = [name for name, setup, opsPerSample in _WORKLOADS]
+
+    results = []
+    for name in workloads:
+        for rows, columns in sizes:
+            results.append(run_workload(name, rows, columns))
+    return {
+        'version': _RESULTS_VERSION,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = _DEFAULT_THRESHOLD) -> [(dict, float, bool)]:
+    """
+    Compares the results of a run with the saved results of an earlier run. The median latencies are compared, since
+    they are much less affected by a noisy machine than the mean. A workload whose samples spread out more than the
+    threshold in either run has to lose more than its spread before it counts as a regression.
+    :param baseline: The results of the earlier run
+    :param current: The results of this run
+    :param threshold: The fraction of speed a workload may lose before it counts as a regression
+    :return: A list of (result of this run, speed relative to the baseline, is a regression) for every result that is in
+    both runs
+    """
+    baselineResults = {(result['workload'], result['rows'], result['columns']): result
+                       for result in baseline['results']}
+    comparisons = []
+    for result in current['results']:
+        old = baselineResults.get((result['workload'], result['rows'], result['columns']))
+        if old is None:
+            continue
+        ratio = old['p50_us'] / result['p50_us'] if result['p50_us'] > 0 else float('inf')
+        # Results saved before the spread was measured count as not spread out at all
+        spread = max(old.get('spread', 0.0), result['spread']) * _SPREAD_FACTOR
+        comparisons.append((result, ratio, ratio < 1.0 - max(threshold, spread)))
+    return comparisons
+
+
+def recheck_regressions(baseline: dict, current: dict, threshold: float = _DEFAULT_THRESHOLD) -> None:
+    """
+    Runs every workload that looks like a regression again, keeping whichever run of it is the fastest compared with
+    the baseline, so a workload the machine slowed down for a moment does not count as a regression
+    :param baseline: The results of the earlier run
+    :param current: The results of this run, whose results are replaced by the faster runs
+    :param threshold: The fraction of speed a workload may lose before it counts as a regression
+    """
+    results = current['results']
+    for recheck in range(_RECHECKS):
+        suspects = [result for result, ratio, regression in compare_results(baseline, current, threshold) if regression]
+        if not suspects:
+            return
+        for result in suspects:
+            rerun = run_workload(result['workload'], result['rows'], result['columns'])
+            if rerun['p50_us'] < result['p50_us']:
+                results[results.index(result)] = rerun
+
+
+def start_benchmark() -> None:
+    """
+    Runs the benchmark suite, prints the results in the console and saves or compares them if asked to
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks the Columns game engine')
+    parser.add_argument('--output', metavar='PATH', help='save the results as JSON in the given file')
+    parser.add_argument('--compare', metavar='PATH', help='compare the results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=_DEFAULT_THRESHOLD,
+                        help='the fraction of speed a workload may lose before it is a regression')
+    parser.add_argument('--sizes', type=util.parse_size, nargs='+', metavar='ROWSxCOLUMNS',
+                        help='the board sizes to run')
+    parser.add_argument('--workloads', nargs='+', choices=[name for name, setup, opsPerSample in _WORKLOADS],
+                        help='the workloads to run')
+    arguments = parser.parse_args()
+
+    results = run_suite(arguments.sizes, arguments.workloads)
+    baseline = None
+    if arguments.compare is not None:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+        recheck_regressions(baseline, results, arguments.threshold)
+
+    for result in results['results']:
+        print('{:<20} {:>4}x{:<4} {:>12.0f} ops/s  p50 {:>10.1f} us  p99 {:>10.1f} us'.format(
+            result['workload'], result['rows'], result['columns'], result['ops_per_sec'], result['p50_us'],
+            result['p99_us']))
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if baseline is not None:
+        regressions = 0
+        print()
+        for result, ratio, regression in compare_results(baseline, results, arguments.threshold):
+            if regression:
+                regressions += 1
+            print('{:<20} {:>4}x{:<4} {:>+7.1f}%{}'.format(result['workload'], result['rows'], result['columns'],
+                                                            (ratio - 1.0) * 100, '  REGRESSION' if regression else ''))
+        if regressions > 0:
+            print(str(regressions) + ' regression(s) beyond ' + str(arguments.threshold * 100) + '%')
+            sys.exit(1)
+
+
+# This makes it so this module is executable
+if __name__ == '__main__':
+    start_benchmark()
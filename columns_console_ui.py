@@ -1,51 +1,104 @@
+import argparse
 import columns_game as game
+import columns_replay as replay
+import sys
 
 
-def start_game() -> None:
+def start_game(recordPath: str = None, stream: bool = False, every: int = 1, finalOnly: bool = False,
+               ansi: bool = False) -> None:
     """
     The main entry point for the game. Starts the game.
+    :param recordPath: The path of the file to record a replay of the game in, or None to not record it
+    :param stream: True to read the commands in bulk and write the frames in bulk, which is much faster for scripted runs
+    :param every: Only display every Nth frame (and the last frame). Implies streaming when it is not 1
+    :param finalOnly: Only display the last frame. Implies streaming
+    :param ansi: True to update the board in place in a terminal, only rewriting the cells that changed
     """
-    rows = get_int()
-    cols = get_int()
-    state = game.GameState(rows, cols)
+    if stream or every != 1 or finalOnly:
+        console = _StreamConsole(sys.stdin.buffer, sys.stdout.buffer, every, finalOnly, ansi)
+    else:
+        console = _Console(ansi)
 
-    line = next_line()
+    try:
+        rows = int(console.next_line())
+        cols = int(console.next_line())
+        state = game.GameState(rows, cols)
+
+        if recordPath is None:
+            _play_game(state, console, None)
+            return
+        with open(recordPath, 'wb') as recordFile:
+            recorder = replay.ReplayRecorder(recordFile, state)
+            try:
+                _play_game(state, console, recorder)
+            finally:
+                recorder.close()
+    finally:
+        console.close()
+
+
+def _play_game(state: game.GameState, console: '_Console', recorder: replay.ReplayRecorder) -> None:
+    """
+    Reads the board contents and then the commands from the console and plays them on the given GameState
+    :param state: The GameState to play the game on
+    :param console: The console that the commands are read from and the board is displayed in
+    :param recorder: The ReplayRecorder that records everything that is done, or None to not record
+    """
+    rows = state.get_rows()
+    cols = state.get_columns()
+
+    line = console.next_line()
     if line == 'CONTENTS':
         rowList = []
         for i in range(rows):
             row = []
-            line = raw_next_line()
+            line = console.raw_next_line()
             for index in range(cols):
                 row.append(line[index])
             rowList.append(row)
         state.set_board_contents(rowList)
+        if recorder is not None:
+            recorder.record_contents(rowList)
 
     while True:
-        _display_board(state)
-        line = next_line()
+        console.display_board(state)
+        line = console.next_line()
         if line == 'Q':
+            if recorder is not None:
+                recorder.record_quit()
             return
         if line == '':
-            if state.tick():
-                _display_board(state)
+            gameOver = state.tick()
+            if recorder is not None:
+                recorder.record_tick()
+            if gameOver:
+                console.display_board(state)
                 break
         else:
-            _process_command(line, state)
-    print('GAME OVER')
+            process_command(line, state, recorder)
+    console.display_text('GAME OVER')
 
 
-def _process_command(command: str, state: game.GameState) -> None:
+def process_command(command: str, state: game.GameState, recorder: replay.ReplayRecorder = None) -> None:
     """
-    Processes a command that is read in from the console and then performs that action on the given GameState
+    Processes a command that is read in from the console, or sent by a client of the game server, and then performs that
+    action on the given GameState
     :param command: The command that will be performed
     :param state: The GameState that the given command will be performed on
+    :param recorder: The ReplayRecorder that the command is recorded in once it is performed, or None to not record it
     """
     if command == 'R':
         state.rotate_faller()
+        if recorder is not None:
+            recorder.record_rotate()
     elif command == '<':
         state.move_faller_side(game.LEFT)
+        if recorder is not None:
+            recorder.record_move(game.LEFT)
     elif command == '>':
         state.move_faller_side(game.RIGHT)
+        if recorder is not None:
+            recorder.record_move(game.RIGHT)
     elif command[0] == 'F':
         try:
             args = command.split(' ')
@@ -54,35 +107,269 @@ def _process_command(command: str, state: game.GameState) -> None:
             state.spawn_faller(columnNumber, faller)
         except:
             return
+        if recorder is not None:
+            recorder.record_spawn(columnNumber, faller)
 
 
-def _display_board(state: game.GameState) -> None:
+def _cell_string(code: int) -> str:
     """
-    Displays the board of the given GameState in the console
-    :param state: The GameState that will be displayed in the console
+    Gets the 3 characters that a cell is displayed as in the console
+    :param code: The packed code of the cell from GameState.get_cell_codes()
+    :return: The string that represents the cell
     """
-    for row in range(state.get_rows()):
-        rowString = "|"
-        for col in range(state.get_columns()):
-            cellValue = state.get_cell_contents(row, col)
-            cellState = state.get_cell_state(row, col)
-            if cellState == game.EMPTY_CELL:
-                rowString += '   '
-            elif cellState == game.OCCUPIED_CELL:
-                rowString += (' ' + cellValue + ' ')
-            elif cellState == game.FALLER_MOVING_CELL:
-                rowString += ('[' + cellValue + ']')
-            elif cellState == game.FALLER_STOPPED_CELL:
-                rowString += ('|' + cellValue + '|')
-            elif cellState == game.MATCHED_CELL:
-                rowString += ('*' + cellValue + '*')
-        rowString += '|'
-        print(rowString)
-    finalLine = ' '
-    for col in range(state.get_columns()):
-        finalLine += '---'
-    finalLine += ' '
-    print(finalLine)
+    cellState, cellValue = game.decode_cell(code)
+    if cellState == game.EMPTY_CELL:
+        return '   '
+    elif cellState == game.OCCUPIED_CELL:
+        return ' ' + cellValue + ' '
+    elif cellState == game.FALLER_MOVING_CELL:
+        return '[' + cellValue + ']'
+    elif cellState == game.FALLER_STOPPED_CELL:
+        return '|' + cellValue + '|'
+    elif cellState == game.MATCHED_CELL:
+        return '*' + cellValue + '*'
+    return ''
+
+
+class _CellStrings(dict):
+    def __missing__(self, code: int) -> str:
+        """
+        Works out the string of a cell code the first time it is displayed
+        :param code: The packed code of the cell
+        :return: The string that represents the cell
+        """
+        cellString = _cell_string(code)
+        self[code] = cellString
+        return cellString
+
+
+# The string of every cell code that has been displayed so far. Jewels can be added while the game runs, so a code
+#   is only worked out the first time it is seen
+_CELL_STRINGS = _CellStrings()
+
+# ANSI escape sequences: move the cursor to a row and column (both starting at 1), clear the screen, clear everything
+#   after the cursor
+_ANSI_MOVE = '\x1b[{};{}H'
+_ANSI_CLEAR_SCREEN = '\x1b[2J'
+_ANSI_CLEAR_BELOW = '\x1b[J'
+
+
+class BoardRenderer:
+    def __init__(self):
+        """
+        Constructs a new BoardRenderer that remembers the last frame it built, so it only rebuilds the rows that changed
+        """
+        self._columns = None
+        self._codes = None
+        self._rowStrings = []
+        self._text = None
+
+    def render(self, state: game.GameState) -> str:
+        """
+        Builds the text of the board of the given GameState as it is displayed in the console
+        :param state: The GameState whose board will be built
+        :return: The lines of the board, each one ending with a newline
+        """
+        codes = state.get_cell_codes()
+        if codes == self._codes and state.get_columns() == self._columns:
+            return self._text
+
+        self._update_rows(state, codes)
+        lines = list(self._rowStrings)
+        lines.append(' ' + '---' * self._columns + ' ')
+        lines.append('')
+        self._text = '\n'.join(lines)
+        return self._text
+
+    def _update_rows(self, state: game.GameState, codes: bytes) -> [int]:
+        """
+        Rebuilds the strings of the rows that changed since the last frame and remembers the given frame
+        :param state: The GameState whose board is being built
+        :param codes: The cell codes of the board
+        :return: A list of the numbers of the rows that changed, every row if the size of the board changed
+        """
+        cols = state.get_columns()
+        cellString = _CELL_STRINGS.__getitem__
+        previous = self._codes
+        if previous is None or len(previous) != len(codes) or cols != self._columns:
+            previous = None
+            self._columns = cols
+            self._rowStrings = [None] * state.get_rows()
+
+        changedRows = []
+        for row, start in enumerate(range(0, len(codes), cols)):
+            end = start + cols
+            if previous is not None and previous[start:end] == codes[start:end]:
+                continue
+            self._rowStrings[row] = '|' + ''.join(map(cellString, codes[start:end])) + '|'
+            changedRows.append(row)
+
+        self._codes = codes
+        self._text = None
+        return changedRows
+
+
+class _AnsiBoardRenderer(BoardRenderer):
+    def render(self, state: game.GameState) -> str:
+        """
+        Builds the ANSI escape sequences that update a terminal showing the last frame to the board of the given
+        GameState. Only the cells that changed are written. The first frame clears the screen and draws the whole board.
+        Afterwards the cursor is left on the line below the board.
+        :param state: The GameState whose board will be drawn
+        :return: The text to write to the terminal
+        """
+        previous = self._codes
+        codes = state.get_cell_codes()
+        rows = state.get_rows()
+        cols = state.get_columns()
+        below = _ANSI_MOVE.format(rows + 2, 1) + _ANSI_CLEAR_BELOW
+
+        if previous is None or len(previous) != len(codes) or cols != self._columns:
+            self._update_rows(state, codes)
+            parts = [_ANSI_CLEAR_SCREEN, _ANSI_MOVE.format(1, 1)]
+            for rowString in self._rowStrings:
+                parts.append(rowString + '\n')
+            parts.append(' ' + '---' * cols + ' ')
+            parts.append(below)
+            return ''.join(parts)
+
+        if previous == codes:
+            return below
+
+        parts = []
+        cellString = _CELL_STRINGS.__getitem__
+        for row in self._update_rows(state, codes):
+            start = row * cols
+            col = 0
+            while col < cols:
+                if previous[start + col] == codes[start + col]:
+                    col += 1
+                    continue
+                # Cells that changed next to each other are written in one run
+                end = col + 1
+                while end < cols and previous[start + end] != codes[start + end]:
+                    end += 1
+                parts.append(_ANSI_MOVE.format(row + 1, col * 3 + 2))
+                parts.append(''.join(map(cellString, codes[start + col:start + end])))
+                col = end
+        parts.append(below)
+        return ''.join(parts)
+
+
+class _Console:
+    def __init__(self, ansi: bool = False):
+        """
+        Constructs a new _Console that reads commands with input() and displays frames with print()
+        :param ansi: True to update the board in place with ANSI escape sequences instead of printing every frame
+        """
+        self._renderer = _AnsiBoardRenderer() if ansi else BoardRenderer()
+
+    def next_line(self) -> str:
+        """
+        Gets a line from the console and returns it with the leading/trailing whitespace stripped
+        :return: The line that was retrieved from the console
+        """
+        return next_line()
+
+    def raw_next_line(self) -> str:
+        """
+        Gets a completely raw line from the console
+        :return: The line that was retrieved from the console
+        """
+        return raw_next_line()
+
+    def display_board(self, state: game.GameState) -> None:
+        """
+        Displays the board of the given GameState in the console
+        :param state: The GameState that will be displayed in the console
+        """
+        print(self._renderer.render(state), end='', flush=True)
+
+    def display_text(self, text: str) -> None:
+        """
+        Displays a line of text in the console
+        :param text: The text to display
+        """
+        print(text)
+
+    def close(self) -> None:
+        """
+        Finishes the output of the console
+        """
+        pass
+
+
+class _StreamConsole(_Console):
+    def __init__(self, inputFile, outputFile, every: int, finalOnly: bool, ansi: bool = False):
+        """
+        Constructs a new _StreamConsole that reads commands from a buffered binary file and writes each frame in one write
+        :param inputFile: The binary file the commands are read from, normally sys.stdin.buffer
+        :param outputFile: The binary file the frames are written to, normally sys.stdout.buffer
+        :param every: Only every Nth frame is written
+        :param finalOnly: True to only write the last frame
+        :param ansi: True to update the board in place with ANSI escape sequences instead of writing every frame
+        """
+        super().__init__(ansi)
+        self._lines = iter(inputFile)
+        self._output = outputFile
+        self._every = max(1, every)
+        self._finalOnly = finalOnly
+        self._frames = 0
+        # The last board that was skipped, so the last frame is always written
+        self._skippedState = None
+
+    def next_line(self) -> str:
+        """
+        Gets the next line of the input with the leading/trailing whitespace stripped
+        :return: The line that was read
+        """
+        return self.raw_next_line().strip()
+
+    def raw_next_line(self) -> str:
+        """
+        Gets the next line of the input without its line ending
+        :return: The line that was read
+        """
+        line = next(self._lines, None)
+        if line is None:
+            raise EOFError('EOF when reading a line')
+        return line.decode('utf-8').rstrip('\r\n')
+
+    def display_board(self, state: game.GameState) -> None:
+        """
+        Writes the board of the given GameState if it is a frame that is displayed
+        :param state: The GameState that will be displayed
+        """
+        frame = self._frames
+        self._frames += 1
+        if self._finalOnly or frame % self._every != 0:
+            self._skippedState = state
+            return
+        self._skippedState = None
+        self._output.write(self._renderer.render(state).encode('utf-8'))
+
+    def display_text(self, text: str) -> None:
+        """
+        Writes a line of text after the last frame
+        :param text: The text to write
+        """
+        self._write_skipped()
+        self._output.write((text + '\n').encode('utf-8'))
+
+    def close(self) -> None:
+        """
+        Writes the last frame if it was skipped and flushes the output
+        """
+        self._write_skipped()
+        self._output.flush()
+
+    def _write_skipped(self) -> None:
+        """
+        Writes the last board if it was skipped
+        """
+        if self._skippedState is not None:
+            self._output.write(self._renderer.render(self._skippedState).encode('utf-8'))
+            self._skippedState = None
 
 
 def get_int() -> int:
@@ -112,4 +399,11 @@ def raw_next_line() -> str:
 
 # This makes it so this module is executable
 if __name__ == '__main__':
-    start_game()
+    parser = argparse.ArgumentParser(description='Plays a game of Columns read from the console')
+    parser.add_argument('--record', metavar='PATH', help='record a replay of the game in the given file')
+    parser.add_argument('--stream', action='store_true', help='read the commands and write the frames in bulk')
+    parser.add_argument('--every', type=int, default=1, metavar='N', help='only display every Nth frame and the last one')
+    parser.add_argument('--final', action='store_true', help='only display the last frame')
+    parser.add_argument('--ansi', action='store_true', help='redraw only the cells that changed, for live terminals')
+    arguments = parser.parse_args()
+    start_game(arguments.record, arguments.stream, arguments.every, arguments.final, arguments.ansi)
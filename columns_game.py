@@ -1,3 +1,8 @@
+from collections import OrderedDict
+import re
+import struct
+import time
+
 # State of a cell
 EMPTY_CELL = 'EMPTY STATE'
 FALLER_MOVING_CELL = 'FALLER_MOVING STATE'
@@ -6,24 +11,11 @@ OCCUPIED_CELL = 'OCCUPIED STATE'
 MATCHED_CELL = 'MATCHED STATE'
 
 
-# Helper method to tell if a cell is in a state that can be matched with other cells
-def _is_matchable_state(state: str) -> bool:
-    """
-    Tells if the given state is a state that can be matched
-    :param state: The state that will be checked
-    :return: True if that given state can be matched. False otherwise
-    """
-    return state == OCCUPIED_CELL or state == MATCHED_CELL
-
-
 # Directions
 LEFT = -1
 RIGHT = 1
-_DOWN = 0
-_DOWN_LEFT = 2
 
 # Contents of a cell (the type of jewel or empty)
-_NONE = 'NONE'
 EMPTY = ' '
 S = 'S'
 T = 'T'
@@ -33,8 +25,290 @@ X = 'X'
 Y = 'Y'
 Z = 'Z'
 
+# Every cell of the board is stored as a single byte: the jewel code in the high bits and the state code in the low bits
+_STATE_BITS = 3
+_STATE_MASK = (1 << _STATE_BITS) - 1
+
+# Integer codes for the cell states. The matchable states (OCCUPIED and MATCHED) share the _MATCHABLE_BIT so a single
+#   bit test tells if a cell can be matched. The faller states are never stored on the board, the faller is laid over it
+_EMPTY_CODE = 0
+_FALLER_MOVING_CODE = 1
+_FALLER_STOPPED_CODE = 2
+_OCCUPIED_CODE = 4
+_MATCHED_CODE = 5
+_MATCHABLE_BIT = 4
+
+# Every cell code with a faller state, which an encoded board can not hold
+_FALLER_CODES = bytes(code for code in range(256) if code & _STATE_MASK in (_FALLER_MOVING_CODE, _FALLER_STOPPED_CODE))
+
+# Lookup tables between the state codes and the public state strings
+_STATE_NAMES = (EMPTY_CELL, FALLER_MOVING_CELL, FALLER_STOPPED_CELL, None, OCCUPIED_CELL, MATCHED_CELL, None, None)
+_STATE_CODES = {EMPTY_CELL: _EMPTY_CODE, FALLER_MOVING_CELL: _FALLER_MOVING_CODE,
+                FALLER_STOPPED_CELL: _FALLER_STOPPED_CODE, OCCUPIED_CELL: _OCCUPIED_CODE, MATCHED_CELL: _MATCHED_CODE}
+
+# Lookup tables between the jewel codes and the public jewel strings. Jewels that are not known yet (the console accepts
+#   any character as a jewel) are registered the first time they are seen
+_MAX_JEWEL_CODE = (0xFF >> _STATE_BITS)
+
+# The most different jewels (not counting EMPTY) that can be used. The jewel code is stored in the high bits of every
+#   cell and the table of jewels is shared by every board, so this is a limit on the whole process, not on one board
+MAX_JEWELS = _MAX_JEWEL_CODE
+_JEWEL_NAMES = [EMPTY, S, T, V, W, X, Y, Z]
+_JEWEL_CODES = {jewel: code for code, jewel in enumerate(_JEWEL_NAMES)}
+
+# The byte value of a cell that is completely empty
+_EMPTY_CELL_CODE = _EMPTY_CODE
+
+# OR-ing a cell code with this bit makes OCCUPIED and MATCHED cells of the same jewel compare equal, which is exactly
+#   what the matching scans care about
+_MATCH_KEY_BIT = _OCCUPIED_CODE ^ _MATCHED_CODE
+
+
+def _jewel_code(jewel: str) -> int:
+    """
+    Gets the integer code of the given jewel, registering the jewel if it has never been seen before
+    :param jewel: The jewel to get the code for
+    :return: An int that is the code of the given jewel
+    """
+    code = _JEWEL_CODES.get(jewel)
+    if code is None:
+        code = len(_JEWEL_NAMES)
+        if code > _MAX_JEWEL_CODE:
+            raise ValueError('Too many different jewels, at most ' + str(MAX_JEWELS) + ' are supported')
+        _JEWEL_NAMES.append(jewel)
+        _JEWEL_CODES[jewel] = code
+    return code
+
+
+# In to_bytes() the length of a jewel name is one byte. A name of this many bytes or more has the length as 4 more
+#   bytes after this one instead
+_LONG_NAME = 0xFF
+
+
+def _pack_name(jewel: int) -> bytes:
+    """
+    Encodes the name of a jewel for to_bytes(): its length and its UTF-8 bytes
+    :param jewel: The code of the jewel
+    :return: The encoded name
+    """
+    name = _JEWEL_NAMES[jewel].encode('utf-8')
+    if len(name) < _LONG_NAME:
+        return struct.pack('<B', len(name)) + name
+    return struct.pack('<BI', _LONG_NAME, len(name)) + name
+
+
+def _unpack_name(data: bytes, offset: int) -> (str, int):
+    """
+    Decodes a jewel name encoded by _pack_name()
+    :param data: The data to read from
+    :param offset: The offset of the length of the name
+    :return: A tuple of the name and the offset just after it
+    """
+    length = data[offset]
+    offset += 1
+    if length == _LONG_NAME:
+        length = struct.unpack_from('<I', data, offset)[0]
+        offset += 4
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+
+def _jewel_codes(jewels) -> [int]:
+    """
+    Gets the integer codes of the given jewels, registering the ones that have never been seen before. Either all of
+    them are registered or, if there is not room for all of them, none are
+    :param jewels: The jewels to get the codes for
+    :return: A list of the codes of the given jewels, in the same order
+    """
+    jewels = list(jewels)
+    unknown = {jewel for jewel in jewels if jewel not in _JEWEL_CODES}
+    if len(_JEWEL_NAMES) - 1 + len(unknown) > MAX_JEWELS:
+        raise ValueError('Too many different jewels, at most ' + str(MAX_JEWELS) + ' are supported')
+    return [_jewel_code(jewel) for jewel in jewels]
+
+
+# The number of matching jewels in a line that are needed for them to match
+_MATCH_LENGTH = 3
+
+# Translates a line of cell codes into match keys: OCCUPIED and MATCHED cells of the same jewel get the same key and
+#   every cell that can not be matched becomes 0, so a match is a run of the same non-zero byte
+_MATCH_KEYS = bytes((code | _MATCH_KEY_BIT) if code & _MATCHABLE_BIT else 0 for code in range(256))
+_MATCH_RUN = re.compile(rb'([^\x00])\1{' + str(_MATCH_LENGTH - 1).encode() + rb',}')
+
+# The line tables of the board sizes used most recently, see _line_tables. Only a few sizes are kept, so a program that
+#   goes through many board sizes does not keep the tables of all of them. A board holds on to its own tables anyway
+_LINE_TABLES = OrderedDict()
+_LINE_TABLE_SIZES = 8
+
+# The most board sizes whose tables are kept at once, see prepare_board_size()
+CACHED_BOARD_SIZES = _LINE_TABLE_SIZES
+
+
+def _line_tables(rows: int, columns: int) -> ([range], [slice], [(int,)]):
+    """
+    Gets the tables of the lines that jewels can be matched along for a board of the given size.
+    A line is a range of board indices: every row, every column, and every diagonal going up and to the right or down
+    and to the right. Lines that are too short to ever hold a match are left out.
+    The tables are shared by every board of the same size and kept for the few sizes used most recently.
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    :return: A tuple of the list of lines, the slice of the board that reads each line, and for every board index a
+    tuple of the numbers of the lines it is part of
+    """
+    tables = _LINE_TABLES.get((rows, columns))
+    if tables is not None:
+        _LINE_TABLES.move_to_end((rows, columns))
+        return tables
+
+    lines = []
+    slices = []
+    cellLines = [[] for i in range(rows * columns)]
+
+    def add_line(start: int, length: int, step: int) -> None:
+        if length < _MATCH_LENGTH:
+            return
+        line = range(start, start + length * step, step)
+        for index in line:
+            cellLines[index].append(len(lines))
+        lines.append(line)
+        # A line that walks backwards down to index 0 has to slice to the start of the board
+        slices.append(slice(line.start, line.stop if line.stop >= 0 else None, line.step))
+
+    for row in range(rows):
+        add_line(row * columns, columns, 1)
+    for col in range(columns):
+        add_line(col, rows, columns)
+    # Diagonals going up and to the right start on the left column or the bottom row
+    for row in range(rows):
+        add_line(row * columns, min(row + 1, columns), 1 - columns)
+    for col in range(1, columns):
+        add_line((rows - 1) * columns + col, min(rows, columns - col), 1 - columns)
+    # Diagonals going down and to the right start on the left column or the top row
+    for row in range(rows):
+        add_line(row * columns, min(rows - row, columns), columns + 1)
+    for col in range(1, columns):
+        add_line(col, min(rows, columns - col), columns + 1)
+
+    tables = (lines, slices, tuple(tuple(indexLines) for indexLines in cellLines))
+    _LINE_TABLES[(rows, columns)] = tables
+    if len(_LINE_TABLES) > _LINE_TABLE_SIZES:
+        _LINE_TABLES.popitem(last=False)
+    return tables
+
+
+def prepare_board_size(rows: int, columns: int) -> None:
+    """
+    Builds the tables that every board of the given size shares ahead of time, so the first GameState of that size is
+    quick to create. The tables are only kept for the CACHED_BOARD_SIZES sizes used most recently.
+    :param rows: The number of rows of the board
+    :param columns: The number of columns of the board
+    """
+    _line_tables(rows, columns)
+
+
+# The phases of a tick that profiling measures. The match scan is split by the direction of the lines
+PHASE_TICK = 'tick'
+PHASE_FALLER = 'faller'
+PHASE_MATCHING = 'matching'
+PHASE_CLEAR = 'clear'
+PHASE_GRAVITY = 'gravity'
+PHASE_SCAN_ROWS = 'scan_rows'
+PHASE_SCAN_COLUMNS = 'scan_columns'
+PHASE_SCAN_UP_DIAGONALS = 'scan_up_diagonals'
+PHASE_SCAN_DOWN_DIAGONALS = 'scan_down_diagonals'
+_PHASES = (PHASE_TICK, PHASE_FALLER, PHASE_MATCHING, PHASE_CLEAR, PHASE_GRAVITY, PHASE_SCAN_ROWS, PHASE_SCAN_COLUMNS,
+           PHASE_SCAN_UP_DIAGONALS, PHASE_SCAN_DOWN_DIAGONALS)
+
+
+# The kinds of change events a game emits while events are enabled. Every event is a tuple that starts with its kind:
+#   (EVENT_CELLS, ((index, code), ...))   the final cell code of every cell that changed, once per tick
+#   (EVENT_MATCHED, (index, ...))         cells that were marked as matched
+#   (EVENT_CLEARED, (index, ...))         matched cells that were emptied
+#   (EVENT_GRAVITY, ((from, to), ...))    jewels that fell, as board indices
+#   (EVENT_SPAWNED, row, col)             a faller was spawned, at the position of its bottom cell
+#   (EVENT_FALLER_MOVED, row, col)        the faller moved down or to the side, to the given position
+#   (EVENT_ROTATED, row, col)             the faller was rotated
+#   (EVENT_FROZEN, row, col)              the faller froze into the board
+#   (EVENT_RESET,)                        the whole game was replaced (restore or undo), read the board again
+#   (EVENT_SCROLLED, rows)                every cell and the faller moved up the given number of rows, the top rows left
+#                                           the board and the CELLS event that follows has the new bottom rows
+#   (EVENT_TICK, ticks)                   the end of the given number of ticks
+EVENT_CELLS = 'CELLS'
+EVENT_MATCHED = 'MATCHED'
+EVENT_CLEARED = 'CLEARED'
+EVENT_GRAVITY = 'GRAVITY'
+EVENT_SPAWNED = 'SPAWNED'
+EVENT_FALLER_MOVED = 'FALLER_MOVED'
+EVENT_ROTATED = 'ROTATED'
+EVENT_FROZEN = 'FROZEN'
+EVENT_RESET = 'RESET'
+EVENT_SCROLLED = 'SCROLLED'
+EVENT_TICK = 'TICK'
+
+
+# Zobrist hashing: every (board index, cell code) pair gets a fixed pseudo-random 64 bit key and the hash of a board is the
+#   XOR of the keys of all its cells, so changing one cell changes the hash with two XORs. The keys come from a SplitMix64
+#   mix of the pair instead of a table, so boards of any size need no memory for them
+_HASH_MASK = (1 << 64) - 1
+_HASH_SEED = 0x2545F4914F6CDD1D
+
+
+def _mix64(value: int) -> int:
+    """
+    Mixes the given value into a pseudo-random 64 bit value (the SplitMix64 finalizer)
+    :param value: The value to mix
+    :return: An int that is the pseudo-random 64 bit value for the given value
+    """
+    value = (value * 0x9E3779B97F4A7C15 + _HASH_SEED) & _HASH_MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _HASH_MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _HASH_MASK
+    return value ^ (value >> 31)
+
+
+def _cell_key(index: int, code: int) -> int:
+    """
+    Gets the Zobrist key of the given cell code at the given board index. Empty cells have no key.
+    :param index: The index of the cell on the board
+    :param code: The packed code of the cell
+    :return: An int that is the 64 bit key of the cell
+    """
+    if code == _EMPTY_CELL_CODE:
+        return 0
+    return _mix64((index << 8) | code)
+
+
+def _cell_code(jewel: int, state: int) -> int:
+    """
+    Packs a jewel code and a state code into the byte that is stored on the board
+    :param jewel: The code of the jewel in the cell
+    :param state: The code of the state of the cell
+    :return: An int that is the packed cell code
+    """
+    return (jewel << _STATE_BITS) | state
+
+
+def _faller_state_code(fallerState: int) -> int:
+    """
+    Gets the cell state code that the cells of a faller in the given state are seen with
+    :param fallerState: The state of the faller (_FALLER_MOVING or _FALLER_STOPPED)
+    :return: An int that is the state code of the faller cells
+    """
+    return _FALLER_STOPPED_CODE if fallerState == _FALLER_STOPPED else _FALLER_MOVING_CODE
+
+
+def decode_cell(code: int) -> (str, str):
+    """
+    Unpacks a cell code from GameState.get_cell_codes()
+    :param code: The packed code of a cell
+    :return: A tuple of the state of the cell and the content of the cell
+    """
+    return _STATE_NAMES[code & _STATE_MASK], _JEWEL_NAMES[code >> _STATE_BITS]
+
 
 class GameState:
+    __slots__ = ('_rows', '_columns', '_cells', '_faller', '_matchedCells', '_lines', '_lineSlices', '_cellLines',
+                 '_dirtyLines', '_fallColumns', '_undoStack', '_hash', '_profile', '_events', '_changedCells',
+                 '_flushedFaller', '_stackTops', '_hashStale')
+
     def __init__(self, rows: int, columns: int):
         """
         Constructs a new GameState with a board that is the given rows x the given columns
@@ -44,30 +318,60 @@ class GameState:
         super().__init__()
         self._rows = rows
         self._columns = columns
-        self._boardRows = []
-        self._boardStates = []
+        # The board is one flat array of cell codes indexed by row * columns + col
+        self._cells = bytearray(rows * columns)
+        # The faller is kept apart from the board and only written into it when it freezes. Reads of the cells it covers
+        #   see the faller instead of the board
         self._faller = _Faller()
-        for i in range(rows):
-            row = []
-            stateRow = []
-            for j in range(columns):
-                row.append(EMPTY)
-                stateRow.append(EMPTY_CELL)
-            self._boardRows.append(row)
-            self._boardStates.append(stateRow)
+        # The indices of the cells that were marked as matched by the last matching pass
+        self._matchedCells = []
+        # The lines that jewels can be matched along, and the numbers of the lines each cell is part of
+        self._lines, self._lineSlices, self._cellLines = _line_tables(rows, columns)
+        # The numbers of the lines that changed in a way that matters to matching since the last matching pass. Only
+        #   these lines are scanned for new matches
+        self._dirtyLines = set()
+        # The columns where a matchable cell appeared or disappeared since the last gravity pass. Only these columns
+        #   can have jewels that need to fall
+        self._fallColumns = set()
+        # The snapshots that undo() goes back to, the most recent one last
+        self._undoStack = []
+        # The Zobrist hash of the board cells, kept up to date on every change of a cell. Scrolling the board moves every
+        #   cell to a new index, so after a scroll the hash is stale until it is computed again when it is needed
+        self._hash = 0
+        self._hashStale = False
+        # The time spent in each phase of a tick while profiling is enabled, or None if it never was
+        self._profile = None
+        # The change events that have not been drained yet, the indices of the board cells that changed since the last
+        #   CELLS event, and the faller cells as the last CELLS event saw them. All are None while events are disabled
+        self._events = None
+        self._changedCells = None
+        self._flushedFaller = None
+        # The row of the highest solid (occupied) cell of each column, or the number of rows if the column has none.
+        #   Nothing above it can stop a faller, so landing and collisions only have to look at this row
+        self._stackTops = [rows] * columns
 
     def set_board_contents(self, contents: [[str]]) -> None:
         """
-        Sets the contents of the board to the given contents, then applies gravity and attempts matching
+        Sets the contents of the board to the given contents, then applies gravity and attempts matching.
+        Any string can be a jewel, but at most MAX_JEWELS different jewels can be used by all boards together. The
+        contents are checked before anything is written, so the board is left as it was if they can not be used.
         :param contents: A list of rows from top of the board to bottom where each row is a list that represents each cell in that row
         """
-        for row in range(self.get_rows()):
-            for col in range(self.get_columns()):
+        rows = self.get_rows()
+        columns = self.get_columns()
+        for row in range(rows):
+            if len(contents[row]) < columns:
+                raise ValueError('Row ' + str(row) + ' does not have ' + str(columns) + ' cells')
+        jewels = {value for row in range(rows) for value in contents[row][:columns]}
+        codes = dict(zip(jewels, _jewel_codes(jewels)))
+
+        for row in range(rows):
+            for col in range(columns):
                 value = contents[row][col]
-                if value is EMPTY:
-                    self._set_cell(row, col, EMPTY, EMPTY_CELL)
+                if value == EMPTY:
+                    self._set_cell(row, col, _EMPTY_CELL_CODE)
                 else:
-                    self._set_cell(row, col, value, OCCUPIED_CELL)
+                    self._set_cell(row, col, _cell_code(codes[value], _OCCUPIED_CODE))
 
         self._gem_gravity()
         self._matching()
@@ -78,56 +382,61 @@ class GameState:
         :return: True if the game is over from a faller freezing out of bounds. False otherwise
         """
         # Handle the faller first
-        if self._faller.active:
-            # If the faller had stopped last tick then check if it is still on solid ground
-            if self._faller.state == _FALLER_STOPPED:
-                # Do an update on the faller state to see what state it is now in
-                self._update_faller_state()
-                # If the faller is still stopped after the update then solidify it
-                if self._faller.state == _FALLER_STOPPED:
-                    # Set a value for is part of this faller is solidified above the top of the game board
-                    value = False
-                    # If part of the faller is above the top of the game board then set the value to true
-                    if self._faller.get_row() - 2 < 0:
-                        value = True
+        gameOver = self._tick_faller()
 
-                    # If all of the faller is in play then we solidify it
-                    for i in range(3):
-                        self._set_cell(self._faller.get_row() - i, self._faller.get_col(), self._faller.contents[i],
-                                       OCCUPIED_CELL)
-                    self._faller.active = False
+        # Handle matching and gem gravity
+        self._matching()
 
-                    # The game ends if part of this faller was solidified above the top of the game board
-                    self._matching()
-                    return value
+        if self._events is not None:
+            self._end_ticks(1)
+        return gameOver
 
-            # If we get here then the faller isnt on solid ground for sure so move it down
-            self._move_faller_down()
-            # Update the faller now so it is in the correct state
-            self._update_faller_state()
+    def advance(self, ticks: int) -> (bool, int, int):
+        """
+        Ticks the given number of time units on the game, exactly as that many calls to tick() would.
+        A falling faller over a settled board is dropped straight to the row it lands on instead of one row per tick, and
+        ticks on a settled board without a faller are skipped.
+        :param ticks: The number of time units to tick
+        :return: A tuple of: True if the game ended (the remaining ticks are not used), the number of ticks used, and
+        the number of ticks in which new cells were matched
+        """
+        return self._advance(ticks)
 
-        # Handle matching and gem gravity
-        self._matching()
-        return False
+    def settle(self) -> (bool, int, int):
+        """
+        Ticks the game until the active faller (if there is one) has frozen and every match and the gravity after it has
+        been resolved, so that another tick would change nothing.
+        :return: A tuple of: True if the game ended, the number of ticks used, and the number of ticks in which new
+        cells were matched
+        """
+        return self._advance(None)
 
     def spawn_faller(self, column: int, faller: [str, str, str]) -> None:
         """
-        Spawns a faller in the given column (1,n) with the given contents
+        Spawns a faller in the given column (1,n) with the given contents. New jewels count towards MAX_JEWELS, see
+        set_board_contents()
         :param column: A column number from 1 to the number of columns where the faller will spawn
         :param faller: The contents of the faller that will spawn. faller[0] is the first block of the faller to be visible
         """
         if self._faller.active:
             return
 
+        if column < 1 or column > self.get_columns():
+            raise ValueError('Column ' + str(column) + ' is not on the board')
+
+        contents = _jewel_codes(faller)
+
         self._faller.active = True
-        self._faller.contents = faller
+        self._faller.contents = contents
         self._faller.set_row(0)
         self._faller.set_col(column - 1)
-        self._set_cell(0, self._faller.get_col(), self._faller.contents[0], FALLER_MOVING_CELL)
 
         # Check if the ground immediately under the faller is solid and if it is then update the fallers state
         self._update_faller_state()
 
+        if self._events is not None:
+            self._events.append((EVENT_SPAWNED, self._faller.get_row(), self._faller.get_col()))
+
     def has_faller(self) -> bool:
         """
         Returns whether or not this game state has a faller that is currently active (falling or stopped but not frozen)
@@ -135,6 +444,46 @@ class GameState:
         """
         return self._faller.active
 
+    def get_landing_row(self, column: int = None) -> int:
+        """
+        Gets the row that the bottom of a faller comes to rest on if it falls straight down and nothing else on the
+        board moves, for drawing a ghost piece or planning moves
+        :param column: A column number from 1 to the number of columns for a faller that would be spawned there, or None
+        for the active faller
+        :return: The row the bottom of the faller lands on. A row less than 2 means the faller freezes partly above the
+        top of the board, which ends the game
+        """
+        if column is None:
+            if not self._faller.active:
+                raise ValueError('There is no active faller')
+            return self._landing_row()
+
+        if column < 1 or column > self.get_columns():
+            raise ValueError('Column ' + str(column) + ' is not on the board')
+        return self._stackTops[column - 1] - 1
+
+    def spawn_ends_game(self, column: int) -> bool:
+        """
+        Checks if a faller spawned in the given column would freeze partly above the top of the board if it falls
+        straight down and nothing else on the board moves
+        :param column: A column number from 1 to the number of columns
+        :return: True if the spawn would end the game. False otherwise
+        """
+        return self.get_landing_row(column) < 2
+
+    def can_move_faller_side(self, direction: int) -> bool:
+        """
+        Checks if the active faller can move one column in the given direction
+        :param direction: The direction to move the faller (LEFT, RIGHT)
+        :return: True if move_faller_side() would move the faller. False otherwise
+        """
+        if not self._faller.active:
+            return False
+        targetColumn = self._faller.get_col() + direction
+        if targetColumn < 0 or targetColumn >= self.get_columns():
+            return False
+        return self._faller_fits(targetColumn)
+
     def rotate_faller(self) -> None:
         """
         Rotates the faller so the first block becomes the last, the middle becomes the first, and the top becomes the middle
@@ -148,10 +497,11 @@ class GameState:
         three = self._faller.contents[2]
 
         self._faller.contents = [two, three, one]
-        for i in range(3):
-            self._set_cell_contents(self._faller.get_row() - i, self._faller.get_col(), self._faller.contents[i])
         self._update_faller_state()
 
+        if self._events is not None:
+            self._events.append((EVENT_ROTATED, self._faller.get_row(), self._faller.get_col()))
+
     def move_faller_side(self, direction: int) -> None:
         """
         Moves the faller in the given direction if that direction is not blocked
@@ -171,29 +521,236 @@ class GameState:
             return
 
         targetColumn = self._faller.get_col() + direction
-        # Here we are going to check if we can move the faller
-        for i in range(3):
-            # If the check is going to check a row that is above the top, then we are clear to move the faller
-            if self._faller.get_row() - i < 0:
-                break
-
-            if self.get_cell_state(self._faller.get_row() - i, targetColumn) == OCCUPIED_CELL:
-                return
+        if not self._faller_fits(targetColumn):
+            return
 
         # Move the faller to its new column
-        for i in range(3):
-            # If we are going to go out of bounds then we are done moving
-            if self._faller.get_row() - i < 0:
-                break
-            # Move the cell to the new column
-            self._move_cell(self._faller.get_row() - i, self._faller.get_col(), direction)
-
-        # Set the new faller column
         self._faller.set_col(targetColumn)
 
         # Update the fallers state now that it has moved
         self._update_faller_state()
 
+        if self._events is not None:
+            self._events.append((EVENT_FALLER_MOVED, self._faller.get_row(), self._faller.get_col()))
+
+    def insert_rows(self, contents: [[str]]) -> bool:
+        """
+        Pushes the given rows in at the bottom of the board, like garbage rows in a versus game. Everything on the board
+        and the faller moves up by that many rows, and the same number of rows at the top leave the board. Jewels above
+        holes in the new rows fall into them on the next tick.
+        This costs time in the number of columns per row, not in the size of the board.
+        :param contents: A list of rows from top to bottom where each row is a list that represents each cell in that row
+        :return: True if a jewel was pushed off the top of the board. False otherwise
+        """
+        for rowContents in contents:
+            if len(rowContents) != self._columns:
+                raise ValueError('A row does not have ' + str(self._columns) + ' cells')
+        jewels = {value for rowContents in contents for value in rowContents}
+        jewelCodes = dict(zip(jewels, _jewel_codes(jewels)))
+        codes = bytearray()
+        for rowContents in contents:
+            codes.extend(_EMPTY_CELL_CODE if value == EMPTY else _cell_code(jewelCodes[value], _OCCUPIED_CODE)
+                         for value in rowContents)
+        return self._scroll(bytes(codes))
+
+    def drop_rows(self, count: int) -> bool:
+        """
+        Drops the given number of rows off the top of the board. Everything else on the board and the faller moves up by
+        that many rows and empty rows come in at the bottom, so the jewels fall back down on the next tick.
+        This costs time in the number of columns per row, not in the size of the board.
+        :param count: The number of rows to drop
+        :return: True if a jewel was dropped. False otherwise
+        """
+        return self._scroll(bytes(count * self._columns))
+
+    def snapshot(self) -> tuple:
+        """
+        Takes a snapshot of the whole game (board, faller and pending matching work) that restore() can go back to.
+        The snapshot is an immutable tuple built around a single bytes copy of the board.
+        :return: The snapshot of the game
+        """
+        return (bytes(self._cells), self._faller.to_tuple(), tuple(self._matchedCells), frozenset(self._dirtyLines),
+                frozenset(self._fallColumns), self._board_hash())
+
+    def restore(self, snapshot: tuple) -> None:
+        """
+        Puts the game back in the state it was in when the given snapshot was taken
+        :param snapshot: A snapshot from snapshot() of a game with the same number of rows and columns
+        """
+        cells, faller, matchedCells, dirtyLines, fallColumns, boardHash = snapshot
+        if len(cells) != len(self._cells):
+            raise ValueError('The snapshot is not of a board with the same size as this one')
+
+        self._cells[:] = cells
+        self._find_stack_tops()
+        self._faller.from_tuple(faller)
+        self._matchedCells = list(matchedCells)
+        self._dirtyLines = set(dirtyLines)
+        self._fallColumns = set(fallColumns)
+        self._hash = boardHash
+        self._hashStale = False
+
+        if self._events is not None:
+            # Changes from before the restore mean nothing now
+            self._changedCells.clear()
+            self._flushedFaller = self._faller_cells()
+            self._events.append((EVENT_RESET,))
+
+    def push_undo(self) -> None:
+        """
+        Saves the current state of the game on the undo stack so a later undo() goes back to it
+        """
+        self._undoStack.append(self.snapshot())
+
+    def undo(self) -> bool:
+        """
+        Puts the game back in the state it was in at the most recent push_undo() and removes that state from the stack
+        :return: True if there was a state to go back to. False otherwise
+        """
+        if not self._undoStack:
+            return False
+        self.restore(self._undoStack.pop())
+        return True
+
+    def clear_undo(self) -> None:
+        """
+        Removes every saved state from the undo stack
+        """
+        self._undoStack.clear()
+
+    def clone(self) -> 'GameState':
+        """
+        Creates an independent copy of this game that can be played without affecting this one.
+        The undo stack is not copied.
+        :return: The copy of this game
+        """
+        copy = GameState.__new__(GameState)
+        copy._rows = self._rows
+        copy._columns = self._columns
+        copy._cells = bytearray(self._cells)
+        copy._faller = _Faller()
+        copy._faller.from_tuple(self._faller.to_tuple())
+        copy._matchedCells = list(self._matchedCells)
+        # The line tables never change so they are shared
+        copy._lines = self._lines
+        copy._lineSlices = self._lineSlices
+        copy._cellLines = self._cellLines
+        copy._dirtyLines = set(self._dirtyLines)
+        copy._fallColumns = set(self._fallColumns)
+        copy._undoStack = []
+        copy._hash = self._hash
+        copy._hashStale = self._hashStale
+        copy._stackTops = list(self._stackTops)
+        copy._profile = None
+        copy._events = None
+        copy._changedCells = None
+        copy._flushedFaller = None
+        return copy
+
+    def to_bytes(self) -> bytes:
+        """
+        Encodes the whole game (board, faller and cells waiting to be cleared) as bytes that from_bytes() can load.
+        The jewels are stored by name, so the bytes can be loaded by any process.
+        :return: The encoded game
+        """
+        # The jewels on the board and in the faller get numbers local to this encoding, 0 is always EMPTY
+        used = {code >> _STATE_BITS for code in set(self._cells)}
+        used.update(self._faller.contents)
+        used.discard(_jewel_code(EMPTY))
+        jewels = sorted(used)
+        localCodes = {jewel: local + 1 for local, jewel in enumerate(jewels)}
+        localCodes[_jewel_code(EMPTY)] = 0
+
+        table = bytes(_cell_code(localCodes.get(code >> _STATE_BITS, 0), code & _STATE_MASK) for code in range(256))
+
+        parts = [struct.pack('<IIB', self._rows, self._columns, len(jewels))]
+        for jewel in jewels:
+            parts.append(_pack_name(jewel))
+        parts.append(self._cells.translate(table))
+
+        faller = self._faller
+        parts.append(struct.pack('<?iiBBBB', faller.active, faller.get_row(), faller.get_col(),
+                                 *[localCodes[jewel] for jewel in faller.contents], faller.state))
+        parts.append(struct.pack('<I' + 'I' * len(self._matchedCells), len(self._matchedCells), *self._matchedCells))
+        return b''.join(parts)
+
+    def get_hash(self) -> int:
+        """
+        Gets a 64 bit hash of the current position: the contents and state of every cell and the position, contents and
+        state of the faller. Equal positions always have equal hashes, no matter how they were reached.
+        The hash of the board is kept up to date as cells change, so this only scans the board once after it scrolled.
+        :return: An int that is the hash of the current position
+        """
+        boardHash = self._board_hash()
+        if not self._faller.active:
+            return boardHash
+        faller = self._faller
+        fallerValue = (faller.get_row() + 3) * self._columns + faller.get_col()
+        for jewel in faller.contents:
+            fallerValue = (fallerValue << 8) | jewel
+        return boardHash ^ _mix64(~((fallerValue << 1) | faller.state) & _HASH_MASK)
+
+    def enable_events(self, enabled: bool = True) -> None:
+        """
+        Turns change events on or off. While they are on, the game keeps a list of everything that changed (see the
+        EVENT_ constants) for drain_events(), so an observer only has to look at what changed instead of the whole board.
+        Turning them off throws away the events that were not drained.
+        :param enabled: True to turn events on, False to turn them off
+        """
+        if enabled:
+            if self._events is None:
+                self._events = []
+                self._changedCells = set()
+                self._flushedFaller = self._faller_cells()
+        else:
+            self._events = None
+            self._changedCells = None
+            self._flushedFaller = None
+
+    def drain_events(self) -> [tuple]:
+        """
+        Gets and forgets every change event since the last drain, in the order they happened. Cell changes made since
+        the last tick are included as one last CELLS event.
+        :return: A list of event tuples, empty if events are disabled
+        """
+        if self._events is None:
+            return []
+        self._flush_changed_cells()
+        events = self._events
+        self._events = []
+        return events
+
+    def enable_profiling(self, enabled: bool = True) -> None:
+        """
+        Turns profiling of the phases of tick() on or off. While it is off the game runs exactly the same code as a game
+        that was never profiled, so it costs nothing. The numbers collected so far are kept when it is turned off.
+        :param enabled: True to turn profiling on, False to turn it off
+        """
+        if enabled:
+            if self._profile is None:
+                self._profile = {phase: [0, 0, 0] for phase in _PHASES}
+            self.__class__ = _ProfiledGameState
+        else:
+            self.__class__ = GameState
+
+    def stats(self) -> {str: {str: int}}:
+        """
+        Gets the numbers collected while profiling was enabled for every phase of a tick: the faller, matching as a whole,
+        clearing the matched cells, gravity, and the match scans along each direction of line
+        :return: A dict from the phase (one of the PHASE_ constants) to a dict of its 'calls', 'cells' (cells visited)
+        and 'ns' (nanoseconds spent in it). Empty if profiling was never enabled
+        """
+        if self._profile is None:
+            return {}
+        return {phase: {'calls': calls, 'cells': cells, 'ns': ns} for phase, (calls, cells, ns) in self._profile.items()}
+
+    def reset_stats(self) -> None:
+        """
+        Sets every number collected by profiling back to 0
+        """
+        if self._profile is not None:
+            self._profile = {phase: [0, 0, 0] for phase in _PHASES}
+
     def get_rows(self) -> int:
         """
         Gets the number of rows in this game board
@@ -215,7 +772,7 @@ class GameState:
         :param col: The column of the cell to get the state for
         :return: The state of the cell identified by the given row and column
         """
-        return self._boardStates[row][col]
+        return _STATE_NAMES[self._visible_code(row * self._columns + col) & _STATE_MASK]
 
     def get_cell_contents(self, row: int, col: int) -> str:
         """
@@ -224,233 +781,520 @@ class GameState:
         :param col: The column of the cell to get the content for
         :return: The content of the cell identified by the given row and column
         """
-        return self._boardRows[row][col]
+        return _JEWEL_NAMES[self._visible_code(row * self._columns + col) >> _STATE_BITS]
 
-    def _set_cell(self, row: int, col: int, contents: str, state: str) -> None:
+    def get_cell_codes(self) -> bytes:
         """
-        Sets the content and state of the cell identified by the given row and column
+        Gets the packed code of every cell on the board in one call, row by row from the top. decode_cell() turns a code
+        into the state and content of the cell. Equal cells always have equal codes.
+        :return: The codes of the cells, indexed by row * columns + col
+        """
+        return bytes(self._visible_cells())
+
+    def _visible_code(self, index: int) -> int:
+        """
+        Gets the packed code of the cell at the given board index as it is seen from outside, with the faller on top
+        :param index: The index of the cell on the board (row * columns + col)
+        :return: An int that is the packed jewel and state code of the faller cell there, or of the board cell if the
+        faller does not cover it
+        """
+        faller = self._faller
+        if faller.active:
+            row, col = divmod(index, self._columns)
+            i = faller.get_row() - row
+            if col == faller.get_col() and 0 <= i < 3:
+                return _cell_code(faller.contents[i], _faller_state_code(faller.state))
+        return self._cells[index]
+
+    def _visible_cells(self) -> bytearray:
+        """
+        Gets a copy of the board with the faller written into it
+        :return: A bytearray of the cell codes, indexed by row * columns + col
+        """
+        cells = bytearray(self._cells)
+        for index, code in self._faller_cells():
+            cells[index] = code
+        return cells
+
+    def _faller_cells(self) -> ((int, int), ...):
+        """
+        Gets the cells that the faller covers on the board, leaving out the ones above the top of the board
+        :return: A tuple of (board index, packed code) pairs from the bottom of the faller up, empty if there is no
+        active faller
+        """
+        faller = self._faller
+        if not faller.active:
+            return ()
+        state = _faller_state_code(faller.state)
+        index = faller.get_row() * self._columns + faller.get_col()
+        cells = []
+        for i in range(min(3, faller.get_row() + 1)):
+            cells.append((index, _cell_code(faller.contents[i], state)))
+            index -= self._columns
+        return tuple(cells)
+
+    def _get_cell(self, row: int, col: int) -> int:
+        """
+        Gets the packed code of the cell identified by the given row and column
         :param row: The row of the cell
         :param col: The column of the cell
-        :param contents: The content to set the cell to
-        :param state: The state to set the cell to
+        :return: An int that is the packed jewel and state code of the cell
         """
-        # Not allowed to set cells that fall above the board
-        if row < 0:
-            return
-        self._set_cell_contents(row, col, contents)
-        self._set_cell_state(row, col, state)
+        return self._cells[row * self._columns + col]
 
-    def _set_cell_contents(self, row: int, col: int, contents: str) -> None:
+    def _set_cell(self, row: int, col: int, code: int) -> None:
         """
-        Sets the content of the cell identified by the given row and column
+        Sets the content and state of the cell identified by the given row and column
         :param row: The row of the cell
         :param col: The column of the cell
-        :param contents: The content to set the cell to
+        :param code: The packed jewel and state code to set the cell to
         """
+        # Not allowed to set cells that fall above the board
         if row < 0:
             return
-        self._boardRows[row][col] = contents
+        self._write(row * self._columns + col, code)
 
-    def _set_cell_state(self, row: int, col: int, state: str) -> None:
+    def _set_cell_state(self, row: int, col: int, state: int) -> None:
         """
         Sets the state of the cell identified by the given row and column
         :param row: The row of the cell
         :param col: The column of the cell
-        :param state: The state to set the cell to
+        :param state: The state code to set the cell to
         """
         if row < 0:
             return
-        self._boardStates[row][col] = state
+        index = row * self._columns + col
+        self._write(index, (self._cells[index] & ~_STATE_MASK) | state)
 
-    def _gem_gravity(self) -> None:
+    def _write(self, index: int, code: int) -> None:
+        """
+        Writes the given code into the cell at the given board index and records the lines of that cell as dirty if
+        the change can affect matching
+        :param index: The index of the cell on the board (row * columns + col)
+        :param code: The packed jewel and state code to write into the cell
+        """
+        oldCode = self._cells[index]
+        self._cells[index] = code
+        # A jewel that appears or disappears can leave a gap that gravity has to close
+        if (oldCode ^ code) & _MATCHABLE_BIT:
+            self._fallColumns.add(index % self._columns)
+        self._record_change(index, oldCode, code)
+
+    def _record_change(self, index: int, oldCode: int, code: int) -> None:
+        """
+        Updates the hash for a change of the cell at the given board index, and records the lines of that cell as dirty
+        if the change can affect matching
+        :param index: The index of the cell on the board (row * columns + col)
+        :param oldCode: The code the cell had before the change
+        :param code: The code the cell has after the change
+        """
+        self._hash ^= _cell_key(index, oldCode) ^ _cell_key(index, code)
+        if self._changedCells is not None:
+            self._changedCells.add(index)
+        # Only a cell that becomes or stops being occupied can move the top of its column
+        if (oldCode & _STATE_MASK == _OCCUPIED_CODE) != (code & _STATE_MASK == _OCCUPIED_CODE):
+            self._move_stack_top(index, code & _STATE_MASK == _OCCUPIED_CODE)
+        # Only a change to a matchable cell (its jewel or whether it is matchable at all) can change a match result
+        if (oldCode | code) & _MATCHABLE_BIT and (oldCode | _MATCH_KEY_BIT) != (code | _MATCH_KEY_BIT):
+            self._dirtyLines.update(self._cellLines[index])
+        # A matched cell that gets moved has to be cleared at its new position
+        if code & _STATE_MASK == _MATCHED_CODE and oldCode & _STATE_MASK != _MATCHED_CODE:
+            self._matchedCells.append(index)
+
+    def _move_stack_top(self, index: int, occupied: bool) -> None:
+        """
+        Updates the top of the column of the given cell after the cell became or stopped being occupied
+        :param index: The index of the cell on the board (row * columns + col)
+        :param occupied: True if the cell became occupied. False if it stopped being occupied
+        """
+        row, col = divmod(index, self._columns)
+        top = self._stackTops[col]
+        if occupied:
+            if row < top:
+                self._stackTops[col] = row
+        elif row == top:
+            # The new top is the next occupied cell down the column
+            cells = self._cells
+            end = len(cells)
+            index += self._columns
+            while index < end and cells[index] & _STATE_MASK != _OCCUPIED_CODE:
+                index += self._columns
+            self._stackTops[col] = index // self._columns if index < end else self._rows
+
+    def _find_stack_tops(self) -> None:
+        """
+        Finds the top of every column from scratch
         """
-        Applies gem gravity to all frozen cells and moves them until the cell below them is solid
+        columns = self._columns
+        tops = [self._rows] * columns
+        for index in range(len(self._cells) - 1, -1, -1):
+            if self._cells[index] & _STATE_MASK == _OCCUPIED_CODE:
+                tops[index % columns] = index // columns
+        self._stackTops = tops
+
+    def _gem_gravity(self) -> [(int, int)]:
         """
-        for col in range(self.get_columns()):
-            for row in range(self.get_rows() - 1, -1, -1):
-                state = self.get_cell_state(row, col)
-                # Ignore the crawler when propagating gravity
-                if state == FALLER_MOVING_CELL or state == FALLER_STOPPED_CELL:
+        Applies gem gravity to all frozen cells and moves them until the cell below them is solid.
+        Only the columns where a jewel appeared or disappeared since the last pass are compacted, each in a single pass
+        from the bottom up.
+        :return: A list of (from index, to index) board indices for every jewel that moved, from the bottom up
+        """
+        rows = self.get_rows()
+        columns = self.get_columns()
+        cells = self._cells
+        moves = []
+
+        fallColumns = self._fallColumns
+        self._fallColumns = set()
+        for col in sorted(fallColumns):
+            bottom = (rows - 1) * columns + col
+            # The index where the next jewel will come to rest, just above the jewels that have already landed
+            floor = bottom
+            # The index of the highest jewel in the column
+            for index in range(bottom, -1, -columns):
+                code = cells[index]
+                # Only frozen jewels fall
+                if code & _STATE_MASK != _OCCUPIED_CODE:
                     continue
-                if state == OCCUPIED_CELL:
-                    i = 1
-                    while not self._is_solid(row + i, col):
-                        self._move_cell(row + i - 1, col, _DOWN)
-                        i += 1
+                if index != floor:
+                    cells[index] = _EMPTY_CELL_CODE
+                    self._record_change(index, code, _EMPTY_CELL_CODE)
+                    oldCode = cells[floor]
+                    cells[floor] = code
+                    self._record_change(floor, oldCode, code)
+                    moves.append((index, floor))
+                floor -= columns
+
+        if moves and self._events is not None:
+            self._events.append((EVENT_GRAVITY, tuple(moves)))
+        return moves
 
     def _matching(self) -> None:
         """
         Ticks the matching state on all cell.
         If cells are already marked as matching then they are destroyed and gravity is applied to all cells.
-        After that all cells are compared for matching on the X, Y, and diagonal axes.
+        After that all cells are compared for matching on the X, Y, and both diagonal axes.
         """
         # First thing we do is get rid of any cells that are marked as matched from the previous tick
-        for row in range(self.get_rows()):
-            for col in range(self.get_columns()):
-                if self.get_cell_state(row, col) == MATCHED_CELL:
-                    self._set_cell(row, col, EMPTY, EMPTY_CELL)
+        self._clear_matched()
         # Then we propagate gravity so everything moves down again
         self._gem_gravity()
 
-        # Now we go through all the cells and flag all the matching ones
-        # We start at the bottom left corner and move up and to the right while always looking for matches up and right
-        #   so this way we never need to worry about looking in all directions. This is because any cell to the left
-        #   and down will already have been checked because we moved from that cell
-        self._match_x_axis()
-        self._match_y_axis()
-        self._match_diagonal()
-
-    def _match_x_axis(self) -> None:
-        """
-        Attempts matching for all cells on the X-axis and then marks any of the cells that match (3 or more occurrences)
-        """
-        for currentRow in range(self.get_rows() - 1, -1, -1):
-            matches = 0
-            gem = _NONE
-            for col in range(0, self.get_columns()):
-                contents = self.get_cell_contents(currentRow, col)
-                state = self.get_cell_state(currentRow, col)
-                cellMatches = (contents == gem and _is_matchable_state(state))
-                # This cell matches our current sequence
-                if cellMatches:
-                    matches += 1
-
-                # This is the last column so we have to terminate the matching for this row
-                if col == self.get_columns()-1:
-                    if matches >= 3:
-                        if cellMatches:
-                            self._mark_matched_cells(currentRow, col, LEFT, matches)
-                        else:
-                            self._mark_matched_cells(currentRow, col-1, LEFT, matches)
-                elif not cellMatches:
-                    if matches >= 3:
-                        self._mark_matched_cells(currentRow, col-1, LEFT, matches)
-
-                    if _is_matchable_state(state):
-                        gem = contents
-                        matches = 1
-                    else:
-                        gem = _NONE
-                        matches = 1
-
-    def _match_y_axis(self) -> None:
-        """
-        Attempts matching for all cells on the Y-axis and then marks any of the cells that match (3 or more occurrences)
-        """
-        for currentCol in range(0, self.get_columns()):
-            matches = 0
-            gem = _NONE
-            for row in range(self.get_rows() - 1, -1, -1):
-                contents = self.get_cell_contents(row, currentCol)
-                state = self.get_cell_state(row, currentCol)
-                cellMatches = (contents == gem and _is_matchable_state(state))
-                # This cell matches our current sequence
-                if cellMatches:
-                    matches += 1
-
-                # This is the last column so we have to terminate the matching for this row
-                if row == 0:
-                    if matches >= 3:
-                        if cellMatches:
-                            self._mark_matched_cells(row, currentCol, _DOWN, matches)
-                        else:
-                            self._mark_matched_cells(row + 1, currentCol, _DOWN, matches)
-                elif not cellMatches:
-                    if matches >= 3:
-                        self._mark_matched_cells(row + 1, currentCol, _DOWN, matches)
-
-                    if _is_matchable_state(state):
-                        gem = contents
-                        matches = 1
-                    else:
-                        gem = _NONE
-                        matches = 1
-
-    def _match_diagonal(self) -> None:
-        """
-        Attempts matching for all cells on the diagonal-axis and then marks any of the cells that match (3 or more occurrences)
-        """
-        for currentRow in range(self.get_rows() - 1, -1, -1):
-            for currentCol in range(0, self.get_columns()):
-                matches = 0
-                gem = _NONE
-                rowCounter = 0
-                colCounter = 0
-                while True:
-                    row = currentRow-rowCounter
-                    col = currentCol+colCounter
-
-                    contents = self.get_cell_contents(row, col)
-                    state = self.get_cell_state(row, col)
-                    cellMatches = (contents == gem and _is_matchable_state(state))
-                    # This cell matches our current sequence
-                    if cellMatches:
-                        matches += 1
-
-                    # This is the last column so we have to terminate the matching for this row
-                    if col == self.get_columns()-1 or row == 0:
-                        if matches >= 3:
-                            if cellMatches:
-                                self._mark_matched_cells(row, col, _DOWN_LEFT, matches)
-                            else:
-                                self._mark_matched_cells(row + 1, col - 1, _DOWN_LEFT, matches)
-                    elif not cellMatches:
-                        if matches >= 3:
-                            self._mark_matched_cells(row + 1, col - 1, _DOWN_LEFT, matches)
-
-                        if _is_matchable_state(state):
-                            gem = contents
-                            matches = 1
-                        else:
-                            gem = _NONE
-                            matches = 1
-
-                    rowCounter += 1
-                    colCounter += 1
-
-                    if currentRow-rowCounter < 0 or currentCol+colCounter >= self.get_columns():
+        # Now we go through the lines that changed since the last pass and flag all the matching cells
+        self._match_lines()
+
+        if self._matchedCells and self._events is not None:
+            self._events.append((EVENT_MATCHED, tuple(self._matchedCells)))
+
+    def _clear_matched(self) -> None:
+        """
+        Empties the cells that were marked as matched by the last matching pass
+        """
+        matchedCells = self._matchedCells
+        self._matchedCells = []
+        cleared = []
+        for index in matchedCells:
+            # A matched cell can have been overwritten by the faller since it was marked
+            if self._cells[index] & _STATE_MASK == _MATCHED_CODE:
+                self._write(index, _EMPTY_CELL_CODE)
+                cleared.append(index)
+
+        if cleared and self._events is not None:
+            self._events.append((EVENT_CLEARED, tuple(cleared)))
+
+    def _match_lines(self) -> None:
+        """
+        Attempts matching along every dirty line (rows, columns and both diagonals) and then marks any of the cells that
+        match (3 or more occurrences).
+        A line that did not change still holds the same runs as last pass. Those runs were marked then and clearing them
+        would have made the line dirty, so an unchanged line can never hold a new match.
+        """
+        cells = self._cells
+        lines = self._lines
+        lineSlices = self._lineSlices
+        dirtyLines = self._dirtyLines
+        self._dirtyLines = set()
+
+        for lineNumber in dirtyLines:
+            # Each run of 3 or more of the same non-zero key in the translated line is a match
+            keys = cells[lineSlices[lineNumber]].translate(_MATCH_KEYS)
+            for run in _MATCH_RUN.finditer(keys):
+                self._mark_matched(lines[lineNumber][run.start():run.end()])
+
+    def _mark_matched(self, run: range) -> None:
+        """
+        Marks every cell of the given run of board indices as a matched cell
+        :param run: The board indices of the cells to mark
+        """
+        cells = self._cells
+        for index in run:
+            code = cells[index]
+            if code & _STATE_MASK != _MATCHED_CODE:
+                self._write(index, (code & ~_STATE_MASK) | _MATCHED_CODE)
+
+    def _mark_all_dirty(self) -> None:
+        """
+        Marks every line of the board as dirty so the next matching pass scans the whole board
+        """
+        self._dirtyLines = set(range(len(self._lines)))
+
+    def _advance(self, ticks: int) -> (bool, int, int):
+        """
+        Ticks the game the given number of time units, or until it is settled if no number is given
+        :param ticks: The number of time units to tick, or None to tick until the game is settled
+        :return: A tuple of: True if the game ended, the number of ticks used, and the number of ticks in which new cells
+        were matched
+        """
+        ticksUsed = 0
+        cascades = 0
+        while ticks is None or ticksUsed < ticks:
+            if self._is_settled():
+                # Nothing happens on a settled board until a faller is spawned
+                if not self._faller.active:
+                    if ticks is not None:
+                        if self._events is not None and ticks > ticksUsed:
+                            self._end_ticks(ticks - ticksUsed)
+                        ticksUsed = ticks
+                    break
+
+                # Nothing but the faller moves until it lands, so it can be dropped there at once
+                if self._faller.state == _FALLER_MOVING:
+                    drop = self._landing_row() - self._faller.get_row()
+                    if ticks is not None:
+                        drop = min(drop, ticks - ticksUsed)
+                    if drop > 0:
+                        self._drop_faller(drop)
+                        ticksUsed += drop
+                        if self._events is not None:
+                            self._end_ticks(drop)
+                        continue
+
+            gameOver = self.tick()
+            ticksUsed += 1
+            # After a tick the matched cells list only holds the cells that were matched in that tick
+            if self._matchedCells:
+                cascades += 1
+            if gameOver:
+                return True, ticksUsed, cascades
+
+        return False, ticksUsed, cascades
+
+    def _rehash(self) -> None:
+        """
+        Computes the hash of the board from scratch
+        """
+        boardHash = 0
+        for index, code in enumerate(self._cells):
+            if code != _EMPTY_CELL_CODE:
+                boardHash ^= _cell_key(index, code)
+        self._hash = boardHash
+        self._hashStale = False
+
+    def _board_hash(self) -> int:
+        """
+        Gets the hash of the board cells, computing it again first if the board scrolled since it was last computed
+        :return: An int that is the hash of the board cells
+        """
+        if self._hashStale:
+            self._rehash()
+        return self._hash
+
+    def _scroll(self, codes: bytes) -> bool:
+        """
+        Moves everything on the board up to make room for the given rows of cell codes at the bottom. The board is one
+        flat bytearray, and deleting from the front of a bytearray only moves its start, so the bytearray works as a
+        ring of rows: the rows that leave at the top and the rows that come in at the bottom are the only ones touched.
+        :param codes: The cell codes of the new rows, row by row from the top
+        :return: True if a jewel was pushed off the top of the board. False otherwise
+        """
+        rows = self._rows
+        columns = self._columns
+        count = len(codes) // columns
+        if count > rows:
+            raise ValueError('Can not scroll more rows than the board has')
+        if count == 0:
+            return False
+
+        if self._events is not None:
+            # Observers move their copy of the board up, the new bottom rows come in the next CELLS event
+            self._flush_changed_cells()
+            self._events.append((EVENT_SCROLLED, count))
+
+        shift = count * columns
+        cells = self._cells
+        pushedOut = any(code & _MATCHABLE_BIT for code in cells[:shift])
+        del cells[:shift]
+        cells.extend(codes)
+        size = len(cells)
+
+        # Every cell has a new index, so the hash is computed again when it is needed
+        self._hashStale = True
+        self._matchedCells = [index - shift for index in self._matchedCells if index >= shift]
+        # Moving a whole board keeps every run of jewels in one line, so only runs through the new rows can be new. The
+        #   lines that were waiting to be scanned moved with the board, so those are all scanned again
+        if self._dirtyLines:
+            self._mark_all_dirty()
+        for index in range(size - shift, size):
+            self._dirtyLines.update(self._cellLines[index])
+
+        stackTops = self._stackTops
+        for col in range(columns):
+            top = stackTops[col] - count
+            if top < 0:
+                # The top of the column was pushed off, the new top is the highest occupied cell that is left
+                top = 0
+                while top < rows and cells[top * columns + col] & _STATE_MASK != _OCCUPIED_CODE:
+                    top += 1
+            elif top == rows - count:
+                # The column was empty, so its top can only be in the new rows
+                while top < rows and cells[top * columns + col] & _STATE_MASK != _OCCUPIED_CODE:
+                    top += 1
+            stackTops[col] = top
+            # Jewels above a hole in the new rows have to fall
+            jewelAbove = top < rows - count
+            for index in range(size - shift + col, size, columns):
+                if cells[index] == _EMPTY_CELL_CODE:
+                    if jewelAbove:
+                        self._fallColumns.add(col)
                         break
+                else:
+                    jewelAbove = True
+
+        faller = self._faller
+        if faller.active:
+            # The faller moves up with the board, but it never leaves the board
+            faller.set_row(max(faller.get_row() - count, 0))
+            self._update_faller_state()
+
+        if self._events is not None:
+            self._changedCells.update(range(size - shift, size))
+            self._flushedFaller = tuple((index - shift, code) for index, code in self._flushedFaller if index >= shift)
+        return pushedOut
+
+    def _is_settled(self) -> bool:
+        """
+        Checks if the board is settled: there are no matched cells to clear, no columns that need gravity and no lines
+        that need matching, so a matching pass would change nothing
+        :return: True if the board is settled. False otherwise
+        """
+        return not self._matchedCells and not self._fallColumns and not self._dirtyLines
+
+    def _flush_changed_cells(self) -> None:
+        """
+        Adds a CELLS event for the cells that changed since the last one, if any did
+        """
+        # The cells the faller covered at the last CELLS event and the ones it covers now have changed if it did
+        fallerCells = self._faller_cells()
+        if fallerCells != self._flushedFaller:
+            self._changedCells.update(index for index, code in self._flushedFaller)
+            self._changedCells.update(index for index, code in fallerCells)
+            self._flushedFaller = fallerCells
+        if self._changedCells:
+            fallerCodes = dict(fallerCells)
+            cells = self._cells
+            self._events.append((EVENT_CELLS, tuple((index, fallerCodes.get(index, cells[index]))
+                                                    for index in sorted(self._changedCells))))
+            self._changedCells.clear()
+
+    def _end_ticks(self, ticks: int) -> None:
+        """
+        Adds the events that close off the given number of ticks: the cells that changed in them and then the TICK event
+        :param ticks: The number of ticks that ended
+        """
+        self._flush_changed_cells()
+        self._events.append((EVENT_TICK, ticks))
+
+    def _landing_row(self) -> int:
+        """
+        Finds the row that the bottom of the faller will come to rest on if nothing else on the board moves
+        :return: The row the bottom of the faller will land on
+        """
+        col = self._faller.get_col()
+        row = self._faller.get_row()
+        # Nothing between the faller and the top of its column is solid
+        if row < self._stackTops[col]:
+            return self._stackTops[col] - 1
+        # The faller can only be at or below the top when it was spawned into a full column
+        while not self._is_solid(row + 1, col):
+            row += 1
+        return row
+
+    def _faller_fits(self, col: int) -> bool:
+        """
+        Checks if the cells of the faller are free in the given column, ignoring the cells above the top of the board.
+        Matched cells block the faller too, so it can never slide under the jewels stacked on top of them.
+        :param col: The column to check
+        :return: True if all of the cells the faller would take up in that column are empty. False otherwise
+        """
+        row = self._faller.get_row()
+        for i in range(3):
+            # If the check is going to check a row that is above the top, then we are clear to move the faller
+            if row - i < 0:
+                break
+
+            if self._get_cell(row - i, col) != _EMPTY_CELL_CODE:
+                return False
+        return True
+
+    def _drop_faller(self, rows: int) -> None:
+        """
+        Moves the faller down the given number of rows at once. The rows below the faller must not be solid.
+        :param rows: The number of rows to move the faller down
+        """
+        self._faller.set_row(self._faller.get_row() + rows)
+        self._update_faller_state()
+        if self._events is not None:
+            self._events.append((EVENT_FALLER_MOVED, self._faller.get_row(), self._faller.get_col()))
 
-    def _mark_matched_cells(self, row: int, col: int, direction: int, amount: int) -> None:
+    def _tick_faller(self) -> bool:
         """
-        Marks the given number of cells in the given direction as matching cells
-        :param row: The row of the starting cell
-        :param col: The column of the starting cell
-        :param direction: The direction to mark cells in
-        :param amount: The amount of cells (start cell included) to mark as matching
+        Moves the faller down one row, or freezes it if it was stopped for a whole tick and is still on solid ground
+        :return: True if the faller froze with part of it above the top of the game board. False otherwise
         """
-        if direction == LEFT:
-            for targetCol in range(col, col - amount, -1):
-                self._set_cell_state(row, targetCol, MATCHED_CELL)
-        elif direction == _DOWN:
-            for targetRow in range(row, row + amount):
-                self._set_cell_state(targetRow, col, MATCHED_CELL)
-        elif direction == _DOWN_LEFT:
-            for i in range(amount):
-                self._set_cell_state(row + i, col - i, MATCHED_CELL)
+        if self._faller.active:
+            # If the faller had stopped last tick then check if it is still on solid ground
+            if self._faller.state == _FALLER_STOPPED:
+                # Do an update on the faller state to see what state it is now in
+                self._update_faller_state()
+                # If the faller is still stopped after the update then solidify it
+                if self._faller.state == _FALLER_STOPPED:
+                    # Set a value for is part of this faller is solidified above the top of the game board
+                    value = False
+                    # If part of the faller is above the top of the game board then set the value to true
+                    if self._faller.get_row() - 2 < 0:
+                        value = True
+
+                    # If all of the faller is in play then we solidify it
+                    for i in range(3):
+                        self._set_cell(self._faller.get_row() - i, self._faller.get_col(),
+                                       _cell_code(self._faller.contents[i], _OCCUPIED_CODE))
+                    self._faller.active = False
+                    if self._events is not None:
+                        self._events.append((EVENT_FROZEN, self._faller.get_row(), self._faller.get_col()))
+
+                    # The game ends if part of this faller was solidified above the top of the game board
+                    return value
+
+            # If we get here then the faller isnt on solid ground for sure so move it down
+            self._move_faller_down()
+            # Update the faller now so it is in the correct state
+            self._update_faller_state()
+            if self._events is not None:
+                self._events.append((EVENT_FALLER_MOVED, self._faller.get_row(), self._faller.get_col()))
+        return False
 
     def _update_faller_state(self) -> None:
         """
         Updates the state of the faller according to its current conditions.
         If the faller has ground below it then the state is set to FALLER_STOPPED.
         Otherwise the state is set to FALLER_MOVING.
-        The cells of the faller on the board are updated accordingly.
         """
-        state = None
         targetRow = self._faller.get_row() + 1
         if self._is_solid(targetRow, self._faller.get_col()):
-            state = FALLER_STOPPED_CELL
             self._faller.state = _FALLER_STOPPED
         else:
-            state = FALLER_MOVING_CELL
             self._faller.state = _FALLER_MOVING
 
-        for i in range(3):
-            row = self._faller.get_row() - i
-            if row < 0:
-                return
-            self._set_cell(row, self._faller.get_col(), self._faller.contents[i], state)
-
     def _is_solid(self, row: int, col: int) -> bool:
         """
         Checks if the the cell of the given row and column is solid (a solid block or the bottom row)
@@ -462,7 +1306,11 @@ class GameState:
         if row >= self.get_rows():
             return True
 
-        if self.get_cell_state(row, col) == OCCUPIED_CELL:
+        # Nothing above the top of a column is solid
+        if row < self._stackTops[col]:
+            return False
+
+        if self._get_cell(row, col) & _STATE_MASK == _OCCUPIED_CODE:
             return True
 
         return False
@@ -475,50 +1323,124 @@ class GameState:
         if self._is_solid(self._faller.get_row() + 1, self._faller.get_col()):
             return
 
-        # Move the bottom of the faller down
-        self._move_cell(self._faller.get_row(), self._faller.get_col(), _DOWN)
-        # If the middle of the faller is in play then move it down
-        if self._faller.get_row() - 1 >= 0:
-            self._move_cell(self._faller.get_row() - 1, self._faller.get_col(), _DOWN)
-            # If the top of the faller is in play then move it down
-            if self._faller.get_row() - 2 >= 0:
-                self._move_cell(self._faller.get_row() - 2, self._faller.get_col(), _DOWN)
-            else:  # If the top of the faller wasnt in play then we set its location to be where the middle was
-                self._set_cell(self._faller.get_row() - 1, self._faller.get_col(), self._faller.contents[2],
-                               FALLER_MOVING_CELL)
-        else:  # If the middle wasnt in play then spawn it where the fallers location was
-            self._set_cell(self._faller.get_row(), self._faller.get_col(), self._faller.contents[1], FALLER_MOVING_CELL)
-
         self._faller.set_row(self._faller.get_row() + 1)
 
-    def _move_cell(self, row: int, col: int, direction: int) -> None:
-        """
-        Moves the given cell in the given direction
-        :param row: The row of the cell to move
-        :param col: The column of the cell to move
-        :param direction: The direction to move the cell in (LEFT, RIGHT, DOWN)
-        """
-        oldValue = self._boardRows[row][col]
-        oldState = self._boardStates[row][col]
 
-        self._boardRows[row][col] = EMPTY
-        self._boardStates[row][col] = EMPTY_CELL
+_FALLER_STOPPED = 0
+_FALLER_MOVING = 1
 
-        if direction == _DOWN:
-            targetRow = row + 1
-            self._boardRows[targetRow][col] = oldValue
-            self._boardStates[targetRow][col] = oldState
-        else:
-            targetCol = col + direction
-            self._boardRows[row][targetCol] = oldValue
-            self._boardStates[row][targetCol] = oldState
 
+class _ProfiledGameState(GameState):
+    # The same slots as GameState, so enable_profiling() can switch the class of a game back and forth
+    __slots__ = ()
 
-_FALLER_STOPPED = 0
-_FALLER_MOVING = 1
+    def tick(self) -> bool:
+        start = time.perf_counter_ns()
+        gameOver = super().tick()
+        self._add_profile(PHASE_TICK, 0, time.perf_counter_ns() - start)
+        return gameOver
+
+    def _tick_faller(self) -> bool:
+        active = self._faller.active
+        start = time.perf_counter_ns()
+        gameOver = super()._tick_faller()
+        self._add_profile(PHASE_FALLER, 3 if active else 0, time.perf_counter_ns() - start)
+        return gameOver
+
+    def _drop_faller(self, rows: int) -> None:
+        start = time.perf_counter_ns()
+        super()._drop_faller(rows)
+        self._add_profile(PHASE_FALLER, 3, time.perf_counter_ns() - start)
+
+    def _matching(self) -> None:
+        start = time.perf_counter_ns()
+        super()._matching()
+        self._add_profile(PHASE_MATCHING, 0, time.perf_counter_ns() - start)
+
+    def _clear_matched(self) -> None:
+        cells = len(self._matchedCells)
+        start = time.perf_counter_ns()
+        super()._clear_matched()
+        self._add_profile(PHASE_CLEAR, cells, time.perf_counter_ns() - start)
+
+    def _gem_gravity(self) -> [(int, int)]:
+        cells = len(self._fallColumns) * self._rows
+        start = time.perf_counter_ns()
+        moves = super()._gem_gravity()
+        self._add_profile(PHASE_GRAVITY, cells, time.perf_counter_ns() - start)
+        return moves
+
+    def _match_lines(self) -> None:
+        """
+        The same scan as GameState._match_lines(), with the dirty lines grouped by direction so each direction is timed
+        """
+        columns = self._columns
+        cells = self._cells
+        lines = self._lines
+        lineSlices = self._lineSlices
+        dirtyLines = self._dirtyLines
+        self._dirtyLines = set()
+
+        # The direction of a line follows from its step. Columns are checked first, so a board 1 column wide works too
+        groups = {PHASE_SCAN_ROWS: [], PHASE_SCAN_COLUMNS: [], PHASE_SCAN_UP_DIAGONALS: [],
+                  PHASE_SCAN_DOWN_DIAGONALS: []}
+        for lineNumber in dirtyLines:
+            step = lines[lineNumber].step
+            if step == columns:
+                groups[PHASE_SCAN_COLUMNS].append(lineNumber)
+            elif step == 1:
+                groups[PHASE_SCAN_ROWS].append(lineNumber)
+            elif step == 1 - columns:
+                groups[PHASE_SCAN_UP_DIAGONALS].append(lineNumber)
+            else:
+                groups[PHASE_SCAN_DOWN_DIAGONALS].append(lineNumber)
+
+        for phase, lineNumbers in groups.items():
+            if not lineNumbers:
+                continue
+            visited = 0
+            start = time.perf_counter_ns()
+            for lineNumber in lineNumbers:
+                keys = cells[lineSlices[lineNumber]].translate(_MATCH_KEYS)
+                visited += len(keys)
+                for run in _MATCH_RUN.finditer(keys):
+                    self._mark_matched(lines[lineNumber][run.start():run.end()])
+            self._add_profile(phase, visited, time.perf_counter_ns() - start)
+
+    def _add_profile(self, phase: str, cells: int, ns: int) -> None:
+        """
+        Adds one call of a phase to the profile
+        :param phase: The phase that was called
+        :param cells: The number of cells the call visited
+        :param ns: The number of nanoseconds the call took
+        """
+        numbers = self._profile[phase]
+        numbers[0] += 1
+        numbers[1] += cells
+        numbers[2] += ns
+
+
+def format_profile(stats: {str: {str: int}}) -> str:
+    """
+    Formats the numbers from GameState.stats() as a flat profile: one line per phase, the slowest first
+    :param stats: The numbers from GameState.stats()
+    :return: The text of the profile
+    """
+    tickNs = stats.get(PHASE_TICK, {}).get('ns', 0)
+    lines = ['{:<20} {:>10} {:>12} {:>12} {:>10} {:>9} {:>7}'.format('phase', 'calls', 'cells', 'total ms', 'us/call',
+                                                                   'ns/cell', '% tick')]
+    for phase in sorted(stats, key=lambda phase: -stats[phase]['ns']):
+        calls, cells, ns = stats[phase]['calls'], stats[phase]['cells'], stats[phase]['ns']
+        lines.append('{:<20} {:>10} {:>12} {:>12.3f} {:>10.2f} {:>9} {:>7}'.format(
+            phase, calls, cells, ns / 1e6, ns / calls / 1e3 if calls else 0.0,
+            '{:.1f}'.format(ns / cells) if cells else '-',
+            '{:.1f}'.format(ns * 100 / tickNs) if tickNs and phase != PHASE_TICK else '-'))
+    return '\n'.join(lines) + '\n'
 
 
 class _Faller:
+    __slots__ = ('active', '_row', '_col', 'contents', 'state')
+
     def __init__(self):
         """
         Constructs a new faller object and initializes all the values
@@ -526,7 +1448,8 @@ class _Faller:
         self.active = False
         self._row = 0
         self._col = 0
-        self.contents = [EMPTY, EMPTY, EMPTY]
+        # The jewel codes of the faller from the bottom block to the top block
+        self.contents = [_EMPTY_CODE, _EMPTY_CODE, _EMPTY_CODE]
         self.state = _FALLER_MOVING
 
     def get_row(self) -> int:
@@ -556,3 +1479,134 @@ class _Faller:
         :param col: The column value that this faller will be set to
         """
         self._col = col
+
+    def to_tuple(self) -> (bool, int, int, (int, int, int), int):
+        """
+        Gets every value of this faller as an immutable tuple
+        :return: A tuple of the active flag, row, column, contents and state of this faller
+        """
+        return self.active, self._row, self._col, tuple(self.contents), self.state
+
+    def from_tuple(self, values: (bool, int, int, (int, int, int), int)) -> None:
+        """
+        Sets every value of this faller from a tuple made by to_tuple()
+        :param values: A tuple of the active flag, row, column, contents and state of a faller
+        """
+        self.active, self._row, self._col, contents, self.state = values
+        self.contents = list(contents)
+
+
+def from_bytes(data: bytes) -> GameState:
+    """
+    Loads a game that was encoded with GameState.to_bytes()
+    :param data: The encoded game
+    :return: A new GameState that plays exactly like the game that was encoded
+    """
+    rows, columns, jewelCount = struct.unpack_from('<IIB', data, 0)
+    offset = struct.calcsize('<IIB')
+
+    # Map the jewel numbers of the encoding back to the jewel codes of this process
+    names = [EMPTY]
+    for i in range(jewelCount):
+        name, offset = _unpack_name(data, offset)
+        names.append(name)
+    jewels = _jewel_codes(names)
+    table = bytes(_cell_code(jewels[code >> _STATE_BITS] if code >> _STATE_BITS < len(jewels) else 0,
+                             code & _STATE_MASK) for code in range(256))
+
+    # The faller is never part of the board, it is loaded on its own below
+    board = data[offset:offset + rows * columns]
+    if len(board.translate(None, _FALLER_CODES)) != len(board):
+        raise ValueError('The encoded board has faller cells in it')
+    state = GameState(rows, columns)
+    state._cells[:] = board.translate(table)
+    offset += rows * columns
+
+    active, row, col, first, second, third, fallerState = struct.unpack_from('<?iiBBBB', data, offset)
+    offset += struct.calcsize('<?iiBBBB')
+    state._faller.from_tuple((active, row, col, (jewels[first], jewels[second], jewels[third]), fallerState))
+
+    matchedCount = struct.unpack_from('<I', data, offset)[0]
+    offset += 4
+    state._matchedCells = list(struct.unpack_from('<' + 'I' * matchedCount, data, offset))
+
+    # Which lines and columns still needed work is not stored. Scanning all of them again finds nothing that the
+    #   original game would not have found, so the loaded game plays the same
+    state._rehash()
+    state._find_stack_tops()
+    state._mark_all_dirty()
+    state._fallColumns = set(range(columns))
+    return state
+
+
+class TranspositionTable:
+    def __init__(self, capacity: int):
+        """
+        Constructs a new TranspositionTable that caches values by position hash (see GameState.get_hash).
+        When the table is full the least recently used entry is dropped.
+        :param capacity: The greatest number of entries the table will hold
+        """
+        if capacity < 1:
+            raise ValueError('The capacity of a transposition table must be at least 1')
+        self._capacity = capacity
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: int, default=None):
+        """
+        Gets the value stored for the given key and marks it as the most recently used entry
+        :param key: The hash of the position
+        :param default: The value that is returned if nothing is stored for the key
+        :return: The value that is stored for the key or the given default
+        """
+        value = self._entries.get(key, _MISSING)
+        if value is _MISSING:
+            self._misses += 1
+            return default
+        self._hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: int, value) -> None:
+        """
+        Stores the given value for the given key, dropping the least recently used entry if the table is full
+        :param key: The hash of the position
+        :param value: The value to store
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Removes every entry from this table
+        """
+        self._entries.clear()
+        self._hits = 0
+        self._misses = 0
+
+    def get_hits(self) -> int:
+        """
+        Gets the number of calls to get() that found a value
+        :return: An int that is the number of hits
+        """
+        return self._hits
+
+    def get_misses(self) -> int:
+        """
+        Gets the number of calls to get() that did not find a value
+        :return: An int that is the number of misses
+        """
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._entries
+
+
+# Marks a missing entry in a TranspositionTable, so None can be stored as a value
+_MISSING = object()
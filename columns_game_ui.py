@@ -1,13 +1,53 @@
+import collections
 import columns_game as game
+import columns_replay as replay
+import heapq
 import pygame
 import random
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 _ROWS = 13
 _COLS = 6
-_FPS = 12
+
+# Game ticks per second and the most frames drawn per second (0 for no limit). The two run independently of each other
+_TICK_RATE = 1.0
+_MAX_FPS = 60
+
+# How long a move key has to be held before it repeats, and the time between repeats after that, in seconds
+_REPEAT_DELAY = 0.17
+_REPEAT_INTERVAL = 0.05
+
+# Actions that keys perform. Moves repeat while their key is held, a rotation happens once per press
+_ACTION_LEFT = 'LEFT'
+_ACTION_RIGHT = 'RIGHT'
+_ACTION_ROTATE = 'ROTATE'
+_KEY_ACTIONS = {pygame.K_LEFT: _ACTION_LEFT, pygame.K_RIGHT: _ACTION_RIGHT, pygame.K_SPACE: _ACTION_ROTATE}
+_REPEATING_ACTIONS = {_ACTION_LEFT, _ACTION_RIGHT}
+
+# After a stall (a slow frame, the window being dragged) at most this much time is caught up on. Anything longer is
+#   dropped instead of running a burst of ticks
+_MAX_CATCH_UP = 0.25
+
+# The number of seconds that the frame and tick pacing is measured over
+_PACING_WINDOW = 1.0
+
+_CAPTION = 'Columns'
 
 _JEWELS = ['S', 'T', 'V', 'W', 'X', 'Y', 'Z']
 
+# Marks a cell whose image has not been rendered yet. None is the image of an empty cell
+_MISSING_SPRITE = object()
+
+# The ways the board can be drawn: every cell blitted from a sprite, or the whole board as one image with a pixel per
+#   cell scaled up to the board area (needs numpy, for very large boards)
+RENDER_SPRITES = 'sprites'
+RENDER_IMAGE = 'image'
+
 
 def _get_jewel_color(jewel: str) -> (int, int, int):
     """
@@ -33,15 +73,41 @@ def _get_jewel_color(jewel: str) -> (int, int, int):
 
 class Game:
 
-    def __init__(self):
+    def __init__(self, recordPath: str = None, rows: int = _ROWS, columns: int = _COLS,
+                 renderMode: str = RENDER_SPRITES, tickRate: float = _TICK_RATE, maxFps: int = _MAX_FPS,
+                 vsync: bool = False, repeatDelay: float = _REPEAT_DELAY, repeatInterval: float = _REPEAT_INTERVAL):
         """
         Constructs a new instance of the Game class and initializes all fields to their default values
+        :param recordPath: The path of the file to record a replay of the game in, or None to not record it
+        :param rows: The number of rows of the board
+        :param columns: The number of columns of the board
+        :param renderMode: How the board is drawn, RENDER_SPRITES or RENDER_IMAGE
+        :param tickRate: The number of game ticks per second, no matter how fast frames are drawn
+        :param maxFps: The most frames drawn per second, or 0 for no limit
+        :param vsync: True to wait for the display's refresh when a frame is shown, if the display supports it
+        :param repeatDelay: The number of seconds a move key has to be held before it starts repeating
+        :param repeatInterval: The number of seconds between repeats of a held move key
         """
-        self._state = game.GameState(_ROWS, _COLS)
-
-        self._tick_counter = _FPS
+        if renderMode == RENDER_IMAGE and numpy is None:
+            raise ValueError('The image render mode needs numpy')
+        self._state = game.GameState(rows, columns)
+        # Frames only draw the cells that the change events of the game say have changed
+        self._state.enable_events()
+        self._renderMode = renderMode
+
+        self._recordPath = recordPath
+        self._recorder = None
+
+        self._tickStep = 1.0 / tickRate
+        self._inputQueue = _InputQueue(repeatDelay, repeatInterval)
+        self._maxFps = maxFps
+        self._vsync = vsync
         self._running = True
 
+        # The measured pacing of drawn frames and of game ticks
+        self._framePacing = _PacingMeter(_PACING_WINDOW)
+        self._tickPacing = _PacingMeter(_PACING_WINDOW)
+
         # Black
         self._backgroundColor = pygame.Color(0, 0, 0)
         # Brown
@@ -52,86 +118,161 @@ class Game:
         self._jewelSize = (1.0 - self._jewelBufferY) / self._state.get_rows()
         self._jewelBufferX = (1.0 - (self._jewelSize * self._state.get_columns()))
 
+        # True if the whole window has to be drawn again on the next frame
+        self._redrawAll = True
+
     def start_game(self) -> None:
         """
         Starts the game loop and displays the game's graphics.
         """
         pygame.init()
+        recordFile = None
 
         try:
+            if self._recordPath is not None:
+                recordFile = open(self._recordPath, 'wb')
+                self._recorder = replay.ReplayRecorder(recordFile, self._state)
+
             clock = pygame.time.Clock()
 
             self._create_surface((600, 600))
 
-            while self._running:
-                clock.tick(_FPS)
+            # The time the next game tick is due. Ticks and key actions are applied in the order of their times, so
+            #   input does not wait for the next frame to take effect relative to the ticks
+            nextTickTime = time.perf_counter() + self._tickStep
+            nextCaptionTime = time.perf_counter() + _PACING_WINDOW
 
-                self._handle_events()
+            while self._running:
+                now = time.perf_counter()
+                if now - nextTickTime > _MAX_CATCH_UP:
+                    nextTickTime = now - _MAX_CATCH_UP
+                    self._inputQueue.skip_repeats(nextTickTime)
 
-                self._tick_counter -= 1
+                self._handle_events(now)
 
-                if self._tick_counter == 0:
+                # A dropped frame is made up for by running every tick that was missed
+                while nextTickTime <= now and self._running:
+                    self._apply_input(nextTickTime)
                     self._tick_game()
-                    self._tick_counter = _FPS
+                    self._tickPacing.mark(time.perf_counter())
+                    nextTickTime += self._tickStep
+                self._apply_input(now)
 
                 self._draw_frame()
+                self._framePacing.mark(time.perf_counter())
+
+                if now >= nextCaptionTime:
+                    nextCaptionTime = now + _PACING_WINDOW
+                    self._show_pacing()
+
+                clock.tick(self._maxFps)
 
         finally:
+            if recordFile is not None:
+                self._recorder.close()
+                recordFile.close()
+                self._recorder = None
             pygame.quit()
 
+    def get_pacing(self) -> (float, float, float, float):
+        """
+        Gets the measured pacing of the game over the last second
+        :return: A tuple of the frames drawn per second, the longest time between two frames in seconds, the game ticks
+        per second and the longest time between two ticks in seconds
+        """
+        return (self._framePacing.get_rate(), self._framePacing.get_longest_interval(),
+                self._tickPacing.get_rate(), self._tickPacing.get_longest_interval())
+
+    def _show_pacing(self) -> None:
+        """
+        Shows the measured pacing in the window caption
+        """
+        fps, frameTime, tps, tickTime = self.get_pacing()
+        pygame.display.set_caption('{} - {:.1f} FPS (worst {:.1f} ms), {:.2f} ticks/s (worst {:.0f} ms)'.format(
+            _CAPTION, fps, frameTime * 1000, tps, tickTime * 1000))
+
     def _tick_game(self) -> None:
         """
         Ticks the game's state (ticks matching, falling, etc.). Spawns a faller if one is not already on the board.
         """
         self._running = not self._state.tick()
+        if self._recorder is not None:
+            self._recorder.record_tick()
 
         if not self._state.has_faller():
             contents = random.sample(_JEWELS, 3)
-            column = random.randint(1, _COLS)
+            column = random.randint(1, self._state.get_columns())
             self._state.spawn_faller(column, contents)
+            if self._recorder is not None:
+                self._recorder.record_spawn(column, contents)
 
     def _create_surface(self, size: (int, int)) -> None:
         """
         Creates the surface that we will draw the game board on
         :param size: The size of the game board. A tuple where the 1st value is the width and the 2nd value is the height
         """
-        self._surface = pygame.display.set_mode(size, pygame.RESIZABLE)
-
-    def _handle_events(self) -> None:
+        self._surface = None
+        if self._vsync:
+            try:
+                self._surface = pygame.display.set_mode(size, pygame.RESIZABLE, vsync=1)
+            except pygame.error:
+                # Not every display driver can wait for the refresh, the frame limit still applies
+                pass
+        if self._surface is None:
+            self._surface = pygame.display.set_mode(size, pygame.RESIZABLE)
+        self._update_geometry()
+        self._redrawAll = True
+
+    def _handle_events(self, now: float) -> None:
         """
         Handles events from pygame by dispatching them to the correct method. This includes key press events.
+        :param now: The time the events are read at, from time.perf_counter()
         """
         for event in pygame.event.get():
-            self._handle_event(event)
+            self._handle_event(event, now)
 
-        self._handle_keys()
-
-    def _handle_event(self, event: pygame.event.EventType) -> None:
+    def _handle_event(self, event: pygame.event.EventType, now: float) -> None:
         """
-        Handles the pygame.QUIT event and the pygame.VIDEORESIZE event
-        :param event: The event that we want to handle. Nothing will happen unless this is QUIT or VIDEORESIZE
+        Handles the pygame.QUIT, pygame.VIDEORESIZE, pygame.VIDEOEXPOSE, pygame.WINDOWFOCUSLOST, pygame.KEYDOWN and
+        pygame.KEYUP events
+        :param event: The event that we want to handle. Nothing will happen unless it is one of the events above
+        :param now: The time the event was read at, from time.perf_counter()
         """
         if event.type == pygame.QUIT:
             self._stop_running()
         elif event.type == pygame.VIDEORESIZE:
             self._create_surface(event.size)
-
-    def _handle_keys(self) -> None:
+        elif event.type == pygame.VIDEOEXPOSE:
+            # The window has to be drawn again after it was covered
+            self._redrawAll = True
+        elif event.type == pygame.WINDOWFOCUSLOST:
+            # The key up events of keys released outside the window never arrive
+            self._inputQueue.release_all()
+        elif event.type == pygame.KEYDOWN and event.key in _KEY_ACTIONS:
+            self._inputQueue.press(_KEY_ACTIONS[event.key], now)
+        elif event.type == pygame.KEYUP and event.key in _KEY_ACTIONS:
+            self._inputQueue.release(_KEY_ACTIONS[event.key])
+
+    def _apply_input(self, until: float) -> None:
         """
-        Handles key press events by taking the correct action based on the key that is pressed
-        Fallers will be moved by handling the Left or Right arrow keys.
-        Fallers will be rotated by handling the Spacebar.
+        Performs the key actions that are due up to the given time, in the order they happened.
+        Fallers will be moved by the Left or Right arrow keys, which repeat while they are held.
+        Fallers will be rotated by the Spacebar.
+        :param until: The time to perform the actions up to, from time.perf_counter()
         """
-        keys = pygame.key.get_pressed()
-
-        if keys[pygame.K_LEFT]:
-            self._state.move_faller_side(game.LEFT)
-
-        if keys[pygame.K_RIGHT]:
-            self._state.move_faller_side(game.RIGHT)
-
-        if keys[pygame.K_SPACE]:
-            self._state.rotate_faller()
+        for action in self._inputQueue.pop_until(until):
+            if action == _ACTION_LEFT:
+                self._state.move_faller_side(game.LEFT)
+                if self._recorder is not None:
+                    self._recorder.record_move(game.LEFT)
+            elif action == _ACTION_RIGHT:
+                self._state.move_faller_side(game.RIGHT)
+                if self._recorder is not None:
+                    self._recorder.record_move(game.RIGHT)
+            elif action == _ACTION_ROTATE:
+                self._state.rotate_faller()
+                if self._recorder is not None:
+                    self._recorder.record_rotate()
 
     def _stop_running(self) -> None:
         """
@@ -143,70 +284,182 @@ class Game:
 
     def _draw_frame(self) -> None:
         """
-        Draws a frame of the game. This draws every aspect of the current game state. (background, jewels, states, etc.)
+        Draws a frame of the game. The first frame and the first frame after the window changed draw every aspect of the
+        current game state (background, jewels, states, etc.). Other frames only draw the cells that changed since the
+        last frame and only push those areas to the screen.
         """
-        self._surface.fill(self._backgroundColor)
-        self._draw_game_objects()
-        pygame.display.flip()
+        events = self._state.drain_events()
+        if self._redrawAll or any(event[0] in (game.EVENT_RESET, game.EVENT_SCROLLED) for event in events):
+            self._surface.fill(self._backgroundColor)
+            self._draw_game_objects(self._state.get_cell_codes())
+            pygame.display.flip()
+            self._redrawAll = False
+            return
 
-    def _draw_game_objects(self) -> None:
+        # The latest code of every cell that changed since the last frame
+        changedCells = {}
+        for event in events:
+            if event[0] == game.EVENT_CELLS:
+                changedCells.update(event[1])
+        if not changedCells:
+            return
+
+        if self._renderMode == RENDER_IMAGE:
+            pygame.display.update(self._draw_board_image(self._state.get_cell_codes()))
+        else:
+            pygame.display.update([self._redraw_cell(index, code) for index, code in changedCells.items()])
+
+    def _draw_game_objects(self, codes: bytes) -> None:
         """
         Draws all of the game objects and their states onto the drawing surface.
         This draws the game box in its given color and then draws each of the individual jewels
-        :return:
+        :param codes: The cell codes of the board from GameState.get_cell_codes()
         """
-        topLeftX = self._frac_x_to_pixel_x((self._jewelBufferX / 2))
-        topLeftY = self._frac_y_to_pixel_y((self._jewelBufferY / 2))
-
-        width = self._frac_x_to_pixel_x((self._jewelSize * self._state.get_columns()) - 0.001)
-        height = self._frac_y_to_pixel_y((self._jewelSize * self._state.get_rows()))
-
         # Draw the outline box for the game
-        outlineRect = pygame.Rect(topLeftX, topLeftY, width, height)
-        pygame.draw.rect(self._surface, self._boxColor, outlineRect, 0)
+        pygame.draw.rect(self._surface, self._boxColor, self._outlineRect, 0)
+
+        if self._renderMode == RENDER_IMAGE:
+            self._draw_board_image(codes)
+            return
 
         # Draw each of the individual jewels
-        for row in range(self._state.get_rows()):
-            for col in range(self._state.get_columns()):
-                self._draw_jewel(row, col)
+        blits = []
+        for rect, code in zip(self._cellRects, codes):
+            sprite = self._get_sprite(code)
+            if sprite is not None:
+                blits.append((sprite, rect))
+        self._surface.blits(blits, False)
+
+    def _redraw_cell(self, index: int, code: int) -> pygame.Rect:
+        """
+        Clears a cell back to the background and the game box and draws its jewel again
+        :param index: The index of the cell, row * columns + col
+        :param code: The cell code of the cell
+        :return: The area of the surface that was drawn
+        """
+        rect = self._cellRects[index]
+        self._surface.fill(self._backgroundColor, rect)
+        self._surface.fill(self._boxColor, rect.clip(self._outlineRect))
+        sprite = self._get_sprite(code)
+        if sprite is not None:
+            self._surface.blit(sprite, rect)
+        return rect
+
+    def _get_sprite(self, code: int) -> pygame.Surface:
+        """
+        Gets the pre-rendered image of a cell, rendering it the first time it is needed at the current size
+        :param code: The cell code of the cell
+        :return: The image of the cell, or None if the cell is empty
+        """
+        sprite = self._sprites.get(code, _MISSING_SPRITE)
+        if sprite is _MISSING_SPRITE:
+            sprite = self._render_sprite(code)
+            self._sprites[code] = sprite
+        return sprite
 
-    def _draw_jewel(self, row: int, col: int) -> None:
+    def _render_sprite(self, code: int) -> pygame.Surface:
         """
-        This draws a specified jewel and its current state onto the drawing surface.
-        If the jewel is EMPTY then nothing will be drawn.
+        Renders the image of a cell.
+        If the jewel is EMPTY then there is no image.
         If the jewel is in a cell that has been matched, the jewel will be drawn in WHITE.
         If the jewel is not in a matched cell then it will be drawn with its jewel-specific color.
         If the jewel is currently part of a faller that is about to freeze, it will be drawn with a WHITE outline.
-        :param row: The row of the jewel to draw
-        :param col: The column of the jewel to draw
+        :param code: The cell code of the cell
+        :return: The image of the cell, or None if the cell is empty
         """
-        jewel = self._state.get_cell_contents(row, col)
+        state, jewel = game.decode_cell(code)
         if jewel is game.EMPTY:
-            return
+            return None
 
-        rawColor = None
-        state = self._state.get_cell_state(row, col)
         if state == game.MATCHED_CELL:
             rawColor = (255, 255, 255)
         else:
             rawColor = _get_jewel_color(jewel)
-        color = pygame.Color(rawColor[0], rawColor[1], rawColor[2])
 
-        jewelX = (col * self._jewelSize) + (self._jewelBufferX / 2)
-        jewelY = (row * self._jewelSize) + (self._jewelBufferY / 2)
+        sprite = pygame.Surface(self._cellSize)
+        sprite.fill(pygame.Color(rawColor[0], rawColor[1], rawColor[2]))
+        if state == game.FALLER_STOPPED_CELL:
+            pygame.draw.rect(sprite, pygame.Color(255, 255, 255), sprite.get_rect(), 2)
+        return sprite.convert(self._surface)
+
+    def _draw_board_image(self, codes: bytes) -> pygame.Rect:
+        """
+        Draws the whole board as one image: every cell is one pixel whose palette index is its cell code, and the image
+        is scaled up to the board area. The white outlines of a stopped faller are drawn on top.
+        :param codes: The cell codes of the board from GameState.get_cell_codes()
+        :return: The area of the surface that was drawn
+        """
+        self._update_palette(codes)
+
+        # surfarray indexes pixels by x then y
+        cells = numpy.frombuffer(codes, dtype=numpy.uint8).reshape(self._state.get_rows(), self._state.get_columns())
+        pygame.surfarray.blit_array(self._boardImage, cells.T)
+        pygame.transform.scale(self._boardImage, self._boardRect.size, self._boardScaled)
+        self._surface.blit(self._boardScaled, self._boardRect)
+
+        outlined = codes.translate(self._outlineTable)
+        index = outlined.find(1)
+        while index >= 0:
+            pygame.draw.rect(self._surface, pygame.Color(255, 255, 255), self._cellRects[index], 2)
+            index = outlined.find(1, index + 1)
+        return self._boardRect
+
+    def _update_palette(self, codes: bytes) -> None:
+        """
+        Gives the cell codes that are not in the palette of the board image yet their colors
+        :param codes: The cell codes of the board from GameState.get_cell_codes()
+        """
+        newCodes = codes.translate(None, self._paletteCodes)
+        if not newCodes:
+            return
+
+        outlineTable = bytearray(self._outlineTable)
+        for code in set(newCodes):
+            state, jewel = game.decode_cell(code)
+            if jewel is game.EMPTY:
+                color = self._boxColor
+            elif state == game.MATCHED_CELL:
+                color = (255, 255, 255)
+            else:
+                color = _get_jewel_color(jewel)
+            self._boardImage.set_palette_at(code, color[:3])
+            self._boardScaled.set_palette_at(code, color[:3])
+            outlineTable[code] = state == game.FALLER_STOPPED_CELL
+            self._paletteCodes.append(code)
+        self._outlineTable = bytes(outlineTable)
+
+    def _update_geometry(self) -> None:
+        """
+        Works out the pixel areas of the game box and of every cell for the current size of the surface, and throws away
+        the images rendered for the old size
+        """
+        topLeftX = self._frac_x_to_pixel_x((self._jewelBufferX / 2))
+        topLeftY = self._frac_y_to_pixel_y((self._jewelBufferY / 2))
 
-        topLeftX = self._frac_x_to_pixel_x(jewelX)
-        topLeftY = self._frac_y_to_pixel_y(jewelY)
+        width = self._frac_x_to_pixel_x((self._jewelSize * self._state.get_columns()) - 0.001)
+        height = self._frac_y_to_pixel_y((self._jewelSize * self._state.get_rows()))
 
-        width = self._frac_x_to_pixel_x(self._jewelSize)
-        height = self._frac_y_to_pixel_y(self._jewelSize)
+        self._outlineRect = pygame.Rect(topLeftX, topLeftY, width, height)
 
-        rect = pygame.Rect(topLeftX, topLeftY, width, height)
+        # Every cell has the same size, only the positions differ
+        self._cellSize = (self._frac_x_to_pixel_x(self._jewelSize), self._frac_y_to_pixel_y(self._jewelSize))
+        cellXs = [self._frac_x_to_pixel_x((col * self._jewelSize) + (self._jewelBufferX / 2))
+                  for col in range(self._state.get_columns())]
+        cellYs = [self._frac_y_to_pixel_y((row * self._jewelSize) + (self._jewelBufferY / 2))
+                  for row in range(self._state.get_rows())]
+        self._cellRects = [pygame.Rect((x, y), self._cellSize) for y in cellYs for x in cellXs]
 
-        pygame.draw.rect(self._surface, color, rect, 0)
+        self._sprites = {}
 
-        if state == game.FALLER_STOPPED_CELL:
-            pygame.draw.rect(self._surface, pygame.Color(255, 255, 255), rect, 2)
+        if self._renderMode == RENDER_IMAGE:
+            # The board image covers every cell, from the top left of the first to the bottom right of the last
+            self._boardRect = self._cellRects[0].union(self._cellRects[-1])
+            # 8 bit images whose palette maps every cell code to its color
+            self._boardImage = pygame.Surface((self._state.get_columns(), self._state.get_rows()), 0, 8)
+            self._boardScaled = pygame.Surface(self._boardRect.size, 0, self._boardImage)
+            # The codes that have a color in the palette, and a table that maps the codes with an outline to 1
+            self._paletteCodes = bytearray()
+            self._outlineTable = bytes(256)
 
     def _frac_x_to_pixel_x(self, frac_x: float) -> int:
         """
@@ -234,6 +487,118 @@ class Game:
         return int(frac * max_pixel)
 
 
+class _InputQueue:
+    def __init__(self, repeatDelay: float, repeatInterval: float):
+        """
+        Constructs a new _InputQueue that holds key actions with the times they happen at, including the repeats of held
+        keys
+        :param repeatDelay: The number of seconds a repeating action has to be held before it repeats
+        :param repeatInterval: The number of seconds between repeats
+        """
+        self._repeatDelay = repeatDelay
+        self._repeatInterval = repeatInterval
+        # A heap of (time, order, action) for the actions that have not been performed yet
+        self._queue = []
+        self._order = 0
+        # The time of the next repeat of each held repeating action
+        self._held = {}
+
+    def press(self, action: str, now: float) -> None:
+        """
+        Adds an action for a key that was pressed. A press is never lost, even if the key is released right away
+        :param action: The action of the key
+        :param now: The time the key was pressed
+        """
+        self._push(now, action)
+        if action in _REPEATING_ACTIONS:
+            self._held[action] = now + self._repeatDelay
+
+    def release(self, action: str) -> None:
+        """
+        Stops the repeats of an action whose key was released
+        :param action: The action of the key
+        """
+        self._held.pop(action, None)
+
+    def release_all(self) -> None:
+        """
+        Stops the repeats of every held key
+        """
+        self._held.clear()
+
+    def skip_repeats(self, until: float) -> None:
+        """
+        Drops the repeats of held keys that were due before the given time, used after the game was stalled
+        :param until: The time to drop repeats before
+        """
+        for action, repeatTime in self._held.items():
+            if repeatTime < until:
+                skipped = int((until - repeatTime) / self._repeatInterval) + 1
+                self._held[action] = repeatTime + skipped * self._repeatInterval
+
+    def pop_until(self, until: float) -> [str]:
+        """
+        Removes and returns the actions that are due up to the given time, including repeats of held keys
+        :param until: The time to return the actions up to
+        :return: A list of the actions in the order they happen
+        """
+        for action, repeatTime in self._held.items():
+            while repeatTime <= until:
+                self._push(repeatTime, action)
+                repeatTime += self._repeatInterval
+            self._held[action] = repeatTime
+
+        actions = []
+        while self._queue and self._queue[0][0] <= until:
+            actions.append(heapq.heappop(self._queue)[2])
+        return actions
+
+    def _push(self, actionTime: float, action: str) -> None:
+        """
+        Adds an action to the queue
+        :param actionTime: The time the action happens
+        :param action: The action
+        """
+        heapq.heappush(self._queue, (actionTime, self._order, action))
+        self._order += 1
+
+
+class _PacingMeter:
+    def __init__(self, window: float):
+        """
+        Constructs a new _PacingMeter that measures how often something happens
+        :param window: The number of seconds the measurements are taken over
+        """
+        self._window = window
+        self._times = collections.deque()
+
+    def mark(self, now: float) -> None:
+        """
+        Records that the thing being measured happened
+        :param now: The time it happened, from time.perf_counter()
+        """
+        self._times.append(now)
+        while now - self._times[0] > self._window:
+            self._times.popleft()
+
+    def get_rate(self) -> float:
+        """
+        Gets how many times per second the thing being measured happened
+        :return: A float that is the rate, 0 if it did not happen at least twice
+        """
+        if len(self._times) < 2 or self._times[-1] == self._times[0]:
+            return 0.0
+        return (len(self._times) - 1) / (self._times[-1] - self._times[0])
+
+    def get_longest_interval(self) -> float:
+        """
+        Gets the longest time between two consecutive times the thing being measured happened
+        :return: A float that is the number of seconds
+        """
+        times = self._times
+        return max((times[i] - times[i - 1] for i in range(1, len(times))), default=0.0)
+
+
 # This makes it so this module is executable
 if __name__ == '__main__':
     Game().start_game()
@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import columns_util as util
+import random
+import re
+import time
+
+# The number of sessions opened, the commands each one sends, and the most sessions that connect at the same time
+_SESSIONS = 1000
+_COMMANDS = 100
+_CONNECT_CONCURRENCY = 256
+
+# The bytes a connection may buffer, raised for boards whose frames do not fit
+_READ_LIMIT = 64 * 1024
+
+_ROWS = 13
+_COLS = 6
+
+_DEFAULT_HOST = '127.0.0.1'
+_DEFAULT_PORT = 4032
+
+_JEWELS = ['S', 'T', 'V', 'W', 'X', 'Y', 'Z']
+
+# The commands sent while a faller is on the board. Most of them are ticks, so the fallers land and match.
+_COMMAND_CHOICES = ['', '', '', '', '<', '>', 'R']
+
+# Matches a frame that has a faller in it: a moving cell [X] or a stopped cell |X|
+_FALLER_PATTERN = re.compile(rb'\[|\|[A-Z]\|')
+
+
+class _Results:
+    def __init__(self):
+        """
+        Constructs a new _Results that collects what every session measured
+        """
+        self.connected = 0
+        self.failed = 0
+        self.dropped = 0
+        self.gamesOver = 0
+        self.commands = 0
+        # The seconds each command took from being sent until its frame came back, or how late each tick frame was
+        self.latencies = []
+
+
+async def _open(host: str, port: int, unixPath: str, limit: int) -> (asyncio.StreamReader, asyncio.StreamWriter):
+    """
+    Opens a connection to the server
+    :param host: The host of the server
+    :param port: The TCP port of the server
+    :param unixPath: The path of the Unix socket of the server, or None to use TCP
+    :param limit: The most bytes the reader may buffer, which has to hold a whole frame
+    :return: The reader and writer of the connection
+    """
+    if unixPath is not None:
+        return await asyncio.open_unix_connection(unixPath, limit=limit)
+    return await asyncio.open_connection(host, port, limit=limit)
+
+
+async def _read_frame(reader: asyncio.StreamReader, footer: bytes) -> bytes:
+    """
+    Reads one frame in one go, which is much faster than reading it line by line once thousands of sessions are
+    reading frames
+    :param reader: The reader of the connection
+    :param footer: The last line of every frame
+    :return: The frame, or None if the game ended or the connection closed instead
+    """
+    try:
+        return await reader.readuntil(footer)
+    except asyncio.IncompleteReadError:
+        # The server sent GAME OVER or an error instead, and closed the connection
+        return None
+
+
+def _next_command(frame: bytes, rng: random.Random, columns: int) -> str:
+    """
+    Picks the next command of a session, spawning a faller whenever there is none
+    :param frame: The last frame the session received
+    :param rng: The random numbers of the session
+    :param columns: The number of columns of the board
+    :return: The command
+    """
+    if _FALLER_PATTERN.search(frame) is None:
+        jewels = [rng.choice(_JEWELS) for i in range(3)]
+        return 'F ' + str(rng.randint(1, columns)) + ' ' + ' '.join(jewels)
+    return rng.choice(_COMMAND_CHOICES)
+
+
+async def _run_session(number: int, options: argparse.Namespace, connectLimit: asyncio.Semaphore,
+                       connected: asyncio.Event, start: asyncio.Event, results: _Results) -> None:
+    """
+    Plays one session: connects and sets up the board, then sends its commands once every session has connected, or
+    just reads the ticks if the server ticks the sessions by itself
+    :param number: The number of the session, which seeds its commands
+    :param options: The options given on the command line
+    :param connectLimit: Limits how many sessions connect at the same time
+    :param connected: Set once every session has connected
+    :param start: Set once the commands may be sent
+    :param results: Where the measurements are collected
+    """
+    footer = (' ' + '---' * options.columns + ' \n').encode('utf-8')
+    limit = max(_READ_LIMIT, 2 * (options.rows + 1) * (options.columns * 3 + 3))
+    try:
+        async with connectLimit:
+            reader, writer = await _open(options.host, options.port, options.unix, limit)
+            writer.write((str(options.rows) + '\n' + str(options.columns) + '\nEMPTY\n').encode('utf-8'))
+            frame = await _read_frame(reader, footer)
+    except OSError:
+        frame = None
+        writer = None
+    if frame is None:
+        results.failed += 1
+    else:
+        results.connected += 1
+    if results.connected + results.failed == options.sessions:
+        connected.set()
+    if frame is None:
+        if writer is not None:
+            writer.close()
+        return
+
+    rng = random.Random(number)
+    latencies = results.latencies
+    clock = time.perf_counter
+    try:
+        if options.interval > 0:
+            # The server ticks the session by itself from the first frame on, so the frames are read straight away and
+            #   every one of them should come one interval after the last. How late each one is is measured from the
+            #   tick that came the earliest, since the first frame may have been read late.
+            offsets = [clock()]
+            for tickNumber in range(1, options.commands + 1):
+                frame = await _read_frame(reader, footer)
+                if frame is None:
+                    break
+                offsets.append(clock() - tickNumber * options.interval)
+                results.commands += 1
+            earliest = min(offsets)
+            latencies.extend(offset - earliest for offset in offsets[1:])
+        else:
+            await start.wait()
+            for i in range(options.commands):
+                sent = clock()
+                writer.write((_next_command(frame, rng, options.columns) + '\n').encode('utf-8'))
+                frame = await _read_frame(reader, footer)
+                if frame is None:
+                    break
+                latencies.append(clock() - sent)
+                results.commands += 1
+        if frame is None:
+            results.gamesOver += 1
+        else:
+            writer.write(b'Q\n')
+    except OSError:
+        results.dropped += 1
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        # The server closes the connection as soon as the game ends, which can happen before the client closes it
+        pass
+
+
+async def run_load(options: argparse.Namespace) -> dict:
+    """
+    Opens many sessions on the server at once, measuring how quickly they connect and how quickly their commands are
+    answered
+    :param options: The options given on the command line
+    :return: A dict of the results: sessions connected per second, commands answered per second and the latency
+    percentiles of a command (or of a tick of the server, if the server ticks the sessions) in milliseconds
+    """
+    results = _Results()
+    connectLimit = asyncio.Semaphore(options.concurrency)
+    connected = asyncio.Event()
+    start = asyncio.Event()
+    clock = time.perf_counter
+
+    connectStart = clock()
+    tasks = [asyncio.ensure_future(_run_session(number, options, connectLimit, connected, start, results))
+             for number in range(options.sessions)]
+    await connected.wait()
+    connectTime = clock() - connectStart
+
+    commandStart = clock()
+    start.set()
+    await asyncio.gather(*tasks)
+    commandTime = clock() - commandStart
+
+    latencies = sorted(results.latencies)
+    result = {
+        'sessions': results.connected,
+        'failed': results.failed,
+        'dropped': results.dropped,
+        'games_over': results.gamesOver,
+        'sessions_per_sec': results.connected / connectTime if connectTime > 0 else float('inf'),
+        'commands': results.commands,
+        'commands_per_sec': results.commands / commandTime if commandTime > 0 else float('inf'),
+    }
+    if latencies:
+        result['p50_ms'] = util.percentile(latencies, 0.50) * 1000
+        result['p90_ms'] = util.percentile(latencies, 0.90) * 1000
+        result['p99_ms'] = util.percentile(latencies, 0.99) * 1000
+        result['max_ms'] = latencies[-1] * 1000
+    return result
+
+
+def start_load() -> None:
+    """
+    Runs the load generator with the options given on the command line and prints the results
+    """
+    parser = argparse.ArgumentParser(description='Measures how many Columns sessions a game server can play at once')
+    parser.add_argument('--host', default=_DEFAULT_HOST, help='the host of the server')
+    parser.add_argument('--port', type=int, default=_DEFAULT_PORT, help='the TCP port of the server')
+    parser.add_argument('--unix', metavar='PATH', help='connect to a local Unix socket instead of a TCP port')
+    parser.add_argument('--sessions', type=int, default=_SESSIONS, help='the number of sessions to open')
+    parser.add_argument('--commands', type=int, default=_COMMANDS, help='the commands each session sends')
+    parser.add_argument('--concurrency', type=int, default=_CONNECT_CONCURRENCY,
+                        help='the most sessions that connect at the same time')
+    parser.add_argument('--rows', type=int, default=_ROWS, help='the number of rows of every board')
+    parser.add_argument('--columns', type=int, default=_COLS, help='the number of columns of every board')
+    parser.add_argument('--interval', type=float, default=0, metavar='SECONDS',
+                        help='the tick interval of the server; the sessions then send nothing and measure how late '
+                             'every tick is instead of the latency of their commands. Leave at 0 for a server run '
+                             'with --tick 0')
+    arguments = parser.parse_args()
+
+    result = asyncio.run(run_load(arguments))
+    print('{} sessions ({} failed, {} dropped, {} games over) at {:.0f} sessions/s'.format(
+        result['sessions'], result['failed'], result['dropped'], result['games_over'], result['sessions_per_sec']))
+    print('{} {} at {:.0f}/s'.format(result['commands'], 'ticks' if arguments.interval > 0 else 'commands',
+                                     result['commands_per_sec']))
+    if 'p50_ms' in result:
+        print('{} p50 {:.2f} ms  p90 {:.2f} ms  p99 {:.2f} ms  max {:.2f} ms'.format(
+            'tick lateness' if arguments.interval > 0 else 'latency', result['p50_ms'], result['p90_ms'],
+            result['p99_ms'], result['max_ms']))
+
+
+# This makes it so this module is executable
+if __name__ == '__main__':
+    start_load()
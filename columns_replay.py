@@ -0,0 +1,448 @@
+import bisect
+import columns_game as game
+import struct
+import zlib
+
+# The first bytes of every replay and the version of the format
+_MAGIC = b'CLRP'
+_VERSION = 1
+
+# The last bytes of a replay that was closed properly, after the offset of its index
+_END_MAGIC = b'CLRE'
+_FOOTER = struct.Struct('<Q4s')
+
+# Operations in the stream. Every operation is one byte, some followed by arguments
+_OP_ROTATE = 0x01
+_OP_LEFT = 0x02
+_OP_RIGHT = 0x03
+_OP_SPAWN = 0x04     # varint column, 3 jewel numbers
+_OP_QUIT = 0x05
+_OP_JEWEL = 0x06     # varint length, UTF-8 name. Gives the next jewel number to that jewel
+_OP_CONTENTS = 0x07  # rows x columns jewel numbers, 0 for an empty cell
+_OP_KEYFRAME = 0x08  # varint tick, varint length, zlib compressed GameState.to_bytes()
+_OP_INDEX = 0x09     # varint tick count, varint jewel count, jewel names, varint keyframe count, (tick, offset) pairs
+
+# A byte with the high bit set is a run of 1 to 128 ticks
+_TICK_RUN_BIT = 0x80
+_MAX_TICK_RUN = 0x80
+
+# Ticks between two keyframes unless a recorder is told otherwise
+_DEFAULT_KEYFRAME_INTERVAL = 512
+
+# The recorder writes to its file once this many bytes are waiting
+_FLUSH_SIZE = 1 << 16
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    """
+    Writes the given non-negative int as a LEB128 varint (7 bits per byte, low bits first)
+    :param out: The bytes the varint is added to
+    :param value: The value to write
+    """
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, offset: int) -> (int, int):
+    """
+    Reads a LEB128 varint from the given data
+    :param data: The data to read from
+    :param offset: The offset of the first byte of the varint
+    :return: A tuple of the value that was read and the offset just after it
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _write_name(out: bytearray, name: str) -> None:
+    """
+    Writes the given jewel name as its varint length and its UTF-8 bytes
+    :param out: The bytes the name is added to
+    :param name: The name to write
+    """
+    encoded = name.encode('utf-8')
+    _write_varint(out, len(encoded))
+    out += encoded
+
+
+def _read_name(data: bytes, offset: int) -> (str, int):
+    """
+    Reads a jewel name written by _write_name()
+    :param data: The data to read from
+    :param offset: The offset of the length of the name
+    :return: A tuple of the name that was read and the offset just after it
+    """
+    length, offset = _read_varint(data, offset)
+    return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
+
+
+class ReplayRecorder:
+    def __init__(self, file, state: game.GameState, keyframeInterval: int = _DEFAULT_KEYFRAME_INTERVAL):
+        """
+        Constructs a new ReplayRecorder that writes everything done to the given GameState to the given binary file.
+        Every action has to be recorded right after it was performed on the game.
+        :param file: A file opened for writing bytes
+        :param state: The GameState being recorded. It is read to write keyframes
+        :param keyframeInterval: The number of ticks between keyframes (full copies of the game used for seeking), at
+        least 1
+        """
+        if keyframeInterval < 1:
+            raise ValueError('The keyframe interval has to be at least 1, not ' + str(keyframeInterval))
+        self._file = file
+        self._state = state
+        self._keyframeInterval = keyframeInterval
+        self._buffer = bytearray()
+        self._written = 0
+        self._ticks = 0
+        self._pendingTicks = 0
+        self._jewels = {game.EMPTY: 0}
+        self._jewelNames = []
+        self._keyframes = []
+        self._closed = False
+
+        self._buffer += _MAGIC
+        self._buffer.append(_VERSION)
+        _write_varint(self._buffer, state.get_rows())
+        _write_varint(self._buffer, state.get_columns())
+        _write_varint(self._buffer, keyframeInterval)
+
+    def record_contents(self, contents: [[str]]) -> None:
+        """
+        Records that the board was set to the given contents
+        :param contents: A list of rows from top of the board to bottom where each row is a list of the cells in that row
+        """
+        jewels = bytearray()
+        for row in contents:
+            for value in row:
+                jewels.append(self._jewel_number(value))
+        self._add_op(_OP_CONTENTS)
+        self._buffer += jewels
+
+    def record_tick(self) -> None:
+        """
+        Records one tick of the game, and writes a keyframe if it is time for one
+        """
+        self._ticks += 1
+        self._pendingTicks += 1
+        if self._pendingTicks == _MAX_TICK_RUN:
+            self._flush_ticks()
+        if self._ticks % self._keyframeInterval == 0:
+            self._write_keyframe()
+
+    def record_rotate(self) -> None:
+        """
+        Records that the faller was rotated
+        """
+        self._add_op(_OP_ROTATE)
+
+    def record_move(self, direction: int) -> None:
+        """
+        Records that the faller was moved to the side
+        :param direction: The direction (LEFT or RIGHT) the faller was moved in
+        """
+        self._add_op(_OP_LEFT if direction == game.LEFT else _OP_RIGHT)
+
+    def record_spawn(self, column: int, faller: [str, str, str]) -> None:
+        """
+        Records that a faller was spawned
+        :param column: The column number (1,n) the faller was spawned in
+        :param faller: The contents of the faller
+        """
+        numbers = [self._jewel_number(jewel) for jewel in faller]
+        self._add_op(_OP_SPAWN)
+        _write_varint(self._buffer, column)
+        self._buffer += bytes(numbers)
+
+    def record_quit(self) -> None:
+        """
+        Records that the player quit the game
+        """
+        self._add_op(_OP_QUIT)
+
+    def close(self) -> None:
+        """
+        Writes the index of the keyframes and everything still buffered to the file. The file itself is not closed.
+        """
+        if self._closed:
+            return
+        self._flush_ticks()
+
+        indexOffset = self._offset()
+        self._buffer.append(_OP_INDEX)
+        _write_varint(self._buffer, self._ticks)
+        _write_varint(self._buffer, len(self._jewelNames))
+        for name in self._jewelNames:
+            _write_name(self._buffer, name)
+        _write_varint(self._buffer, len(self._keyframes))
+        for tick, offset in self._keyframes:
+            _write_varint(self._buffer, tick)
+            _write_varint(self._buffer, offset)
+        self._buffer += _FOOTER.pack(indexOffset, _END_MAGIC)
+
+        self._flush()
+        self._closed = True
+
+    def _jewel_number(self, jewel: str) -> int:
+        """
+        Gets the number the given jewel has in this replay, defining it in the stream if it is new
+        :param jewel: The jewel to get the number of
+        :return: An int that is the number of the jewel
+        """
+        number = self._jewels.get(jewel)
+        if number is None:
+            number = len(self._jewels)
+            if number > 0xFF:
+                raise ValueError('A replay can not hold more than 255 different jewels')
+            self._add_op(_OP_JEWEL)
+            _write_name(self._buffer, jewel)
+            self._jewels[jewel] = number
+            self._jewelNames.append(jewel)
+        return number
+
+    def _write_keyframe(self) -> None:
+        """
+        Writes a keyframe of the game as it is now
+        """
+        self._flush_ticks()
+        self._keyframes.append((self._ticks, self._offset()))
+        data = zlib.compress(self._state.to_bytes())
+        self._buffer.append(_OP_KEYFRAME)
+        _write_varint(self._buffer, self._ticks)
+        _write_varint(self._buffer, len(data))
+        self._buffer += data
+
+    def _add_op(self, op: int) -> None:
+        """
+        Adds an operation to the stream, after any ticks that have not been written yet
+        :param op: The operation
+        """
+        self._flush_ticks()
+        self._buffer.append(op)
+        if len(self._buffer) >= _FLUSH_SIZE:
+            self._flush()
+
+    def _flush_ticks(self) -> None:
+        """
+        Writes the ticks that have not been written yet as one run
+        """
+        if self._pendingTicks > 0:
+            self._buffer.append(_TICK_RUN_BIT | (self._pendingTicks - 1))
+            self._pendingTicks = 0
+
+    def _offset(self) -> int:
+        """
+        Gets the offset in the file that the next byte of the stream will be at
+        :return: An int that is the offset
+        """
+        return self._written + len(self._buffer)
+
+    def _flush(self) -> None:
+        """
+        Writes the buffered bytes to the file
+        """
+        self._file.write(self._buffer)
+        self._written += len(self._buffer)
+        self._buffer = bytearray()
+
+
+class ReplayPlayer:
+    def __init__(self, data: bytes):
+        """
+        Constructs a new ReplayPlayer for the given replay
+        :param data: The bytes of a replay written by a ReplayRecorder
+        """
+        if data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError('The data is not a replay')
+        if data[len(_MAGIC)] != _VERSION:
+            raise ValueError('The replay has an unknown version ' + str(data[len(_MAGIC)]))
+
+        self._data = data
+        offset = len(_MAGIC) + 1
+        self._rows, offset = _read_varint(data, offset)
+        self._columns, offset = _read_varint(data, offset)
+        self._keyframeInterval, offset = _read_varint(data, offset)
+        self._streamStart = offset
+
+        self._jewels = [game.EMPTY]
+        self._keyframeTicks = []
+        self._keyframeOffsets = []
+        self._ticks = None
+        self._streamEnd = len(data)
+
+        # A replay that was closed properly ends with an index of its keyframes. Without it the stream is scanned
+        if len(data) >= _FOOTER.size and data[-4:] == _END_MAGIC:
+            indexOffset = _FOOTER.unpack_from(data, len(data) - _FOOTER.size)[0]
+            self._read_index(indexOffset)
+            self._streamEnd = indexOffset
+        else:
+            self._scan()
+
+    def get_rows(self) -> int:
+        """
+        Gets the number of rows of the board that was recorded
+        :return: An int that represents the number of rows
+        """
+        return self._rows
+
+    def get_columns(self) -> int:
+        """
+        Gets the number of columns of the board that was recorded
+        :return: An int that represents the number of columns
+        """
+        return self._columns
+
+    def get_tick_count(self) -> int:
+        """
+        Gets the number of ticks that were recorded
+        :return: An int that represents the number of ticks
+        """
+        return self._ticks
+
+    def play(self) -> game.GameState:
+        """
+        Plays the whole replay without any delay
+        :return: The game as it was at the end of the recording
+        """
+        state = game.GameState(self._rows, self._columns)
+        self._run(state, self._streamStart, 0, None)
+        return state
+
+    def seek(self, tick: int) -> game.GameState:
+        """
+        Rebuilds the game as it was right after the given tick, starting from the closest keyframe before it
+        :param tick: The number of ticks to go forward from the start of the recording
+        :return: The game as it was right after the given tick, before the actions that followed it
+        """
+        if tick < 0 or tick > self._ticks:
+            raise ValueError('Tick ' + str(tick) + ' is not in the replay')
+
+        keyframe = bisect.bisect_right(self._keyframeTicks, tick) - 1
+        if keyframe < 0:
+            state = game.GameState(self._rows, self._columns)
+            self._run(state, self._streamStart, 0, tick)
+            return state
+
+        offset = self._keyframeOffsets[keyframe] + 1
+        keyframeTick, offset = _read_varint(self._data, offset)
+        length, offset = _read_varint(self._data, offset)
+        state = game.from_bytes(zlib.decompress(self._data[offset:offset + length]))
+        self._run(state, offset + length, keyframeTick, tick)
+        return state
+
+    def _run(self, state: game.GameState, offset: int, tick: int, stopTick: int) -> None:
+        """
+        Performs the operations of the stream on the given game, starting at the given offset
+        :param state: The GameState to perform the operations on
+        :param offset: The offset of the first operation
+        :param tick: The number of ticks recorded before the first operation
+        :param stopTick: The tick to stop right after, or None to play to the end of the stream
+        """
+        data = self._data
+        if stopTick is not None and tick >= stopTick:
+            return
+
+        while offset < self._streamEnd:
+            op = data[offset]
+            offset += 1
+            if op & _TICK_RUN_BIT:
+                ticks = (op & ~_TICK_RUN_BIT) + 1
+                if stopTick is not None:
+                    ticks = min(ticks, stopTick - tick)
+                state.advance(ticks)
+                tick += ticks
+                if tick == stopTick:
+                    return
+            elif op == _OP_ROTATE:
+                state.rotate_faller()
+            elif op == _OP_LEFT:
+                state.move_faller_side(game.LEFT)
+            elif op == _OP_RIGHT:
+                state.move_faller_side(game.RIGHT)
+            elif op == _OP_SPAWN:
+                column, offset = _read_varint(data, offset)
+                jewels = self._jewels
+                state.spawn_faller(column, [jewels[data[offset]], jewels[data[offset + 1]], jewels[data[offset + 2]]])
+                offset += 3
+            elif op == _OP_QUIT:
+                return
+            elif op == _OP_JEWEL:
+                name, offset = _read_name(data, offset)
+            elif op == _OP_CONTENTS:
+                size = self._rows * self._columns
+                cells = data[offset:offset + size]
+                state.set_board_contents([[self._jewels[number] for number in cells[row:row + self._columns]]
+                                          for row in range(0, size, self._columns)])
+                offset += size
+            elif op == _OP_KEYFRAME:
+                keyframeTick, offset = _read_varint(data, offset)
+                length, offset = _read_varint(data, offset)
+                offset += length
+            else:
+                raise ValueError('Unknown operation ' + str(op) + ' at offset ' + str(offset - 1))
+
+    def _read_index(self, offset: int) -> None:
+        """
+        Reads the index at the end of a replay that was closed properly
+        :param offset: The offset of the index operation
+        """
+        data = self._data
+        if data[offset] != _OP_INDEX:
+            raise ValueError('The replay index is damaged')
+        self._ticks, offset = _read_varint(data, offset + 1)
+
+        jewelCount, offset = _read_varint(data, offset)
+        for i in range(jewelCount):
+            name, offset = _read_name(data, offset)
+            self._jewels.append(name)
+
+        keyframeCount, offset = _read_varint(data, offset)
+        for i in range(keyframeCount):
+            tick, offset = _read_varint(data, offset)
+            keyframeOffset, offset = _read_varint(data, offset)
+            self._keyframeTicks.append(tick)
+            self._keyframeOffsets.append(keyframeOffset)
+
+    def _scan(self) -> None:
+        """
+        Reads the jewels, keyframes and number of ticks of a replay that has no index by walking its whole stream
+        """
+        data = self._data
+        offset = self._streamStart
+        self._ticks = 0
+        while offset < len(data):
+            opOffset = offset
+            op = data[offset]
+            offset += 1
+            if op & _TICK_RUN_BIT:
+                self._ticks += (op & ~_TICK_RUN_BIT) + 1
+            elif op == _OP_SPAWN:
+                column, offset = _read_varint(data, offset)
+                offset += 3
+            elif op == _OP_JEWEL:
+                name, offset = _read_name(data, offset)
+                self._jewels.append(name)
+            elif op == _OP_CONTENTS:
+                offset += self._rows * self._columns
+            elif op == _OP_KEYFRAME:
+                tick, offset = _read_varint(data, offset)
+                length, offset = _read_varint(data, offset)
+                # A keyframe cut off at the end of the data can not be used
+                if offset + length > len(data):
+                    break
+                self._keyframeTicks.append(tick)
+                self._keyframeOffsets.append(opOffset)
+                offset += length
+            elif op == _OP_INDEX or op == _OP_QUIT:
+                break
+            elif op not in (_OP_ROTATE, _OP_LEFT, _OP_RIGHT):
+                break
+        self._streamEnd = min(offset, len(data))
@@ -0,0 +1,572 @@
+import argparse
+import asyncio
+import columns_console_ui as console
+import columns_game as game
+import columns_util as util
+import heapq
+
+# The seconds between the ticks of every session. 0 means a session only ticks when its client sends an empty line,
+#   just like the console
+_TICK_INTERVAL = 1.0
+
+# A session stops reading the commands of its client once this many bytes are waiting to be sent to it, and starts
+#   again once they fall under the low water mark. While it waits only the newest frame is kept.
+_HIGH_WATER = 64 * 1024
+_LOW_WATER = 16 * 1024
+
+# The longest line a client may send, so one client can not use up the memory of the server. A row of the contents of
+#   the board may be longer by the number of columns of the board.
+_MAX_LINE = 4096
+
+# The board sizes (rows, columns) a client may ask for by default. The tables every board of a size needs are built when
+#   the server starts, so a client can not stall every other session by asking for a size nobody used yet. Only as many
+#   sizes as columns_game keeps the tables of are allowed.
+_SIZES = [(13, 6)]
+_MAX_SIZES = game.CACHED_BOARD_SIZES
+
+# The jewels a client may use. The jewels of columns_game are shared by every game of the process and there can only be
+#   a few of them, so clients can not name new ones.
+_JEWELS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+# The seconds a finished session waits for its client to close the connection before closing it itself. Until then the
+#   client can still read everything that was sent, even if it sent more commands after the game ended.
+_LINGER = 5.0
+
+# The number of connections that may wait to be accepted, high enough for thousands of clients connecting at once
+_BACKLOG = 4096
+
+_DEFAULT_HOST = '127.0.0.1'
+_DEFAULT_PORT = 4032
+
+
+class _Session(asyncio.Protocol):
+    def __init__(self, server: 'GameServer'):
+        """
+        Constructs a new _Session that plays one game with the client of one connection. The client speaks the same
+        protocol as the console: the rows, the columns, EMPTY or CONTENTS and the rows of the board, then the commands.
+        :param server: The GameServer that the session belongs to
+        """
+        self._server = server
+        self._transport = None
+        self._buffer = bytearray()
+        # True while the lines of the client are left in the buffer because it is not taking its frames fast enough
+        self._readPaused = False
+        # True once the client has sent everything it is going to send
+        self._inputEnded = False
+        # The method that handles the next line of the client, which changes as the game is set up
+        self._handle_line = self._read_rows
+        self._rows = 0
+        self._columns = 0
+        self._maxLine = _MAX_LINE
+        self._contents = []
+        self._state = None
+        self._renderer = console.BoardRenderer()
+        # The text that is written to the client in the next batch, and how long it is
+        self._pending = []
+        self._pendingSize = 0
+        # True when the board changed while the client was too slow to take the frame
+        self._frameSkipped = False
+        self._writePaused = False
+        self._closing = False
+        # True while the session is waiting to be written in the next batch
+        self.dirty = False
+        # The time of the next tick of the session, or None if it is not waiting for one
+        self.nextTick = None
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        """
+        Starts the session once the client has connected
+        :param transport: The transport of the connection
+        """
+        self._transport = transport
+        transport.set_write_buffer_limits(_HIGH_WATER, _LOW_WATER)
+        self._server._add_session(self)
+
+    def connection_lost(self, exc: Exception) -> None:
+        """
+        Ends the session once the connection is closed
+        :param exc: The error that closed the connection, or None if it was closed normally
+        """
+        self._closing = True
+        self._state = None
+        self._server._remove_session(self)
+
+    def data_received(self, data: bytes) -> None:
+        """
+        Handles the lines that the client sent
+        :param data: The bytes that were received
+        """
+        if self._closing:
+            return
+        self._buffer += data
+        self._handle_lines()
+
+    def eof_received(self) -> bool:
+        """
+        Ends the session once the client stops sending and its last commands are done, like the console does at the
+        end of its input
+        :return: True to keep the connection open until the frames are written, unless the game is already over
+        """
+        if self._closing:
+            return False
+        self._inputEnded = True
+        self._handle_lines()
+        return True
+
+    def pause_writing(self) -> None:
+        """
+        Stops reading the commands of the client while it is too slow to take the frames
+        """
+        self._writePaused = True
+        if not self._closing and not self._readPaused:
+            self._readPaused = True
+            self._transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        """
+        Starts reading the commands of the client again once it has caught up
+        """
+        self._writePaused = False
+        if not self._closing:
+            self._catch_up()
+
+    def tick(self) -> bool:
+        """
+        Ticks the game of the session once
+        :return: True if the session is still playing and should tick again
+        """
+        if self._closing:
+            return False
+        self._server._tickCount += 1
+        if self._state.tick():
+            self._queue_frame()
+            self._finish('GAME OVER')
+            return False
+        self._queue_frame()
+        return True
+
+    def flush(self) -> None:
+        """
+        Writes everything that is waiting to be sent to the client in one write
+        """
+        self.dirty = False
+        if not self._pending or self._transport.is_closing():
+            return
+        text = ''.join(self._pending)
+        self._pending = []
+        self._pendingSize = 0
+        self._transport.write(text.encode('utf-8'))
+        if self._closing:
+            self._shut_down()
+        elif (self._readPaused or self._frameSkipped) and not self._writePaused:
+            self._catch_up()
+
+    def _is_congested(self) -> bool:
+        """
+        Checks if the client has as many frames waiting as it may, so no more of its commands should be handled
+        :return: True if the client is too slow to take more frames
+        """
+        return self._writePaused or self._pendingSize >= _HIGH_WATER
+
+    def _handle_lines(self) -> None:
+        """
+        Handles the complete lines in the buffer. Once the client has too many frames waiting the rest of the lines are
+        left in the buffer and the client is not read from until it catches up, so a client sending commands faster
+        than it reads the frames is slowed down instead of using up the memory of the server.
+        """
+        buffer = self._buffer
+        start = 0
+        while not self._closing and not self._is_congested():
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                break
+            line = buffer[start:end].decode('utf-8', 'replace').rstrip('\r')
+            start = end + 1
+            self._handle_line(line)
+        del buffer[:start]
+        if self._closing:
+            return
+        if self._is_congested():
+            if not self._readPaused:
+                self._readPaused = True
+                self._transport.pause_reading()
+        elif self._inputEnded:
+            # The last line does not have to end with a newline, just like in the console
+            if buffer:
+                line = buffer.decode('utf-8', 'replace').rstrip('\r')
+                buffer.clear()
+                self._handle_line(line)
+            self._finish(None)
+        elif len(buffer) > self._maxLine:
+            self._fail('line too long')
+
+    def _catch_up(self) -> None:
+        """
+        Sends the newest frame if one was skipped and goes back to handling the lines of the client now that it is
+        taking its frames again
+        """
+        if self._frameSkipped:
+            self._queue_frame()
+        self._handle_lines()
+        if self._readPaused and not self._closing and not self._is_congested():
+            self._readPaused = False
+            self._transport.resume_reading()
+
+    def _read_rows(self, line: str) -> None:
+        """
+        Reads the number of rows of the board
+        :param line: The line the client sent
+        """
+        self._rows = self._read_size(line)
+        self._handle_line = self._read_columns
+
+    def _read_columns(self, line: str) -> None:
+        """
+        Reads the number of columns of the board
+        :param line: The line the client sent
+        """
+        self._columns = self._read_size(line)
+        if self._closing:
+            return
+        if (self._rows, self._columns) not in self._server._sizes:
+            self._fail('board size not allowed')
+            return
+        self._maxLine = _MAX_LINE + self._columns
+        self._handle_line = self._read_contents_header
+
+    def _read_size(self, line: str) -> int:
+        """
+        Reads a size of the board, failing the session if it is not a positive number
+        :param line: The line the client sent
+        :return: The size, or 0 if it was not valid
+        """
+        try:
+            size = int(line.strip())
+        except ValueError:
+            size = 0
+        if size <= 0:
+            self._fail('invalid board size')
+        return size
+
+    def _read_contents_header(self, line: str) -> None:
+        """
+        Reads whether the board starts empty or its contents follow
+        :param line: The line the client sent
+        """
+        self._state = game.GameState(self._rows, self._columns)
+        if line.strip() == 'CONTENTS':
+            self._handle_line = self._read_contents_row
+            return
+        self._start_playing()
+
+    def _read_contents_row(self, line: str) -> None:
+        """
+        Reads one row of the contents of the board
+        :param line: The line the client sent
+        """
+        if len(line) < self._columns:
+            self._fail('row too short')
+            return
+        row = list(line[:self._columns])
+        if any(jewel != game.EMPTY and jewel not in _JEWELS for jewel in row):
+            self._fail('invalid jewel')
+            return
+        self._contents.append(row)
+        if len(self._contents) == self._rows:
+            try:
+                self._state.set_board_contents(self._contents)
+            except ValueError as error:
+                self._fail(str(error))
+                return
+            self._contents = []
+            self._start_playing()
+
+    def _start_playing(self) -> None:
+        """
+        Sends the first frame and starts the ticks of the game
+        """
+        self._handle_line = self._read_command
+        self._queue_frame()
+        self._server._start_ticks(self)
+
+    def _read_command(self, line: str) -> None:
+        """
+        Performs one command of the client, the same way the console does, and sends the frame that follows it
+        :param line: The line the client sent
+        """
+        command = line.strip()
+        if command == 'Q':
+            self._finish(None)
+        elif command == '':
+            self.tick()
+        elif command[0] == 'F' and any(jewel not in _JEWELS for jewel in command.split(' ')[2:5]):
+            self._fail('invalid jewel')
+        else:
+            console.process_command(command, self._state)
+            self._queue_frame()
+
+    def _queue_frame(self) -> None:
+        """
+        Adds the current board to the next batch. While the client is too slow only the newest board is sent, once it
+        catches up.
+        """
+        if self._is_congested():
+            self._frameSkipped = True
+            self._server._skippedFrames += 1
+            return
+        self._frameSkipped = False
+        frame = self._renderer.render(self._state)
+        self._pending.append(frame)
+        self._pendingSize += len(frame)
+        self._server._frames += 1
+        self._server._mark_dirty(self)
+
+    def _finish(self, text: str) -> None:
+        """
+        Ends the game and closes the connection once everything waiting to be sent is written
+        :param text: The last line to send to the client, or None to send nothing more
+        """
+        if self._closing:
+            return
+        if self._frameSkipped:
+            self._frameSkipped = False
+            self._pending.append(self._renderer.render(self._state))
+        if text is not None:
+            self._pending.append(text + '\n')
+        self._closing = True
+        self._server._mark_dirty(self)
+        if not self._pending:
+            self._shut_down()
+
+    def _shut_down(self) -> None:
+        """
+        Stops sending to the client once the game is over. The connection is closed once the client closes it too, or
+        after a while. Closing it straight away could throw away the end of the game if the client is still sending.
+        """
+        transport = self._transport
+        if self._inputEnded or not transport.can_write_eof():
+            transport.close()
+            return
+        transport.write_eof()
+        transport.resume_reading()
+        self._server._loop.call_later(_LINGER, transport.close)
+
+    def _fail(self, message: str) -> None:
+        """
+        Ends the session because the client sent something that is not part of the protocol
+        :param message: What the client did wrong
+        """
+        self._frameSkipped = False
+        self._finish('ERROR ' + message)
+
+
+class GameServer:
+    def __init__(self, tickInterval: float = _TICK_INTERVAL, sizes: [(int, int)] = None):
+        """
+        Constructs a new GameServer that plays a game for every client that connects, all on one event loop
+        :param tickInterval: The seconds between the ticks of every session, or 0 to only tick when a client asks to
+        :param sizes: The board sizes (rows, columns) a client may ask for, or None for the default sizes
+        """
+        if sizes is None:
+            sizes = _SIZES
+        sizes = set(sizes)
+        if len(sizes) > _MAX_SIZES:
+            raise ValueError('At most ' + str(_MAX_SIZES) + ' board sizes can be allowed')
+        for rows, columns in sizes:
+            if rows <= 0 or columns <= 0:
+                raise ValueError('Invalid board size ' + str(rows) + 'x' + str(columns))
+            game.prepare_board_size(rows, columns)
+        self._tickInterval = tickInterval
+        self._sizes = sizes
+        self._loop = None
+        self._sessions = set()
+        # The sessions that have something to write, which are all written together once the loop is idle
+        self._dirty = []
+        self._flushHandle = None
+        # A heap of (time of the tick, order, session). Every session has at most one entry, and one timer of the loop
+        #   waits for the earliest of them.
+        self._ticks = []
+        self._tickOrder = 0
+        self._tickHandle = None
+        self._tickCount = 0
+        self._lateTicks = 0
+        self._frames = 0
+        self._skippedFrames = 0
+
+    async def start(self, host: str = _DEFAULT_HOST, port: int = _DEFAULT_PORT,
+                    unixPath: str = None) -> asyncio.AbstractServer:
+        """
+        Starts accepting clients on a TCP port or a local Unix socket
+        :param host: The host the TCP port is opened on
+        :param port: The TCP port to listen on
+        :param unixPath: The path of the Unix socket to listen on instead of the TCP port, or None to use TCP
+        :return: The asyncio server, which keeps accepting clients until it is closed
+        """
+        self._loop = asyncio.get_running_loop()
+        if unixPath is not None:
+            return await self._loop.create_unix_server(lambda: _Session(self), unixPath, backlog=_BACKLOG)
+        return await self._loop.create_server(lambda: _Session(self), host, port, backlog=_BACKLOG)
+
+    def get_session_count(self) -> int:
+        """
+        Gets the number of sessions that are connected
+        :return: The number of sessions
+        """
+        return len(self._sessions)
+
+    def get_stats(self) -> dict:
+        """
+        Gets the counts of what the server has done since it started
+        :return: A dict of the sessions connected, the ticks run, the ticks that ran more than a tick late, the frames
+        sent and the frames skipped because their clients were too slow
+        """
+        return {
+            'sessions': len(self._sessions),
+            'ticks': self._tickCount,
+            'late_ticks': self._lateTicks,
+            'frames': self._frames,
+            'skipped_frames': self._skippedFrames,
+        }
+
+    def _add_session(self, session: _Session) -> None:
+        """
+        Adds a session that just connected
+        :param session: The session
+        """
+        self._sessions.add(session)
+
+    def _remove_session(self, session: _Session) -> None:
+        """
+        Removes a session whose connection closed. Its entry in the tick heap is dropped once it comes up.
+        :param session: The session
+        """
+        self._sessions.discard(session)
+        session.nextTick = None
+
+    def _mark_dirty(self, session: _Session) -> None:
+        """
+        Adds a session to the next batch of writes
+        :param session: The session that has something to write
+        """
+        if session.dirty:
+            return
+        session.dirty = True
+        self._dirty.append(session)
+        if self._flushHandle is None:
+            self._flushHandle = self._loop.call_soon(self._flush)
+
+    def _flush(self) -> None:
+        """
+        Writes the frames of every session that changed since the last batch
+        """
+        self._flushHandle = None
+        dirty = self._dirty
+        self._dirty = []
+        for session in dirty:
+            session.flush()
+
+    def _start_ticks(self, session: _Session) -> None:
+        """
+        Starts ticking a session that just started playing
+        :param session: The session
+        """
+        if self._tickInterval <= 0:
+            return
+        self._push_tick(session, self._loop.time() + self._tickInterval)
+
+    def _push_tick(self, session: _Session, tickTime: float) -> None:
+        """
+        Adds the next tick of a session to the heap and makes sure the timer of the loop fires in time for it
+        :param session: The session
+        :param tickTime: The loop time of the tick
+        """
+        session.nextTick = tickTime
+        self._tickOrder += 1
+        heapq.heappush(self._ticks, (tickTime, self._tickOrder, session))
+        if self._tickHandle is None or self._tickHandle.when() > tickTime:
+            if self._tickHandle is not None:
+                self._tickHandle.cancel()
+            self._tickHandle = self._loop.call_at(tickTime, self._run_ticks)
+
+    def _run_ticks(self) -> None:
+        """
+        Ticks every session whose tick is due. A session that fell more than a whole tick behind skips the ticks it
+        missed instead of running them all at once.
+        """
+        self._tickHandle = None
+        ticks = self._ticks
+        now = self._loop.time()
+        interval = self._tickInterval
+        due = []
+        while ticks and ticks[0][0] <= now:
+            due.append(heapq.heappop(ticks))
+
+        for tickTime, order, session in due:
+            if session.nextTick != tickTime:
+                continue
+            session.nextTick = None
+            if not session.tick():
+                continue
+            nextTick = tickTime + interval
+            if nextTick <= now:
+                self._lateTicks += 1
+                nextTick = now + interval
+            session.nextTick = nextTick
+            self._tickOrder += 1
+            heapq.heappush(ticks, (nextTick, self._tickOrder, session))
+
+        if ticks:
+            self._tickHandle = self._loop.call_at(ticks[0][0], self._run_ticks)
+
+
+async def _serve(server: GameServer, host: str, port: int, unixPath: str, statsInterval: float) -> None:
+    """
+    Runs the server until it is stopped, printing its stats every so often if asked to
+    :param server: The GameServer to run
+    :param host: The host the TCP port is opened on
+    :param port: The TCP port to listen on
+    :param unixPath: The path of the Unix socket to listen on instead of the TCP port, or None to use TCP
+    :param statsInterval: The seconds between the stats being printed, or 0 to not print them
+    """
+    listener = await server.start(host, port, unixPath)
+    print('Listening on ' + (unixPath if unixPath is not None else host + ':' + str(port)), flush=True)
+    async with listener:
+        if statsInterval <= 0:
+            await listener.serve_forever()
+            return
+        await listener.start_serving()
+        while True:
+            await asyncio.sleep(statsInterval)
+            stats = server.get_stats()
+            print(' '.join(name + '=' + str(value) for name, value in stats.items()), flush=True)
+
+
+def start_server() -> None:
+    """
+    Runs the game server with the options given on the command line
+    """
+    parser = argparse.ArgumentParser(description='Serves games of Columns to many clients at once')
+    parser.add_argument('--host', default=_DEFAULT_HOST, help='the host to listen on')
+    parser.add_argument('--port', type=int, default=_DEFAULT_PORT, help='the TCP port to listen on')
+    parser.add_argument('--unix', metavar='PATH', help='listen on a local Unix socket instead of a TCP port')
+    parser.add_argument('--tick', type=float, default=_TICK_INTERVAL, metavar='SECONDS',
+                        help='the seconds between the ticks of every game, 0 to only tick when a client sends a blank '
+                             'line')
+    parser.add_argument('--sizes', type=util.parse_size, nargs='+', metavar='ROWSxCOLUMNS',
+                        help='the board sizes clients may ask for, at most ' + str(_MAX_SIZES) + ' of them')
+    parser.add_argument('--stats', type=float, default=0, metavar='SECONDS', help='print the stats every so often')
+    arguments = parser.parse_args()
+
+    try:
+        server = GameServer(arguments.tick, arguments.sizes)
+    except ValueError as error:
+        parser.error(str(error))
+    try:
+        asyncio.run(_serve(server, arguments.host, arguments.port, arguments.unix, arguments.stats))
+    except KeyboardInterrupt:
+        pass
+
+
+# This makes it so this module is executable
+if __name__ == '__main__':
+    start_server()
@@ -0,0 +1,619 @@
+import columns_game as game
+import struct
+
+# The codes used in the sparse boards are the same packed cell codes that columns_game stores, so a board can be
+#   compared with a GameState cell for cell
+_STATE_BITS = game._STATE_BITS
+_STATE_MASK = game._STATE_MASK
+_EMPTY_CELL_CODE = game._EMPTY_CELL_CODE
+_OCCUPIED_CODE = game._OCCUPIED_CODE
+_MATCHED_CODE = game._MATCHED_CODE
+_MATCH_LENGTH = game._MATCH_LENGTH
+
+# The directions that jewels can be matched along as (row step, column step): along a row, along a column, up and to
+#   the right, and down and to the right
+_MATCH_DIRECTIONS = ((0, 1), (1, 0), (-1, 1), (1, 1))
+
+
+class SparseGameState:
+    """
+    A game of Columns for very large, mostly empty boards.
+    Instead of a rows x columns board, every column keeps the stack of jewels resting in it from the bottom up, and the
+    faller is laid over the board like in GameState. Matching only looks around the jewels that moved, and gravity is
+    the removal of the matched jewels from their stacks, so a tick costs time in the number of jewels it touches and not
+    in the size of the board.
+    It has the same rules, cell states and cell codes as columns_game.GameState, and the methods that the front ends use.
+    Its change events come in the same kinds and the same order as the events of GameState, but what some of them hold
+    can differ, so an observer should not rely on more than what the events mean:
+    - MATCHED and CLEARED hold the same cells as in GameState, but not always in the same order
+    - After set_board_contents(), CELLS holds only the cells whose code changed, where GameState lists every cell
+    - After a tick, CELLS can hold a cell that ended the tick with the same code it started it with
+    """
+
+    def __init__(self, rows: int, columns: int):
+        """
+        Constructs a new SparseGameState with a board that is the given rows x the given columns
+        :param rows: The number of rows that board will have
+        :param columns: The number of columns that the board will have
+        """
+        self._rows = rows
+        self._columns = columns
+        # The cell codes of the jewels in each column from the bottom row up. There are never gaps in a stack
+        self._stacks = [[] for col in range(columns)]
+        self._faller = game._Faller()
+        # The columns that hold matched jewels that the next matching pass clears
+        self._matchedColumns = set()
+        # The board indices of the cells that were marked as matched by the last matching pass
+        self._matchedCells = []
+        # The board indices of the jewels that appeared or moved since the last matching pass. Only the lines through
+        #   these cells can hold new matches
+        self._dirtyCells = set()
+        # The change events that have not been drained yet, the indices of the board cells that changed since the last
+        #   CELLS event, and the faller cells as the last CELLS event saw them. All are None while events are disabled
+        self._events = None
+        self._changedCells = None
+        self._flushedFaller = None
+
+    def get_rows(self) -> int:
+        """
+        Gets the number of rows in this game board
+        :return: An int that represents the number of rows in this game board
+        """
+        return self._rows
+
+    def get_columns(self) -> int:
+        """
+        Gets the number of columns in this game board
+        :return: An int that represents the number of columns in this game board
+        """
+        return self._columns
+
+    def get_cell_state(self, row: int, col: int) -> str:
+        """
+        Gets the state of the cell identified by the given row and column
+        :param row: The row of the cell to get the state for
+        :param col: The column of the cell to get the state for
+        :return: The state of the cell identified by the given row and column
+        """
+        return game._STATE_NAMES[self._visible_code(row, col) & _STATE_MASK]
+
+    def get_cell_contents(self, row: int, col: int) -> str:
+        """
+        Gets the content of the cell identified by the given row and column
+        :param row: The row of the cell to get the content for
+        :param col: The column of the cell to get the content for
+        :return: The content of the cell identified by the given row and column
+        """
+        return game._JEWEL_NAMES[self._visible_code(row, col) >> _STATE_BITS]
+
+    def get_cell_codes(self) -> bytes:
+        """
+        Gets the packed code of every cell on the board in one call, row by row from the top, exactly like
+        GameState.get_cell_codes(). Only the jewels are written, the rest of the board is filled in as empty at once.
+        :return: The codes of the cells, indexed by row * columns + col
+        """
+        cells = self._board_cells()
+        for index, code in self._faller_cells():
+            cells[index] = code
+        return bytes(cells)
+
+    def has_faller(self) -> bool:
+        """
+        Returns whether or not this game state has a faller that is currently active (falling or stopped but not frozen)
+        :return: True if there is an active faller on the game board. False otherwise
+        """
+        return self._faller.active
+
+    def set_board_contents(self, contents: [[str]]) -> None:
+        """
+        Sets the contents of the board to the given contents, then applies gravity and attempts matching. Like
+        GameState.set_board_contents(), the board is left as it was if the contents would use more than MAX_JEWELS jewels
+        :param contents: A list of rows from top of the board to bottom where each row is a list that represents each cell in that row
+        """
+        rows = self._rows
+        columns = self._columns
+        for row in range(rows):
+            if len(contents[row]) < columns:
+                raise ValueError('Row ' + str(row) + ' does not have ' + str(columns) + ' cells')
+        jewels = {value for row in range(rows) for value in contents[row][:columns]}
+        codes = dict(zip(jewels, game._jewel_codes(jewels)))
+
+        moves = []
+        for col in range(columns):
+            # Gravity is applied as the stack is built, every jewel lands on the one below it
+            stack = []
+            for row in range(rows - 1, -1, -1):
+                value = contents[row][col]
+                if value != game.EMPTY:
+                    if row != rows - 1 - len(stack):
+                        moves.append((row * columns + col, self._index(len(stack), col)))
+                    stack.append(game._cell_code(codes[value], _OCCUPIED_CODE))
+            self._replace_stack(col, stack, 0)
+
+        if moves and self._events is not None:
+            self._events.append((game.EVENT_GRAVITY, tuple(moves)))
+        self._matching()
+
+    def tick(self) -> bool:
+        """
+        Ticks one time unit on the game. This causes fallers to move down and/or matching to occur
+        :return: True if the game is over from a faller freezing out of bounds. False otherwise
+        """
+        # Handle the faller first
+        gameOver = self._tick_faller()
+
+        # Handle matching and gem gravity
+        self._matching()
+
+        if self._events is not None:
+            self._end_ticks(1)
+        return gameOver
+
+    def advance(self, ticks: int) -> (bool, int, int):
+        """
+        Ticks the given number of time units on the game, exactly as that many calls to tick() would.
+        A falling faller over a settled board is dropped straight to the row it lands on instead of one row per tick, and
+        ticks on a settled board without a faller are skipped.
+        :param ticks: The number of time units to tick
+        :return: A tuple of: True if the game ended (the remaining ticks are not used), the number of ticks used, and
+        the number of ticks in which new cells were matched
+        """
+        ticksUsed = 0
+        cascades = 0
+        while ticksUsed < ticks:
+            if self._is_settled():
+                # Nothing happens on a settled board until a faller is spawned
+                if not self._faller.active:
+                    if self._events is not None:
+                        self._end_ticks(ticks - ticksUsed)
+                    ticksUsed = ticks
+                    break
+
+                # Nothing but the faller moves until it lands, so it can be dropped there at once
+                if self._faller.state == game._FALLER_MOVING:
+                    drop = min(self._landing_row() - self._faller.get_row(), ticks - ticksUsed)
+                    if drop > 0:
+                        self._faller.set_row(self._faller.get_row() + drop)
+                        self._update_faller_state()
+                        ticksUsed += drop
+                        if self._events is not None:
+                            self._events.append((game.EVENT_FALLER_MOVED, self._faller.get_row(),
+                                                 self._faller.get_col()))
+                            self._end_ticks(drop)
+                        continue
+
+            gameOver = self.tick()
+            ticksUsed += 1
+            # After a tick the matched cells list only holds the cells that were matched in that tick
+            if self._matchedCells:
+                cascades += 1
+            if gameOver:
+                return True, ticksUsed, cascades
+
+        return False, ticksUsed, cascades
+
+    def spawn_faller(self, column: int, faller: [str, str, str]) -> None:
+        """
+        Spawns a faller in the given column (1,n) with the given contents
+        :param column: A column number from 1 to the number of columns where the faller will spawn
+        :param faller: The contents of the faller that will spawn. faller[0] is the first block of the faller to be visible
+        """
+        if self._faller.active:
+            return
+
+        if column < 1 or column > self._columns:
+            raise ValueError('Column ' + str(column) + ' is not on the board')
+
+        contents = game._jewel_codes(faller)
+
+        self._faller.active = True
+        self._faller.contents = contents
+        self._faller.set_row(0)
+        self._faller.set_col(column - 1)
+
+        # Check if the ground immediately under the faller is solid and if it is then update the fallers state
+        self._update_faller_state()
+
+        if self._events is not None:
+            self._events.append((game.EVENT_SPAWNED, self._faller.get_row(), self._faller.get_col()))
+
+    def rotate_faller(self) -> None:
+        """
+        Rotates the faller so the first block becomes the last, the middle becomes the first, and the top becomes the middle
+        """
+        # Only works if there is an active faller
+        if not self._faller.active:
+            return
+
+        one, two, three = self._faller.contents
+        self._faller.contents = [two, three, one]
+        self._update_faller_state()
+
+        if self._events is not None:
+            self._events.append((game.EVENT_ROTATED, self._faller.get_row(), self._faller.get_col()))
+
+    def move_faller_side(self, direction: int) -> None:
+        """
+        Moves the faller in the given direction if that direction is not blocked
+        :param direction: The direction (LEFT or RIGHT) to move the faller in
+        """
+        # Only works if there is an active faller, and they can only move left and right from this method
+        if not self._faller.active or (direction != game.LEFT and direction != game.RIGHT):
+            return
+
+        # They can't move passed the leftmost or rightmost column, or into a column where a jewel is beside any part of
+        #   the faller that is in play
+        targetColumn = self._faller.get_col() + direction
+        if targetColumn < 0 or targetColumn >= self._columns:
+            return
+        if len(self._stacks[targetColumn]) > self._rows - 1 - self._faller.get_row():
+            return
+
+        self._faller.set_col(targetColumn)
+        self._update_faller_state()
+
+        if self._events is not None:
+            self._events.append((game.EVENT_FALLER_MOVED, self._faller.get_row(), self._faller.get_col()))
+
+    def to_bytes(self) -> bytes:
+        """
+        Encodes the whole game exactly like GameState.to_bytes(), so columns_game.from_bytes() can load it
+        :return: The encoded game
+        """
+        cells = self._board_cells()
+        # The jewels on the board and in the faller get numbers local to this encoding, 0 is always EMPTY
+        used = {code >> _STATE_BITS for stack in self._stacks for code in stack}
+        used.update(self._faller.contents)
+        used.discard(game._jewel_code(game.EMPTY))
+        jewels = sorted(used)
+        localCodes = {jewel: local + 1 for local, jewel in enumerate(jewels)}
+        localCodes[game._jewel_code(game.EMPTY)] = 0
+
+        table = bytes(game._cell_code(localCodes.get(code >> _STATE_BITS, 0), code & _STATE_MASK) for code in range(256))
+
+        parts = [struct.pack('<IIB', self._rows, self._columns, len(jewels))]
+        for jewel in jewels:
+            parts.append(game._pack_name(jewel))
+        parts.append(cells.translate(table))
+
+        faller = self._faller
+        parts.append(struct.pack('<?iiBBBB', faller.active, faller.get_row(), faller.get_col(),
+                                 *[localCodes[jewel] for jewel in faller.contents], faller.state))
+        parts.append(struct.pack('<I' + 'I' * len(self._matchedCells), len(self._matchedCells), *self._matchedCells))
+        return b''.join(parts)
+
+    def enable_events(self, enabled: bool = True) -> None:
+        """
+        Turns change events on or off, like GameState.enable_events(). The events are the ones GameState emits, with the
+        differences listed in the class docstring.
+        :param enabled: True to turn events on, False to turn them off
+        """
+        if enabled:
+            if self._events is None:
+                self._events = []
+                self._changedCells = set()
+                self._flushedFaller = self._faller_cells()
+        else:
+            self._events = None
+            self._changedCells = None
+            self._flushedFaller = None
+
+    def drain_events(self) -> [tuple]:
+        """
+        Gets and forgets every change event since the last drain, in the order they happened. Cell changes made since
+        the last tick are included as one last CELLS event.
+        :return: A list of event tuples, empty if events are disabled
+        """
+        if self._events is None:
+            return []
+        self._flush_changed_cells()
+        events = self._events
+        self._events = []
+        return events
+
+    def _index(self, height: int, col: int) -> int:
+        """
+        Gets the board index of the cell at the given height of a stack
+        :param height: The height of the cell in the stack, 0 for the bottom row
+        :param col: The column of the stack
+        :return: The index of the cell on the board (row * columns + col)
+        """
+        return (self._rows - 1 - height) * self._columns + col
+
+    def _get_code(self, row: int, col: int) -> int:
+        """
+        Gets the packed code of the board cell identified by the given row and column, without the faller
+        :param row: The row of the cell
+        :param col: The column of the cell
+        :return: An int that is the packed jewel and state code of the cell
+        """
+        stack = self._stacks[col]
+        height = self._rows - 1 - row
+        if height < len(stack):
+            return stack[height]
+        return _EMPTY_CELL_CODE
+
+    def _visible_code(self, row: int, col: int) -> int:
+        """
+        Gets the packed code of the cell identified by the given row and column as it is seen from outside, with the
+        faller on top
+        :param row: The row of the cell
+        :param col: The column of the cell
+        :return: An int that is the packed code of the faller cell there, or of the board cell if the faller does not
+        cover it
+        """
+        faller = self._faller
+        i = faller.get_row() - row
+        if faller.active and col == faller.get_col() and 0 <= i < 3:
+            return game._cell_code(faller.contents[i], game._faller_state_code(faller.state))
+        return self._get_code(row, col)
+
+    def _board_cells(self) -> bytearray:
+        """
+        Writes the stacks out as a full board, without the faller
+        :return: A bytearray of the cell codes, indexed by row * columns + col
+        """
+        columns = self._columns
+        cells = bytearray(self._rows * columns)
+        for col, stack in enumerate(self._stacks):
+            index = self._index(0, col)
+            for code in stack:
+                cells[index] = code
+                index -= columns
+        return cells
+
+    def _faller_cells(self) -> ((int, int), ...):
+        """
+        Gets the cells that the faller covers on the board, leaving out the ones above the top of the board
+        :return: A tuple of (board index, packed code) pairs from the bottom of the faller up, empty if there is no
+        active faller
+        """
+        faller = self._faller
+        if not faller.active:
+            return ()
+        state = game._faller_state_code(faller.state)
+        index = faller.get_row() * self._columns + faller.get_col()
+        cells = []
+        for i in range(min(3, faller.get_row() + 1)):
+            cells.append((index, game._cell_code(faller.contents[i], state)))
+            index -= self._columns
+        return tuple(cells)
+
+    def _replace_stack(self, col: int, stack: [int], start: int) -> None:
+        """
+        Replaces the stack of the given column and records the cells that changed
+        :param col: The column of the stack
+        :param stack: The new stack of the column
+        :param start: The lowest height where the new stack can differ from the old one
+        """
+        oldStack = self._stacks[col]
+        self._stacks[col] = stack
+        for height in range(start, max(len(oldStack), len(stack))):
+            index = self._index(height, col)
+            # A jewel that appeared or moved can be part of a new match
+            if height < len(stack):
+                self._dirtyCells.add(index)
+            if self._changedCells is not None:
+                self._changedCells.add(index)
+
+    def _is_settled(self) -> bool:
+        """
+        Checks if the board is settled: there are no matched cells to clear and no cells that need matching, so a
+        matching pass would change nothing
+        :return: True if the board is settled. False otherwise
+        """
+        return not self._matchedColumns and not self._dirtyCells
+
+    def _matching(self) -> None:
+        """
+        Clears the jewels that were marked as matched, which makes the jewels above them fall at once, and then marks
+        the jewels that match along a row, a column or a diagonal through any jewel that appeared or moved
+        """
+        self._clear_matched()
+
+        self._matchedCells = []
+        dirtyCells = self._dirtyCells
+        self._dirtyCells = set()
+        for index in dirtyCells:
+            self._match_through(index)
+
+        if self._matchedCells and self._events is not None:
+            self._events.append((game.EVENT_MATCHED, tuple(self._matchedCells)))
+
+    def _clear_matched(self) -> None:
+        """
+        Removes the matched jewels from their stacks. The jewels above them fall into place in the same step.
+        """
+        cleared = []
+        moves = []
+        for col in sorted(self._matchedColumns):
+            stack = self._stacks[col]
+            remaining = []
+            start = None
+            for height, code in enumerate(stack):
+                if code & _STATE_MASK == _MATCHED_CODE:
+                    cleared.append(self._index(height, col))
+                    if start is None:
+                        start = height
+                else:
+                    if start is not None:
+                        moves.append((self._index(height, col), self._index(len(remaining), col)))
+                    remaining.append(code)
+            # A matched jewel can have been covered by a faller that froze since it was marked
+            if start is not None:
+                self._replace_stack(col, remaining, start)
+        self._matchedColumns = set()
+
+        if self._events is not None:
+            if cleared:
+                self._events.append((game.EVENT_CLEARED, tuple(cleared)))
+            if moves:
+                self._events.append((game.EVENT_GRAVITY, tuple(moves)))
+
+    def _match_through(self, index: int) -> None:
+        """
+        Marks every run of 3 or more of the same jewel that goes through the cell at the given board index
+        :param index: The index of the cell on the board (row * columns + col)
+        """
+        rows = self._rows
+        columns = self._columns
+        stacks = self._stacks
+        row, col = divmod(index, columns)
+        code = self._get_code(row, col)
+        if code == _EMPTY_CELL_CODE:
+            return
+        jewel = code >> _STATE_BITS
+
+        for rowStep, colStep in _MATCH_DIRECTIONS:
+            # Walk back to the first cell of the run, then forward to the end of it
+            first = 0
+            while True:
+                r = row - (first + 1) * rowStep
+                c = col - (first + 1) * colStep
+                if r < 0 or r >= rows or c < 0 or c >= columns:
+                    break
+                stack = stacks[c]
+                height = rows - 1 - r
+                if height >= len(stack) or stack[height] >> _STATE_BITS != jewel:
+                    break
+                first += 1
+            last = 0
+            while True:
+                r = row + (last + 1) * rowStep
+                c = col + (last + 1) * colStep
+                if r < 0 or r >= rows or c < 0 or c >= columns:
+                    break
+                stack = stacks[c]
+                height = rows - 1 - r
+                if height >= len(stack) or stack[height] >> _STATE_BITS != jewel:
+                    break
+                last += 1
+
+            if first + last + 1 >= _MATCH_LENGTH:
+                for step in range(-first, last + 1):
+                    self._mark_matched(row + step * rowStep, col + step * colStep)
+
+    def _mark_matched(self, row: int, col: int) -> None:
+        """
+        Marks the jewel in the cell identified by the given row and column as matched
+        :param row: The row of the cell
+        :param col: The column of the cell
+        """
+        stack = self._stacks[col]
+        height = self._rows - 1 - row
+        if stack[height] & _STATE_MASK == _MATCHED_CODE:
+            return
+        stack[height] = (stack[height] & ~_STATE_MASK) | _MATCHED_CODE
+        self._matchedColumns.add(col)
+        index = row * self._columns + col
+        self._matchedCells.append(index)
+        if self._changedCells is not None:
+            self._changedCells.add(index)
+
+    def _tick_faller(self) -> bool:
+        """
+        Moves the faller down one row, or freezes it if it was stopped for a whole tick and is still on solid ground
+        :return: True if the faller froze with part of it above the top of the game board. False otherwise
+        """
+        faller = self._faller
+        if not faller.active:
+            return False
+
+        # If the faller had stopped last tick then check if it is still on solid ground, and if it is then freeze it
+        if faller.state == game._FALLER_STOPPED:
+            self._update_faller_state()
+            if faller.state == game._FALLER_STOPPED:
+                self._freeze_faller()
+                if self._events is not None:
+                    self._events.append((game.EVENT_FROZEN, faller.get_row(), faller.get_col()))
+                # The game ends if part of this faller was frozen above the top of the game board
+                return faller.get_row() - 2 < 0
+
+        # If we get here then the faller isnt on solid ground for sure so move it down
+        if not self._is_solid(faller.get_row() + 1, faller.get_col()):
+            faller.set_row(faller.get_row() + 1)
+        self._update_faller_state()
+        if self._events is not None:
+            self._events.append((game.EVENT_FALLER_MOVED, faller.get_row(), faller.get_col()))
+        return False
+
+    def _freeze_faller(self) -> None:
+        """
+        Writes the blocks of the faller that are in play onto the top of the stack of its column
+        """
+        faller = self._faller
+        col = faller.get_col()
+        stack = list(self._stacks[col])
+        bottom = self._rows - 1 - faller.get_row()
+        for i in range(min(3, faller.get_row() + 1)):
+            code = game._cell_code(faller.contents[i], _OCCUPIED_CODE)
+            # A faller stopped on a jewel is right on top of its stack, unless it was spawned into a full column
+            if bottom + i < len(stack):
+                stack[bottom + i] = code
+            else:
+                stack.append(code)
+        faller.active = False
+        self._replace_stack(col, stack, bottom)
+
+    def _landing_row(self) -> int:
+        """
+        Finds the row that the bottom of the faller will come to rest on if nothing else on the board moves
+        :return: The row the bottom of the faller will land on
+        """
+        col = self._faller.get_col()
+        row = self._faller.get_row()
+        # Nothing between the faller and the top of its stack is solid
+        top = self._rows - len(self._stacks[col])
+        if row < top and (top == self._rows or self._is_solid(top, col)):
+            return top - 1
+        while not self._is_solid(row + 1, col):
+            row += 1
+        return row
+
+    def _update_faller_state(self) -> None:
+        """
+        Updates the state of the faller according to its current conditions.
+        If the faller has ground below it then the state is set to FALLER_STOPPED.
+        Otherwise the state is set to FALLER_MOVING.
+        """
+        if self._is_solid(self._faller.get_row() + 1, self._faller.get_col()):
+            self._faller.state = game._FALLER_STOPPED
+        else:
+            self._faller.state = game._FALLER_MOVING
+
+    def _is_solid(self, row: int, col: int) -> bool:
+        """
+        Checks if the the cell of the given row and column is solid (a solid block or the bottom row)
+        :param row: The row of the cell to check
+        :param col: The column of the cell the check
+        :return: True if the given cell is solid. False otherwise
+        """
+        if row >= self._rows:
+            return True
+        return self._get_code(row, col) & _STATE_MASK == _OCCUPIED_CODE
+
+    def _flush_changed_cells(self) -> None:
+        """
+        Adds a CELLS event for the cells that changed since the last one, if any did
+        """
+        # The cells the faller covered at the last CELLS event and the ones it covers now have changed if it did
+        fallerCells = self._faller_cells()
+        if fallerCells != self._flushedFaller:
+            self._changedCells.update(index for index, code in self._flushedFaller)
+            self._changedCells.update(index for index, code in fallerCells)
+            self._flushedFaller = fallerCells
+        if self._changedCells:
+            fallerCodes = dict(fallerCells)
+            columns = self._columns
+            self._events.append((game.EVENT_CELLS, tuple(
+                (index, fallerCodes[index] if index in fallerCodes else self._get_code(index // columns, index % columns))
+                for index in sorted(self._changedCells))))
+            self._changedCells.clear()
+
+    def _end_ticks(self, ticks: int) -> None:
+        """
+        Adds the events that close off the given number of ticks: the cells that changed in them and then the TICK event
+        :param ticks: The number of ticks that ended
+        """
+        self._flush_changed_cells()
+        self._events.append((game.EVENT_TICK, ticks))
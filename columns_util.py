@@ -0,0 +1,19 @@
+def parse_size(text: str) -> (int, int):
+    """
+    Parses a board size written as ROWSxCOLUMNS, as the command line tools take it
+    :param text: The text of the size
+    :return: A tuple of the rows and columns
+    """
+    rows, columns = text.lower().split('x')
+    return int(rows), int(columns)
+
+
+def percentile(sortedValues: [float], fraction: float) -> float:
+    """
+    Gets a percentile of a sorted list by the nearest rank
+    :param sortedValues: The values, sorted from low to high
+    :param fraction: The percentile as a fraction (0.0 - 1.0)
+    :return: The value at that percentile
+    """
+    rank = min(len(sortedValues) - 1, max(0, int(round(fraction * len(sortedValues))) - 1))
+    return sortedValues[rank]